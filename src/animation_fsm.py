@@ -0,0 +1,199 @@
+"""
+动画状态机模块
+每个动作的行为由声明式的 ActionSpec 描述（循环方式、循环次数、结束后的下一个状态、
+能否被打断、优先级、过渡动作），加载动作时编译成 (当前动作, 目标动作) -> 决策 的转移表，
+切换动作只需一次查表。新增行为只需在动作目录中放一个 action.json，无需改代码。
+
+不能被打断的动作收到的请求会排队，连同过渡动作一起在循环结束时于动画帧定时器中切换，
+不需要额外的定时器。
+
+action.json 示例（未填写的项使用默认值）：
+    {"loop": "once", "loops": 1, "next": "standby", "interruptible": false,
+     "priority": 1, "transitions": {"standby": "wake"}}
+"""
+
+import json
+import os
+from collections import deque
+from dataclasses import dataclass, field, fields
+from typing import Callable, Dict, Optional, Tuple
+
+from .logger import get_logger
+
+logger = get_logger(__name__)
+
+SPEC_FILE = "action.json"
+
+LOOP_REPEAT = "repeat"   # 循环播放，直到被切换
+LOOP_ONCE = "once"       # 播放 loops 次后进入 next（未指定时回到上一个常驻动作）
+
+# 转移决策
+SWITCH = "switch"        # 立即切换（可能先播放过渡动作）
+QUEUE = "queue"          # 当前动作不可打断，循环结束后再切换
+IGNORE = "ignore"        # 忽略（如重复请求不允许重新开始的动作）
+
+MAX_QUEUED = 4
+
+
+@dataclass
+class ActionSpec:
+    """单个动作的行为描述"""
+    loop: str = LOOP_ONCE
+    loops: int = 2                 # once 动作的播放次数
+    next: Optional[str] = None     # once 动作结束后的状态，None 表示回到常驻动作
+    interruptible: bool = True     # False 时优先级不高于自身的请求要排队
+    priority: int = 0
+    resting: Optional[bool] = None  # 是否作为常驻动作（一次性动作结束后回到这里），默认 repeat 为 True
+    restart: bool = True           # 重复请求同一动作时是否从头播放
+    transitions: Dict[str, str] = field(default_factory=dict)  # 目标动作 -> 先播放的过渡动作
+
+    def __post_init__(self):
+        if self.loop not in (LOOP_REPEAT, LOOP_ONCE):
+            raise ValueError(f"未知的循环方式: {self.loop}")
+        self.loops = max(1, int(self.loops))
+        if self.resting is None:
+            self.resting = self.loop == LOOP_REPEAT
+
+
+# 内置动作的默认行为（与原先的 REPEAT_ACTIONS / ONCE_ACTIONS 一致）
+DEFAULT_SPECS = {
+    "standby": {"loop": LOOP_REPEAT},
+    "sleep": {"loop": LOOP_REPEAT},
+    "discomfort": {"loop": LOOP_REPEAT},
+    "left": {"loop": LOOP_REPEAT},
+    "right": {"loop": LOOP_REPEAT},
+    # 被拖动时的临时动作：不作为常驻动作，拖动中重复触发不重新开始
+    "mention": {"loop": LOOP_REPEAT, "resting": False, "restart": False},
+    "eat": {"loop": LOOP_ONCE},
+    "love": {"loop": LOOP_ONCE},
+}
+
+
+def load_action_spec(name: str, action_path: str = None) -> ActionSpec:
+    """内置默认值 + 动作目录中的 action.json；其他动作（含表情）默认为一次性动作"""
+    options = dict(DEFAULT_SPECS.get(name, {}))
+    if action_path:
+        spec_path = os.path.join(action_path, SPEC_FILE)
+        if os.path.exists(spec_path):
+            try:
+                with open(spec_path, 'r', encoding='utf-8') as f:
+                    options.update(json.load(f))
+            except (OSError, ValueError) as e:
+                logger.warning("读取动作描述失败 %s: %s", spec_path, e)
+    known = {f.name for f in fields(ActionSpec)}
+    unknown = set(options) - known
+    if unknown:
+        logger.warning("动作 '%s' 的描述包含未知字段: %s", name, ", ".join(sorted(unknown)))
+    try:
+        return ActionSpec(**{k: v for k, v in options.items() if k in known})
+    except (TypeError, ValueError) as e:
+        logger.warning("动作 '%s' 的描述无效，使用默认值: %s", name, e)
+        return ActionSpec(**DEFAULT_SPECS.get(name, {}))
+
+
+class AnimationStateMachine:
+    """表驱动的动画状态机（不含定时器，由动画帧定时器调用 advance 推进）"""
+
+    def __init__(self, entered: Callable[[str], None] = None, initial: str = "standby"):
+        # 进入新动作时的回调（更新行走方向、发布状态等）
+        self.entered = entered or (lambda action: None)
+        self.specs: Dict[str, ActionSpec] = {}
+        self._frame_counts: Dict[str, int] = {}
+        # (当前动作, 目标动作) -> (决策, 依次播放的动作)
+        self._table: Dict[Tuple[str, str], Tuple[str, Tuple[str, ...]]] = {}
+        # 动作 -> 一次性动作结束后的目标（None 表示回到常驻动作）
+        self._finish: Dict[str, Optional[str]] = {}
+        self._queue = deque()
+
+        self.current = initial
+        self.resting = initial      # 一次性动作结束后回到的常驻动作
+        self.frame = 0
+        self.loop_count = 0
+
+    # ===== 编译 =====
+
+    def add_action(self, name: str, spec: ActionSpec, frame_count: int):
+        """注册（或更新）动作，只重新计算与它有关的转移：它所在的行与列，以及以它为过渡动作的转移"""
+        self.specs[name] = spec
+        self._frame_counts[name] = frame_count
+        table = self._table
+        for other, other_spec in self.specs.items():
+            table[(name, other)] = self._decide(name, spec, other, other_spec)
+            table[(other, name)] = self._decide(other, other_spec, name, spec)
+            for target, via in other_spec.transitions.items():
+                if via == name and target in self.specs:
+                    table[(other, target)] = self._decide(other, other_spec, target, self.specs[target])
+            if other_spec.next == name:
+                self._finish[other] = name
+        self._finish[name] = spec.next if spec.next in self.specs else None
+
+    def compile(self):
+        """重新计算所有动作对的转移决策（add_action 已增量维护，无需在每次注册后调用）"""
+        table = {}
+        for source, spec in self.specs.items():
+            for target, target_spec in self.specs.items():
+                table[(source, target)] = self._decide(source, spec, target, target_spec)
+        self._table = table
+        self._finish = {
+            name: (spec.next if spec.next in self.specs else None)
+            for name, spec in self.specs.items()
+        }
+
+    def _decide(self, source: str, spec: ActionSpec, target: str, target_spec: ActionSpec):
+        if source == target and not spec.restart:
+            return IGNORE, ()
+        via = spec.transitions.get(target)
+        steps = (via, target) if via in self.specs and via != target else (target,)
+        if not spec.interruptible and target_spec.priority <= spec.priority:
+            return QUEUE, steps
+        return SWITCH, steps
+
+    # ===== 运行 =====
+
+    def request(self, action: str) -> bool:
+        """请求切换动作，返回是否立即切换"""
+        if action not in self.specs:
+            return False
+        decision, steps = self._table.get((self.current, action), (SWITCH, (action,)))
+        if decision == IGNORE:
+            return False
+        if decision == QUEUE:
+            if len(self._queue) + len(steps) <= MAX_QUEUED and (not self._queue or self._queue[-1] != action):
+                self._queue.extend(steps)
+            return False
+        self._queue.clear()
+        self._queue.extend(steps[1:])
+        self._enter(steps[0])
+        return True
+
+    def advance(self) -> bool:
+        """推进一帧，返回是否需要重新显示"""
+        count = self._frame_counts.get(self.current, 0)
+        if not count:
+            return False
+        if self.frame + 1 < count:
+            self.frame += 1
+            return True
+
+        # 一轮播放结束
+        self.loop_count += 1
+        spec = self.specs.get(self.current)
+        once = spec is not None and spec.loop == LOOP_ONCE
+        if once and self.loop_count < spec.loops:
+            self.frame = 0
+        elif self._queue:
+            self._enter(self._queue.popleft())
+        elif once:
+            self._enter(self._finish.get(self.current) or self.resting)
+        else:
+            self.frame = 0
+        return True
+
+    def _enter(self, action: str):
+        self.current = action
+        self.frame = 0
+        self.loop_count = 0
+        spec = self.specs.get(action)
+        if spec is not None and spec.resting:
+            self.resting = action
+        self.entered(action)
@@ -0,0 +1,324 @@
+#!/usr/bin/env python3
+"""
+素材预处理模块
+对动作帧与表情做一次性预处理，减少内存、窗口尺寸与绘制时的格式转换：
+- 裁掉透明边框：每个动作的所有帧取 alpha 包围盒的并集统一裁剪，
+  并记录裁剪区域在原画布中的偏移（anchor），切换动作时据此保持角色位置不动；
+- 去重：按裁剪后的像素内容哈希，相同的帧（跨动作也一样）共用同一个 QImage；
+- 统一转换为预乘 alpha 的 ARGB32，绘制时无需再转换。
+
+包围盒计算使用 NumPy 对原始图像缓冲区做向量化运算；未安装 NumPy 时跳过裁剪（记录一次日志），只做去重与格式转换。
+加载时若目录中存在批处理生成的 preprocessed.json，则直接使用其中的裁剪结果。
+加载时按 padding 在包围盒外保留边距（宠物阴影的范围，见 frame_store.trim_padding），不超出原画布；
+批处理的清单按包围盒紧密裁剪，边距在加载时补上。
+
+批处理用法：
+    python -m src.asset_preprocess assets/ assets_preprocessed/
+"""
+
+import hashlib
+import json
+import os
+import sys
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+from PyQt6.QtCore import QRect
+from PyQt6.QtGui import QImage
+
+from .logger import get_logger
+
+logger = get_logger(__name__)
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.gif')
+MANIFEST_NAME = "preprocessed.json"
+MANIFEST_VERSION = 1
+FRAME_FORMAT = QImage.Format.Format_ARGB32_Premultiplied
+# ARGB32 按 32 位整数存储，alpha 在小端机器上是每个像素的第 4 个字节
+ALPHA_BYTE = 3 if sys.byteorder == "little" else 0
+# 裁剪边距 (左, 上, 右, 下)，原图像素
+Padding = Tuple[int, int, int, int]
+NO_PADDING: Padding = (0, 0, 0, 0)
+
+_numpy_missing_logged = False
+
+
+@dataclass
+class ProcessedFrames:
+    """一组预处理后的帧（一个动作，或一张表情）"""
+    frames: List[QImage]        # 裁剪后的帧，相同内容的帧为同一对象
+    anchor: Tuple[int, int]     # 裁剪区域左上角在原画布中的位置
+    canvas: Tuple[int, int]     # 原画布尺寸
+    sources: List[str]          # 每帧对应的源文件
+
+
+def list_images(directory: str) -> List[str]:
+    return sorted(f for f in os.listdir(directory) if f.lower().endswith(IMAGE_EXTENSIONS))
+
+
+def load_image(path: str) -> QImage:
+    """读取图片并转换为预乘 ARGB32，失败时返回空 QImage"""
+    image = QImage(path)
+    if image.isNull():
+        return image
+    return image.convertToFormat(FRAME_FORMAT)
+
+
+def _image_bytes(image: QImage) -> bytes:
+    ptr = image.constBits()
+    ptr.setsize(image.sizeInBytes())
+    return bytes(ptr)
+
+
+def _alpha_array(image: QImage):
+    """alpha 通道的 (height, width) 视图（直接引用 QImage 的缓冲区，不复制）"""
+    import numpy as np
+    ptr = image.constBits()
+    ptr.setsize(image.sizeInBytes())
+    rows = np.frombuffer(ptr, dtype=np.uint8).reshape(image.height(), image.bytesPerLine())
+    return rows[:, ALPHA_BYTE:image.width() * 4:4]
+
+
+def alpha_bbox(images: List[QImage]) -> Optional[QRect]:
+    """所有帧非透明像素的包围盒并集；无法计算（缺少 NumPy）或全透明时返回 None"""
+    global _numpy_missing_logged
+    try:
+        import numpy as np
+    except ImportError:
+        if not _numpy_missing_logged:
+            _numpy_missing_logged = True
+            logger.info("未安装 NumPy，跳过透明边框裁剪")
+        return None
+    if not images:
+        return None
+    height = max(image.height() for image in images)
+    width = max(image.width() for image in images)
+    coverage = np.zeros((height, width), dtype=bool)
+    for image in images:
+        alpha = _alpha_array(image)
+        coverage[:alpha.shape[0], :alpha.shape[1]] |= alpha > 0
+    rows = np.flatnonzero(coverage.any(axis=1))
+    cols = np.flatnonzero(coverage.any(axis=0))
+    if rows.size == 0:
+        return None
+    return QRect(int(cols[0]), int(rows[0]), int(cols[-1] - cols[0] + 1), int(rows[-1] - rows[0] + 1))
+
+
+def pad_rect(rect: QRect, padding: Padding, canvas: Tuple[int, int]) -> QRect:
+    """在裁剪区域外保留边距，不超出原画布"""
+    left, top, right, bottom = padding
+    return rect.adjusted(-left, -top, right, bottom).intersected(QRect(0, 0, *canvas))
+
+
+def _pad_trimmed(images: List[QImage], anchor: Tuple[int, int], canvas: Tuple[int, int],
+                 padding: Padding) -> Tuple[List[QImage], Tuple[int, int]]:
+    """给清单中紧密裁剪的帧补上边距，返回新的帧与 anchor"""
+    if not any(padding):
+        return images, anchor
+    width = max(image.width() for image in images)
+    height = max(image.height() for image in images)
+    rect = pad_rect(QRect(anchor[0], anchor[1], width, height), padding, canvas)
+    if (rect.width(), rect.height()) == (width, height):
+        return images, anchor
+    local = rect.translated(-anchor[0], -anchor[1])
+    return [image.copy(local) for image in images], (rect.x(), rect.y())
+
+
+class FrameDeduplicator:
+    """按像素内容去重，跨动作共享相同的帧"""
+
+    def __init__(self):
+        self._images: Dict[str, QImage] = {}
+        self.duplicates = 0
+
+    def intern(self, image: QImage) -> QImage:
+        digest = hashlib.blake2b(_image_bytes(image), digest_size=16)
+        digest.update(f"{image.width()}x{image.height()}".encode())
+        key = digest.hexdigest()
+        existing = self._images.get(key)
+        if existing is not None:
+            self.duplicates += 1
+            return existing
+        self._images[key] = image
+        return image
+
+    def __len__(self):
+        return len(self._images)
+
+
+def process_frames(paths: List[str], dedup: FrameDeduplicator = None,
+                   padding: Padding = NO_PADDING) -> Optional[ProcessedFrames]:
+    """读取一组帧，统一裁剪（保留 padding 边距）、转换格式并去重"""
+    images, sources = [], []
+    for path in paths:
+        image = load_image(path)
+        if image.isNull():
+            logger.warning("无法读取图片: %s", path)
+            continue
+        images.append(image)
+        sources.append(path)
+    if not images:
+        return None
+
+    canvas = (max(i.width() for i in images), max(i.height() for i in images))
+    bbox = alpha_bbox(images)
+    if bbox is not None:
+        bbox = pad_rect(bbox, padding, canvas)
+    if bbox is not None and (bbox.width(), bbox.height()) != canvas:
+        # 超出单帧范围的部分由 copy 以透明像素填充
+        images = [image.copy(bbox) for image in images]
+        anchor = (bbox.x(), bbox.y())
+    else:
+        anchor = (0, 0)
+    if dedup is not None:
+        images = [dedup.intern(image) for image in images]
+    return ProcessedFrames(images, anchor, canvas, sources)
+
+
+def load_action_dir(action_path: str, dedup: FrameDeduplicator = None,
+                    padding: Padding = NO_PADDING) -> Optional[ProcessedFrames]:
+    """加载一个动作目录：优先使用批处理清单，否则现场预处理"""
+    manifest = _read_manifest(os.path.join(action_path, MANIFEST_NAME))
+    if manifest is not None:
+        images, sources = [], []
+        for rel in manifest["frames"]:
+            path = os.path.normpath(os.path.join(action_path, rel))
+            image = load_image(path)
+            if image.isNull():
+                logger.warning("清单中的帧无法读取: %s", path)
+                continue
+            images.append(image)
+            sources.append(path)
+        if not images:
+            return None
+        canvas = tuple(manifest["canvas"])
+        images, anchor = _pad_trimmed(images, tuple(manifest["anchor"]), canvas, padding)
+        if dedup is not None:
+            images = [dedup.intern(image) for image in images]
+        return ProcessedFrames(images, anchor, canvas, sources)
+    return process_frames([os.path.join(action_path, f) for f in list_images(action_path)], dedup, padding)
+
+
+def load_expressions_dir(expr_path: str, dedup: FrameDeduplicator = None,
+                         padding: Padding = NO_PADDING) -> Dict[str, ProcessedFrames]:
+    """加载表情目录，返回 {表情名: 单帧结果}"""
+    manifest = _read_manifest(os.path.join(expr_path, MANIFEST_NAME))
+    result = {}
+    if manifest is not None:
+        for name, item in manifest["items"].items():
+            path = os.path.join(expr_path, item["file"])
+            image = load_image(path)
+            if image.isNull():
+                continue
+            canvas = tuple(item["canvas"])
+            images, anchor = _pad_trimmed([image], tuple(item["anchor"]), canvas, padding)
+            if dedup is not None:
+                images = [dedup.intern(image) for image in images]
+            result[name] = ProcessedFrames(images, anchor, canvas, [path])
+        return result
+    for expr_file in list_images(expr_path):
+        processed = process_frames([os.path.join(expr_path, expr_file)], dedup, padding)
+        if processed is not None:
+            result[os.path.splitext(expr_file)[0]] = processed
+    return result
+
+
+def _read_manifest(path: str) -> Optional[dict]:
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+    except (OSError, ValueError) as e:
+        logger.warning("读取预处理清单失败 %s: %s", path, e)
+        return None
+    if manifest.get("version") != MANIFEST_VERSION:
+        return None
+    return manifest
+
+
+# ===== 批处理 =====
+
+def _write_manifest(path: str, manifest: dict):
+    manifest = {"version": MANIFEST_VERSION, **manifest}
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+
+
+def preprocess_pack(src_root: str, dst_root: str) -> dict:
+    """预处理整个素材包（actions/* 与 expressions/*），输出裁剪后的帧与清单"""
+    dedup = FrameDeduplicator()
+    written: Dict[int, str] = {}  # id(QImage) -> 已写出的文件路径，跨动作复用
+    stats = {"frames": 0, "files": 0, "bytes_before": 0, "bytes_after": 0}
+
+    def write(image: QImage, path: str, owner_dir: str) -> str:
+        existing = written.get(id(image))
+        if existing is None:
+            if not image.save(path, "PNG"):
+                raise OSError(f"写入失败: {path}")
+            written[id(image)] = existing = path
+            stats["files"] += 1
+            stats["bytes_after"] += image.sizeInBytes()
+        return os.path.relpath(existing, owner_dir)
+
+    actions_src = os.path.join(src_root, "actions")
+    if os.path.isdir(actions_src):
+        for name in sorted(os.listdir(actions_src)):
+            action_src = os.path.join(actions_src, name)
+            if not os.path.isdir(action_src):
+                continue
+            processed = process_frames([os.path.join(action_src, f) for f in list_images(action_src)], dedup)
+            if processed is None:
+                continue
+            action_dst = os.path.join(dst_root, "actions", name)
+            os.makedirs(action_dst, exist_ok=True)
+            frames = [
+                write(image, os.path.join(action_dst, f"{index:03d}.png"), action_dst)
+                for index, image in enumerate(processed.frames)
+            ]
+            _write_manifest(os.path.join(action_dst, MANIFEST_NAME), {
+                "canvas": list(processed.canvas), "anchor": list(processed.anchor), "frames": frames
+            })
+            stats["frames"] += len(frames)
+            stats["bytes_before"] += len(frames) * processed.canvas[0] * processed.canvas[1] * 4
+            logger.info("动作 %s: %d 帧，画布 %dx%d -> %dx%d", name, len(frames), *processed.canvas,
+                        processed.frames[0].width(), processed.frames[0].height())
+
+    expr_src = os.path.join(src_root, "expressions")
+    if os.path.isdir(expr_src):
+        expr_dst = os.path.join(dst_root, "expressions")
+        os.makedirs(expr_dst, exist_ok=True)
+        items = {}
+        for name, processed in load_expressions_dir(expr_src, dedup).items():
+            file_name = write(processed.frames[0], os.path.join(expr_dst, f"{name}.png"), expr_dst)
+            items[name] = {"file": file_name, "canvas": list(processed.canvas), "anchor": list(processed.anchor)}
+            stats["frames"] += 1
+            stats["bytes_before"] += processed.canvas[0] * processed.canvas[1] * 4
+        _write_manifest(os.path.join(expr_dst, MANIFEST_NAME), {"items": items})
+
+    stats["duplicates"] = dedup.duplicates
+    return stats
+
+
+def main(argv: List[str] = None) -> int:
+    argv = sys.argv[1:] if argv is None else argv
+    if len(argv) != 2:
+        print("用法: python -m src.asset_preprocess <素材目录> <输出目录>")
+        return 2
+    src_root, dst_root = (os.path.abspath(p) for p in argv)
+    if src_root == dst_root:
+        print("输出目录不能与素材目录相同")
+        return 2
+    try:
+        import numpy  # noqa: F401
+    except ImportError:
+        print("未安装 NumPy，将跳过透明边框裁剪")
+    stats = preprocess_pack(src_root, dst_root)
+    saved = 1 - stats["bytes_after"] / stats["bytes_before"] if stats["bytes_before"] else 0
+    print(f"共 {stats['frames']} 帧，去重后 {stats['files']} 个文件（重复 {stats['duplicates']} 帧），"
+          f"解码后内存减少 {saved:.0%}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,59 @@
+"""
+自主思考调度模块
+根据 SensorHub 快照中的用户活跃度（空闲时间、锁屏）和系统负载调整 brain_timer 间隔：
+无人注视时指数退避，锁屏或高负载时暂停。事件驱动的即时触发由 trigger_rules 负责。
+"""
+
+from PyQt6.QtCore import QObject
+
+# 默认调度参数（可通过 config["brain_schedule"] 覆盖）
+DEFAULT_SCHEDULE = {
+    "away_seconds": 300,        # 空闲超过该时间视为无人注视
+    "max_interval": 3600,       # 退避后的最长间隔（秒）
+    "heavy_cpu": 85,            # CPU 超过该值时暂停思考
+    "defer_seconds": 60,        # 暂停时的重试间隔（秒）
+    "min_trigger_gap": 90       # 两次思考（含事件触发）的最短间隔（秒）
+}
+
+
+class BrainScheduler(QObject):
+    """基于传感器快照的自适应思考调度器"""
+
+    def __init__(self, config: dict, sensor_hub, parent=None):
+        super().__init__(parent)
+        self.sensor_hub = sensor_hub
+        self.settings = dict(DEFAULT_SCHEDULE)
+        self.settings.update(config.get('brain_schedule', {}))
+        self.backoff_level = 0
+
+    def update_config(self, config: dict):
+        self.settings = dict(DEFAULT_SCHEDULE)
+        self.settings.update(config.get('brain_schedule', {}))
+
+    @property
+    def user_away(self) -> bool:
+        snap = self.sensor_hub.snapshot
+        return snap['locked'] or snap['idle_seconds'] >= self.settings['away_seconds']
+
+    @property
+    def heavy_load(self) -> bool:
+        return self.sensor_hub.snapshot['cpu_usage'] >= self.settings['heavy_cpu']
+
+    def allows_event(self, event) -> bool:
+        """触发规则的闸门：用户不在或高负载时不因事件说话"""
+        return not self.user_away and not self.heavy_load
+
+    def next_interval_ms(self, base_ms: int) -> int:
+        """根据用户是否在场计算下一次思考间隔：无人注视时指数退避"""
+        if self.user_away:
+            self.backoff_level = min(self.backoff_level + 1, 6)
+        else:
+            self.backoff_level = 0
+        interval = base_ms * (2 ** self.backoff_level)
+        return int(min(interval, max(base_ms, self.settings['max_interval'] * 1000)))
+
+    def defer_ms(self) -> int:
+        """思考到期时若应暂停（锁屏或高负载），返回推迟的毫秒数，否则返回 0"""
+        if self.sensor_hub.snapshot['locked'] or self.heavy_load:
+            return int(self.settings['defer_seconds'] * 1000)
+        return 0
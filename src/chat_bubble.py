@@ -1,17 +1,114 @@
 """
 聊天气泡组件模块
-支持堆叠显示两个气泡（当前回复和上一次回复）
+支持堆叠显示两个气泡（当前回复和上一次回复）；
+消息先进入带优先级、去重与合并的队列，每条至少显示一段时间，气泡位置更新每帧最多一次。
 """
 
+import time
+from dataclasses import dataclass, field
+from typing import Callable, List, Optional
+
 from PyQt6.QtWidgets import (
     QWidget, QLabel, QVBoxLayout, QHBoxLayout,
-    QGraphicsDropShadowEffect
+    QGraphicsDropShadowEffect, QGraphicsOpacityEffect
 )
-from PyQt6.QtCore import Qt, QTimer, QPropertyAnimation, QEasingCurve, pyqtProperty, QPoint
-from PyQt6.QtGui import QColor
+from PyQt6.QtCore import Qt, QTimer, QObject, QPropertyAnimation, QEasingCurve, pyqtProperty, QPoint, QRect
+from PyQt6.QtGui import QColor, QGuiApplication
 
 from .styles import COLORS
 
+# 消息优先级
+PRIORITY_LOW = 0      # 提示类（设置已保存、欢迎语）
+PRIORITY_NORMAL = 1   # 宠物的独白与回复
+PRIORITY_HIGH = 2     # 需要用户处理的提示（如缺少 API Key）
+
+# 气泡位置更新的帧预算（毫秒）
+FRAME_MS = 16
+
+
+@dataclass
+class BubbleMessage:
+    text: str
+    duration: int = 5000
+    priority: int = PRIORITY_NORMAL
+    key: Optional[str] = None
+    enqueued: float = field(default_factory=time.monotonic)
+
+
+class BubbleQueue(QObject):
+    """
+    气泡消息队列：
+    - 按优先级出队，同优先级先进先出；
+    - 与正在显示或已在队列中的相同文本去重；
+    - 带 key 的消息合并，排队中的同 key 消息直接替换为最新内容；
+    - 每条消息至少显示 min_display_ms 后才切换到下一条。
+    """
+
+    def __init__(self, show: Callable[[str, int], None], min_display_ms: int = 1500,
+                 max_pending: int = 8, parent=None):
+        super().__init__(parent)
+        self._show = show
+        self.min_display_ms = min_display_ms
+        self.max_pending = max_pending
+        self._pending: List[BubbleMessage] = []
+        self._current: Optional[BubbleMessage] = None
+        self._shown_at = 0.0
+        self._timer = QTimer(self)
+        self._timer.setSingleShot(True)
+        self._timer.timeout.connect(self._flush)
+
+    def push(self, text: str, duration: int = 5000, priority: int = PRIORITY_NORMAL, key: str = None):
+        if not text:
+            return
+        # 去重：与正在显示（未过期）或排队中的消息文本相同时丢弃
+        if self._current is not None and self._current.text == text \
+                and (time.monotonic() - self._shown_at) * 1000 < self._current.duration:
+            return
+        if any(m.text == text for m in self._pending):
+            return
+
+        # 合并：同 key 的排队消息替换为最新内容，保留排队位置
+        if key is not None:
+            for message in self._pending:
+                if message.key == key:
+                    message.text = text
+                    message.duration = duration
+                    message.priority = max(message.priority, priority)
+                    self._pending.sort(key=lambda m: -m.priority)
+                    self._schedule()
+                    return
+
+        message = BubbleMessage(text, duration, priority, key)
+        # 稳定插入：排在所有优先级不低于它的消息之后
+        index = len(self._pending)
+        while index > 0 and self._pending[index - 1].priority < priority:
+            index -= 1
+        self._pending.insert(index, message)
+        # 队列过长时丢弃优先级最低、最早的消息
+        while len(self._pending) > self.max_pending:
+            lowest = min(m.priority for m in self._pending)
+            self._pending.remove(next(m for m in self._pending if m.priority == lowest))
+        self._schedule()
+
+    def clear(self):
+        self._pending.clear()
+        self._timer.stop()
+
+    def _schedule(self):
+        if not self._pending or self._timer.isActive():
+            return
+        elapsed = (time.monotonic() - self._shown_at) * 1000
+        remaining = 0 if self._current is None else max(0, self.min_display_ms - elapsed)
+        self._timer.start(int(remaining))
+
+    def _flush(self):
+        if not self._pending:
+            return
+        self._current = self._pending.pop(0)
+        self._shown_at = time.monotonic()
+        self._show(self._current.text, self._current.duration)
+        self._schedule()
+
 
 class SingleBubble(QWidget):
     """单个聊天气泡"""
@@ -82,7 +179,15 @@ class SingleBubble(QWidget):
     
     def set_opacity(self, value):
         self._opacity = value
-        self.setWindowOpacity(value)
+        if self.isWindow():
+            self.setWindowOpacity(value)
+        else:
+            # 覆盖层模式下气泡是子控件，窗口透明度不可用
+            effect = self.graphicsEffect()
+            if effect is None:
+                effect = QGraphicsOpacityEffect(self)
+                self.setGraphicsEffect(effect)
+            effect.setOpacity(value)
     
     opacity = pyqtProperty(float, get_opacity, set_opacity)
         
@@ -98,8 +203,7 @@ class SingleBubble(QWidget):
         self.setFixedSize(self.sizeHint())
         
         # 重置透明度
-        self._opacity = 1.0
-        self.setWindowOpacity(1.0)
+        self.set_opacity(1.0)
         
         # 显示气泡
         self.show()
@@ -134,7 +238,7 @@ class SingleBubble(QWidget):
 class ChatBubbleManager(QWidget):
     """聊天气泡管理器 - 支持堆叠两个气泡"""
     
-    def __init__(self, parent=None):
+    def __init__(self, parent=None, surface=None):
         super().__init__(parent)
         self.setAttribute(Qt.WidgetAttribute.WA_TranslucentBackground)
         self.setWindowFlags(
@@ -143,20 +247,23 @@ class ChatBubbleManager(QWidget):
             Qt.WindowType.Tool
         )
         
+        # 覆盖层模式下气泡坐标相对覆盖层
+        self.surface = surface
+        
         # 两个气泡：当前和上一个
         self.current_bubble = SingleBubble()
-        self.current_bubble.setWindowFlags(
-            Qt.WindowType.FramelessWindowHint |
-            Qt.WindowType.WindowStaysOnTopHint |
-            Qt.WindowType.Tool
-        )
-        
         self.previous_bubble = SingleBubble()
-        self.previous_bubble.setWindowFlags(
-            Qt.WindowType.FramelessWindowHint |
-            Qt.WindowType.WindowStaysOnTopHint |
-            Qt.WindowType.Tool
-        )
+        for bubble in (self.current_bubble, self.previous_bubble):
+            if surface is not None:
+                # 覆盖层模式：气泡是覆盖层的子控件，坐标相对覆盖层
+                surface.attach(bubble)
+                bubble.hide()
+            else:
+                bubble.setWindowFlags(
+                    Qt.WindowType.FramelessWindowHint |
+                    Qt.WindowType.WindowStaysOnTopHint |
+                    Qt.WindowType.Tool
+                )
         # 上一个气泡使用稍微淡一点的样式
         self.previous_bubble.bubble_container.setStyleSheet(f"""
             QWidget#BubbleContainer {{
@@ -178,6 +285,19 @@ class ChatBubbleManager(QWidget):
         self.pet_pos = QPoint(0, 0)
         self.pet_size = 100
         
+        # 消息队列：突发消息按优先级排队、去重合并，不再每条都立即切换气泡
+        self.queue = BubbleQueue(self.show_message, parent=self)
+        
+        # 位置更新按帧合并：一帧内多次移动只重新布局一次
+        self._last_layout = 0.0
+        self._layout_timer = QTimer(self)
+        self._layout_timer.setSingleShot(True)
+        self._layout_timer.timeout.connect(self._update_positions)
+        
+    def enqueue(self, text: str, duration: int = 5000, priority: int = PRIORITY_NORMAL, key: str = None):
+        """把消息放入队列（推荐入口）"""
+        self.queue.push(text, duration, priority, key)
+        
     def show_message(self, text: str, duration: int = 5000):
         """显示新消息"""
         # 如果当前气泡有内容，移动到上一个
@@ -186,63 +306,89 @@ class ChatBubbleManager(QWidget):
             if current_text:
                 self.previous_bubble.stop_timers()
                 self.previous_bubble.show_message(current_text, duration + 2000)
-                self._update_positions()
         
         # 显示新消息
         self.current_bubble.stop_timers()
         self.current_bubble.show_message(text, duration)
         self._update_positions()
     
+    def _request_layout(self):
+        """请求重新布局：距上次布局已满一帧则立即执行，否则合并到下一帧"""
+        if self._layout_timer.isActive():
+            return
+        elapsed = (time.monotonic() - self._last_layout) * 1000
+        if elapsed >= FRAME_MS:
+            self._update_positions()
+        else:
+            self._layout_timer.start(int(FRAME_MS - elapsed))
+    
     def _update_positions(self):
         """更新气泡位置 - 出现在宠物左边"""
+        self._layout_timer.stop()
+        self._last_layout = time.monotonic()
+        if not self.current_bubble.isVisible() and not self.previous_bubble.isVisible():
+            return
         # 计算当前气泡位置 (左侧)
         # 预留一些间距
         margin = 15
         current_x = self.pet_pos.x() - self.current_bubble.width() - margin
         current_y = self.pet_pos.y() + (self.pet_size // 4)  # 稍微偏上一点
         
-        # 屏幕边界检查
-        screen = self.current_bubble.screen()
-        if screen:
-            screen_geo = screen.geometry()
+        # 屏幕边界检查（宠物所在屏幕，与气泡使用同一坐标系）
+        bounds = self._screen_bounds()
+        if bounds is not None:
+            right = bounds.x() + bounds.width()
+            bottom = bounds.y() + bounds.height()
             
             # 如果左侧放不下，则尝试放在右侧
-            if current_x < 10:
+            if current_x < bounds.x() + 10:
                 current_x = self.pet_pos.x() + self.pet_size + margin
             
             # 确保不超出右边界
-            if current_x + self.current_bubble.width() > screen_geo.width():
-                current_x = screen_geo.width() - self.current_bubble.width() - 10
+            if current_x + self.current_bubble.width() > right:
+                current_x = right - self.current_bubble.width() - 10
             
             # 垂直方向检查
-            if current_y + self.current_bubble.height() > screen_geo.height():
-                current_y = screen_geo.height() - self.current_bubble.height() - 10
-            current_y = max(10, current_y)
+            if current_y + self.current_bubble.height() > bottom:
+                current_y = bottom - self.current_bubble.height() - 10
+            current_y = max(bounds.y() + 10, current_y)
         
-        self.current_bubble.move(current_x, current_y)
+        if self.current_bubble.pos() != QPoint(current_x, current_y):
+            self.current_bubble.move(current_x, current_y)
         
         # 上一个气泡在当前气泡上方
         if self.previous_bubble.isVisible():
             prev_x = current_x
             prev_y = current_y - self.previous_bubble.height() - 8
             
-            if screen:
-                if prev_y < 10:
+            if bounds is not None:
+                if prev_y < bounds.y() + 10:
                      # 如果上方放不下，尝试放在下方？或者直接不显示？
                      # 这里简单处理，保持在上方但限制位置
-                     prev_y = 10
+                     prev_y = bounds.y() + 10
             
-            self.previous_bubble.move(prev_x, prev_y)
+            if self.previous_bubble.pos() != QPoint(prev_x, prev_y):
+                self.previous_bubble.move(prev_x, prev_y)
 
     
+    def _screen_bounds(self) -> Optional[QRect]:
+        """宠物所在屏幕在 move() 坐标系中的矩形（覆盖层模式下相对覆盖层，同 PetWidget._from_global）"""
+        origin = self.surface.map_from_global(QPoint(0, 0)) if self.surface is not None else QPoint(0, 0)
+        pet_center = self.pet_pos + QPoint(self.pet_size // 2, 0) - origin  # 全局坐标
+        screen = QGuiApplication.screenAt(pet_center) or self.current_bubble.screen()
+        if screen is None:
+            return None
+        return screen.geometry().translated(origin)
+    
     def position_near_pet(self, pet_pos: QPoint, pet_size: int):
         """设置宠物位置并更新气泡位置"""
         self.pet_pos = pet_pos
         self.pet_size = pet_size
-        self._update_positions()
+        self._request_layout()
     
     def close(self):
         """关闭所有气泡"""
+        self.queue.clear()
         self.current_bubble.close()
         self.previous_bubble.close()
         super().close()
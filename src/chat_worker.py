@@ -5,21 +5,59 @@
 """
 
 import json
+import threading
+import time
 import requests
 from PyQt6.QtCore import QThread, pyqtSignal
 
 
 from .tools import tool_manager
+from . import structured_output
+from .usage_ledger import usage_ledger, extract_usage
+from .tracing import tracer
+from .metrics import metrics, LLM_TURN_SECONDS, LLM_HTTP_SECONDS, LLM_TOKENS
+
+# requests.Session 不是线程安全的：每个线程使用自己的会话（threading.local），
+# 一轮对话结束后归还到空闲列表，下一轮的工作线程接着用，复用其中到供应商的连接
+_thread_session = threading.local()
+_idle_sessions = []
+_session_lock = threading.Lock()
+
+
+def _http_session() -> requests.Session:
+    """当前线程的 HTTP 会话（同一时刻只属于一个线程）"""
+    session = getattr(_thread_session, "session", None)
+    if session is None:
+        with _session_lock:
+            session = _idle_sessions.pop() if _idle_sessions else requests.Session()
+        _thread_session.session = session
+    return session
+
+
+def _release_http_session():
+    """当前线程不再发请求：把会话归还给之后的工作线程"""
+    session = getattr(_thread_session, "session", None)
+    if session is not None:
+        _thread_session.session = None
+        with _session_lock:
+            _idle_sessions.append(session)
+
 
 class ChatWorker(QThread):
     """聊天工作线程，异步处理 API 请求，并在必要时执行工具调用"""
     
     # 信号定义
-    response_received = pyqtSignal(str)  # 成功接收响应
+    response_received = pyqtSignal(str)  # 成功接收响应（标签格式文本）
+    reply_received = pyqtSignal(dict)     # 成功接收结构化响应 {"text", "state"}
     error_occurred = pyqtSignal(str)      # 发生错误
     
     def __init__(self, api_key: str, endpoint: str, model_name: str,
-                 system_prompt: str, user_message: str, tools: list = None, parent=None):
+                 system_prompt: str, user_message: str, tools: list = None,
+                 structured_mode: str = structured_output.MODE_OFF,
+                 structured_states: list = None,
+                 fallback_system_prompt: str = None,
+                 provider: str = "", trigger: str = "chat",
+                 trace_id: str = None, prefetch_tools: list = None, parent=None):
         super().__init__(parent)
         self.api_key = api_key
         self.endpoint = endpoint
@@ -27,8 +65,58 @@ class ChatWorker(QThread):
         self.system_prompt = system_prompt
         self.user_message = user_message
         self.tools = tools # List of tool definitions
+        # 结构化输出：不支持时使用 fallback_system_prompt（标签格式说明）回退
+        self.structured_mode = structured_output.normalize_mode(structured_mode)
+        self.structured_states = structured_states or []
+        self.fallback_system_prompt = fallback_system_prompt or system_prompt
+        # 用量统计：按供应商与触发类型记入账本
+        self.provider = provider
+        self.trigger = trigger
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.cached_tokens = 0
+        self.iterations = 0
+        self.tool_call_count = 0
+        self.succeeded = False
+        # 追踪：同一轮的所有事件共享 trace_id
+        self.trace_id = trace_id or tracer.new_trace_id()
+        # 请求前预取并内联到用户消息的工具（见 context_prefetch）
+        self.prefetch_tools = prefetch_tools or []
     
     def run(self):
+        """执行一轮请求，并在结束后记录用量"""
+        started = time.monotonic()
+        tracer.current_trace = self.trace_id
+        try:
+            self._run_turn()
+        finally:
+            _release_http_session()
+            tracer.emit(
+                self.trace_id, "turn", started, time.monotonic() - started,
+                provider=self.provider, trigger=self.trigger, ok=self.succeeded,
+                iterations=self.iterations, tool_calls=self.tool_call_count,
+                prompt_tokens=self.prompt_tokens, completion_tokens=self.completion_tokens
+            )
+            tracer.current_trace = None
+            if metrics.enabled:
+                LLM_TURN_SECONDS.observe(time.monotonic() - started, trigger=self.trigger, ok=self.succeeded)
+                LLM_TOKENS.inc(self.prompt_tokens, kind="prompt")
+                LLM_TOKENS.inc(self.completion_tokens, kind="completion")
+                LLM_TOKENS.inc(self.cached_tokens, kind="cached")
+            if self.iterations:
+                usage_ledger.record(
+                    provider=self.provider,
+                    trigger=self.trigger,
+                    prompt_tokens=self.prompt_tokens,
+                    completion_tokens=self.completion_tokens,
+                    cached_tokens=self.cached_tokens,
+                    latency_ms=int((time.monotonic() - started) * 1000),
+                    iterations=self.iterations,
+                    tool_calls=self.tool_call_count,
+                    ok=self.succeeded
+                )
+    
+    def _run_turn(self):
         """执行 API 请求，支持工具调用循环"""
         try:
             headers = {
@@ -36,9 +124,27 @@ class ChatWorker(QThread):
                 "Authorization": f"Bearer {self.api_key}"
             }
             
+            support_key = structured_output.provider_key(
+                self.endpoint, self.model_name, self.structured_mode
+            )
+            use_structured = (
+                self.structured_mode != structured_output.MODE_OFF
+                and bool(self.structured_states)
+                and structured_output.is_supported(support_key) is not False
+            )
+            
+            # 预取结果放在用户消息末尾，系统提示词保持不变（供应商的前缀缓存仍然命中）
+            user_message = self.user_message
+            prefetched = {}
+            if self.prefetch_tools:
+                from .context_prefetch import context_prefetcher
+                prefetched = context_prefetcher.collect(self.prefetch_tools, self.trace_id)
+                if prefetched:
+                    user_message += "\n\n" + context_prefetcher.format_context(prefetched)
+            
             messages = [
-                {"role": "system", "content": self.system_prompt},
-                {"role": "user", "content": self.user_message}
+                {"role": "system", "content": self.system_prompt if use_structured else self.fallback_system_prompt},
+                {"role": "user", "content": user_message}
             ]
             
             # 限制工具调用循环次数，防止死循环
@@ -55,15 +161,33 @@ class ChatWorker(QThread):
                 if self.tools:
                     payload["tools"] = self.tools
                     payload["tool_choice"] = "auto"
+                
+                if use_structured:
+                    structured_output.apply_to_payload(payload, self.structured_mode, self.structured_states)
 
-                response = requests.post(
-                    self.endpoint,
-                    headers=headers,
-                    json=payload,
-                    timeout=30
-                )
+                self.iterations += 1
+                http_started = time.monotonic()
+                with tracer.span("http_attempt", self.trace_id, iteration=self.iterations) as span:
+                    response = _http_session().post(
+                        self.endpoint,
+                        headers=headers,
+                        json=payload,
+                        timeout=30
+                    )
+                    span['status'] = response.status_code
+                if metrics.enabled:
+                    LLM_HTTP_SECONDS.observe(time.monotonic() - http_started, status=response.status_code)
                 
                 if response.status_code != 200:
+                    # 首次探测：供应商因结构化参数拒绝请求时记录并回退到标签格式
+                    if (use_structured and response.status_code in (400, 422)
+                            and structured_output.is_supported(support_key) is None
+                            and structured_output.rejects_mode(response.text, self.structured_mode)):
+                        structured_output.mark_supported(support_key, False)
+                        use_structured = False
+                        messages[0]["content"] = self.fallback_system_prompt
+                        continue
+                    
                     error_msg = f"API 错误: {response.status_code}"
                     try:
                         error_detail = response.json()
@@ -75,12 +199,31 @@ class ChatWorker(QThread):
                     return
 
                 result = response.json()
+                prompt_tokens, completion_tokens, cached_tokens = extract_usage(result)
+                self.prompt_tokens += prompt_tokens
+                self.completion_tokens += completion_tokens
+                self.cached_tokens += cached_tokens
+                
                 if 'choices' not in result or not result['choices']:
                     self.error_occurred.emit("响应格式错误")
                     return
 
                 message = result['choices'][0]['message']
                 
+                if use_structured:
+                    reply = structured_output.parse_message(message, self.structured_mode)
+                    if reply is not None:
+                        structured_output.mark_supported(support_key, True)
+                        self.succeeded = True
+                        self.reply_received.emit(reply)
+                        return
+                    if structured_output.find_state_call(message) is not None:
+                        # set_pet_state 参数不合法：不重试，直接交给标签解析兜底
+                        self.succeeded = True
+                        self.response_received.emit(message.get('content') or '')
+                        return
+                    # 内容不是回复 JSON（标签格式或普通文本）：由下方无工具调用的分支交给标签解析
+                
                 # 检查是否有工具调用
                 if 'tool_calls' in message and message['tool_calls']:
                     # 将助手的回复（包含 tool_calls）加入消息历史
@@ -94,7 +237,11 @@ class ChatWorker(QThread):
                         except:
                             args = {}
                         
+                        if function_name in prefetched:
+                            context_prefetcher.note_model_call(function_name, self.trace_id)
+                        
                         # 执行工具
+                        self.tool_call_count += 1
                         tool_result = tool_manager.call_tool(function_name, args)
                         
                         # 将工具执行结果加入消息历史
@@ -110,6 +257,7 @@ class ChatWorker(QThread):
                 else:
                     # 没有工具调用，直接返回内容
                     content = message.get('content', '')
+                    self.succeeded = True
                     self.response_received.emit(content)
                     return
             
@@ -0,0 +1,243 @@
+"""
+配置服务模块
+负责 config.json 的加载、校验与原子写入（临时文件 + rename），
+监听文件的外部修改（QFileSystemWatcher，Linux 下基于 inotify），
+并按键发出细粒度的变更事件，订阅者只需处理真正变化的配置项。
+"""
+
+import copy
+import hashlib
+import json
+import os
+import tempfile
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Optional
+
+from PyQt6.QtCore import QObject, QTimer, QFileSystemWatcher, pyqtSignal
+
+from .logger import get_logger
+
+logger = get_logger(__name__)
+
+DEFAULT_SYSTEM_PROMPT = "你是一个可爱的桌面宠物助手，性格温柔、活泼、乐于助人。请用简短、可爱的语气回复用户，回复控制在50字以内。"
+
+
+@dataclass
+class ConfigField:
+    """单个配置项的类型、默认值与校验规则"""
+    type: Any
+    default: Any
+    validator: Optional[Callable[[Any], bool]] = None
+
+    def is_valid(self, value) -> bool:
+        # bool 是 int 的子类，数值字段不接受 bool
+        if isinstance(value, bool) and self.type is not bool:
+            return False
+        if not isinstance(value, self.type):
+            return False
+        return self.validator is None or bool(self.validator(value))
+
+
+SCHEMA: Dict[str, ConfigField] = {
+    "api_provider": ConfigField(str, "zhipu", lambda v: v in ("zhipu", "deepseek", "model_scope")),
+    "api_settings": ConfigField(dict, {}),
+    "api_key": ConfigField(str, "YOUR_API_KEY_HERE"),
+    "model": ConfigField(str, "glm-4.6"),
+    "api_endpoint": ConfigField(str, "https://open.bigmodel.cn/api/paas/v4/chat/completions"),
+    "system_prompt": ConfigField(str, DEFAULT_SYSTEM_PROMPT),
+    "animation_interval": ConfigField(int, 150, lambda v: 16 <= v <= 2000),
+    "pet_scale": ConfigField((int, float), 0.5, lambda v: 0.1 <= v <= 3.0),
+    # 行走参数（未填写的项使用 movement.DEFAULT_MOVEMENT）
+    "movement": ConfigField(dict, {}),
+    # 窗口几何跟踪（未填写的项使用 desktop_geometry.DEFAULT_DESKTOP_GEOMETRY）
+    "desktop_geometry": ConfigField(dict, {}),
+    # 省电策略：锁屏/熄屏/全屏/隐藏时暂停，使用电池时降频（未填写的项使用 power_policy.DEFAULT_POWER）
+    "power": ConfigField(dict, {}),
+    # 渲染模式：window（宠物与气泡各自是独立窗口）/ overlay（合成到同一个透明覆盖层，需重启生效）
+    "render_mode": ConfigField(str, "window", lambda v: v in ("window", "overlay")),
+    # 结构化输出: off / tool (set_pet_state 工具调用) / json_schema (response_format)
+    "structured_output": ConfigField((str, bool), "off"),
+    # Token 预算（0 表示不限制），超出后自动拉长自主思考间隔
+    "token_budget": ConfigField(dict, {"hourly": 0, "daily": 0}),
+    # 工具上下文预取（未填写的项使用 context_prefetch.DEFAULT_PREFETCH）
+    "context_prefetch": ConfigField(dict, {}),
+    # 自主思考预生成（未填写的项使用 speculative.DEFAULT_SPECULATION）
+    "speculation": ConfigField(dict, {}),
+    # 自适应思考调度参数（未填写的项使用 brain_scheduler.DEFAULT_SCHEDULE）
+    "brain_schedule": ConfigField(dict, {}),
+    # 传感器采样参数（未填写的项使用 sensors.DEFAULT_SENSORS）
+    "sensors": ConfigField(dict, {}),
+    # 日志参数（未填写的项使用 logger.DEFAULT_LOGGING）
+    "logging": ConfigField(dict, {}),
+    # 结构化追踪：开启后每轮请求的各阶段耗时写入 trace.jsonl（轮转参数未填写的项使用 tracing.DEFAULT_TRACING）
+    "tracing": ConfigField(dict, {"enabled": False}),
+    # 运行指标导出（Prometheus 文本格式，未填写的项使用 metrics.DEFAULT_METRICS）
+    "metrics": ConfigField(dict, {"enabled": False}),
+    # 本地控制接口（JSON-RPC over Unix Socket，未填写的项使用 ipc_server.DEFAULT_IPC）
+    "ipc": ConfigField(dict, {"enabled": False}),
+    # 工具沙箱参数（未填写的项使用 tool_sandbox.DEFAULT_SANDBOX）
+    "tool_sandbox": ConfigField(dict, {}),
+    # 同一进程中运行的多只宠物：名字或 {"name", "assets"}，为空时只有一只（见 pet_group.pet_entries）
+    "pets": ConfigField(list, []),
+    # LLM 请求调度（未填写的项使用 llm_dispatcher.DEFAULT_DISPATCH）
+    "llm_dispatch": ConfigField(dict, {}),
+    # 跨进程共享缩放帧（未填写的项使用 shm_frames.DEFAULT_SHARED_FRAMES，需重启生效）
+    "shared_frames": ConfigField(dict, {"enabled": False}),
+}
+
+
+def validate(config: dict) -> dict:
+    """按 SCHEMA 校验配置：补全缺失项，非法值回退为默认值，未知键原样保留"""
+    result = dict(config)
+    for key, field in SCHEMA.items():
+        if key not in result:
+            result[key] = copy.deepcopy(field.default)
+        elif not field.is_valid(result[key]):
+            logger.warning("配置项 %s 的值 %r 不合法，使用默认值 %r", key, result[key], field.default)
+            result[key] = copy.deepcopy(field.default)
+    return result
+
+
+def _digest(data: bytes) -> str:
+    return hashlib.sha1(data).hexdigest()
+
+
+class ConfigService(QObject):
+    """配置服务：校验、原子写入、文件监听与按键变更通知"""
+
+    # 单个配置项变化：(key, new_value)
+    key_changed = pyqtSignal(str, object)
+    # 一次变更涉及的全部配置项：{key: new_value}
+    config_changed = pyqtSignal(dict)
+
+    def __init__(self, path: str, initial: dict = None, parent=None):
+        super().__init__(parent)
+        self.path = path
+        # self.config 是对外共享的实时配置字典，变更时原地更新
+        self.config: dict = validate(initial) if initial is not None else {}
+        self._snapshot = copy.deepcopy(self.config)
+        self._last_digest = None
+        self._subscribers: Dict[str, list] = {}
+
+        self._watcher = None
+        self._reload_timer = QTimer(self)
+        self._reload_timer.setSingleShot(True)
+        self._reload_timer.setInterval(200)  # 合并编辑器保存时的连续写入
+        self._reload_timer.timeout.connect(self._reload_from_disk)
+
+    # ===== 读写 =====
+
+    def load(self) -> dict:
+        """加载配置；文件不存在或损坏时写入默认配置"""
+        loaded = None
+        if os.path.exists(self.path):
+            try:
+                with open(self.path, 'rb') as f:
+                    data = f.read()
+                loaded = json.loads(data.decode('utf-8'))
+                self._last_digest = _digest(data)
+            except Exception as e:
+                logger.warning("加载配置失败: %s", e)
+
+        if isinstance(loaded, dict):
+            self._replace(validate(loaded))
+        else:
+            self._replace(validate({}))
+            self._write(self.config)
+        return self.config
+
+    def save(self, new_config: dict):
+        """校验并原子写入新配置，随后只对变化的配置项发出通知；写入失败时抛出 OSError"""
+        new_config = validate(new_config)
+        self._write(new_config)
+        self._apply(new_config)
+
+    def _write(self, config: dict):
+        """原子写入：先写同目录临时文件并 fsync，再 rename 覆盖"""
+        data = json.dumps(config, ensure_ascii=False, indent=4).encode('utf-8')
+        directory = os.path.dirname(os.path.abspath(self.path))
+        fd, tmp_path = tempfile.mkstemp(prefix=".config-", suffix=".tmp", dir=directory)
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.path)
+        except OSError:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        # 记录自己写入的内容，监听到这次写入时不再重复处理
+        self._last_digest = _digest(data)
+
+    # ===== 变更通知 =====
+
+    def subscribe(self, key: str, callback: Callable[[Any], None]):
+        """订阅单个配置项的变化，回调参数为新值"""
+        self._subscribers.setdefault(key, []).append(callback)
+
+    def _replace(self, new_config: dict):
+        self.config.clear()
+        self.config.update(new_config)
+        self._snapshot = copy.deepcopy(new_config)
+
+    def _apply(self, new_config: dict):
+        """与上次快照比较，原地更新共享字典并逐项通知"""
+        changes = {
+            key: value for key, value in new_config.items()
+            if key not in self._snapshot or self._snapshot[key] != value
+        }
+        removed = [key for key in self._snapshot if key not in new_config]
+        self._replace(new_config)
+        if not changes and not removed:
+            return
+
+        logger.info("配置已更新: %s", ", ".join(sorted(list(changes) + removed)))
+        for key, value in changes.items():
+            self.key_changed.emit(key, value)
+            for callback in self._subscribers.get(key, []):
+                try:
+                    callback(value)
+                except Exception as e:
+                    logger.exception("处理配置项 %s 变更失败: %s", key, e)
+        self.config_changed.emit(changes)
+
+    # ===== 文件监听 =====
+
+    def watch(self):
+        """监听配置文件的外部修改（同时监听目录，以捕获 rename 替换）"""
+        if self._watcher is not None:
+            return
+        self._watcher = QFileSystemWatcher(self)
+        self._watcher.fileChanged.connect(self._on_fs_event)
+        self._watcher.directoryChanged.connect(self._on_fs_event)
+        self._watcher.addPath(os.path.dirname(os.path.abspath(self.path)))
+        if os.path.exists(self.path):
+            self._watcher.addPath(self.path)
+
+    def _on_fs_event(self, _path: str):
+        self._reload_timer.start()
+
+    def _reload_from_disk(self):
+        """外部修改后重新加载；内容未变或 JSON 不完整时忽略"""
+        # rename 替换后原文件的监听会失效，需要重新添加
+        if self._watcher is not None and os.path.exists(self.path) and self.path not in self._watcher.files():
+            self._watcher.addPath(self.path)
+        try:
+            with open(self.path, 'rb') as f:
+                data = f.read()
+        except OSError:
+            return
+        digest = _digest(data)
+        if digest == self._last_digest:
+            return
+        try:
+            loaded = json.loads(data.decode('utf-8'))
+        except ValueError as e:
+            logger.warning("配置文件格式错误，忽略本次修改: %s", e)
+            return
+        if not isinstance(loaded, dict):
+            return
+        self._last_digest = digest
+        logger.info("检测到配置文件被外部修改，重新加载")
+        self._apply(validate(loaded))
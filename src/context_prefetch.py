@@ -0,0 +1,144 @@
+"""
+上下文预取模块
+自主思考的第一轮几乎总是先调用 check_environment / get_current_state / get_system_health，
+白白多一次 HTTP 往返。标记为 prefetch 的工具（@tool_manager.register_tool(prefetch=True) 或
+@plugin_tool(prefetch=True)，须无副作用、无必填参数且足够便宜）在请求前于工作线程中并行执行，
+结果以紧凑 JSON 内联到用户消息里；需要参数或代价高的工具仍由模型按需调用。
+
+预取的工具仍然提供给模型（预取超时或失败时模型可以自己调用）。模型再次调用已预取的工具
+说明这次预取没省下往返，按工具计数（日志、指标与追踪的 prefetch_redundant 事件），
+可用 trace_analyzer 查看各工具的重复调用比例，据此调整预取集合。
+"""
+
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from typing import Dict, List
+
+from .logger import get_logger
+from .metrics import metrics, TOOL_PREFETCHES, TOOL_PREFETCH_REDUNDANT
+from .tracing import tracer
+
+logger = get_logger(__name__)
+
+DEFAULT_PREFETCH = {
+    "enabled": True,
+    "timeout_seconds": 2.0,   # 整批预取的等待上限，超时的工具留给模型调用
+    "max_chars": 400,         # 单个工具结果内联的最大长度
+    "exclude": [],            # 不预取的工具名（即使标记了 prefetch）
+}
+
+
+def compact_result(result, max_chars: int) -> str:
+    """把工具结果压缩成单行：JSON 去掉空白，过长时截断"""
+    text = str(result)
+    try:
+        text = json.dumps(json.loads(text), ensure_ascii=False, separators=(',', ':'))
+    except (TypeError, ValueError):
+        text = " ".join(text.split())
+    if len(text) > max_chars:
+        text = text[:max_chars] + "…"
+    return text
+
+
+def is_error_result(result) -> bool:
+    return isinstance(result, str) and result.startswith(("Error", '{"error"'))
+
+
+class ContextPrefetcher:
+    """并行执行预取工具并统计模型的重复调用（线程安全，在 ChatWorker 线程中调用）"""
+
+    def __init__(self):
+        self.settings = dict(DEFAULT_PREFETCH)
+        self._executor = None
+        self._lock = threading.Lock()
+        # 工具名 -> [预取次数, 模型再次调用次数]
+        self._counts: Dict[str, List[int]] = {}
+
+    def configure(self, settings: dict = None):
+        self.settings = {**DEFAULT_PREFETCH, **(settings or {})}
+
+    def tool_names(self) -> List[str]:
+        """当前要预取的工具名（未启用时为空）"""
+        if not self.settings["enabled"]:
+            return []
+        from .tools import tool_manager
+        exclude = set(self.settings["exclude"])
+        return [name for name in tool_manager.prefetch_tool_names() if name not in exclude]
+
+    def _pool(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="ToolPrefetch")
+            return self._executor
+
+    def collect(self, names: List[str], trace_id: str = None) -> Dict[str, str]:
+        """并行执行工具，返回 工具名 -> 压缩后的结果（超时或出错的工具不包含在内）"""
+        if not names:
+            return {}
+        from .tools import tool_manager
+
+        def run(name):
+            tracer.current_trace = trace_id
+            try:
+                return tool_manager.call_tool(name, {})
+            finally:
+                tracer.current_trace = None
+
+        started = time.monotonic()
+        pool = self._pool()
+        futures = {name: pool.submit(run, name) for name in names}
+        wait(futures.values(), timeout=self.settings["timeout_seconds"])
+
+        results = {}
+        for name, future in futures.items():
+            # 超时的工具继续在线程池中跑完，结果丢弃
+            if not future.done() or future.exception() is not None:
+                continue
+            result = future.result()
+            if is_error_result(result):
+                continue
+            results[name] = compact_result(result, self.settings["max_chars"])
+
+        with self._lock:
+            for name in results:
+                self._counts.setdefault(name, [0, 0])[0] += 1
+        if metrics.enabled:
+            for name in results:
+                TOOL_PREFETCHES.inc(tool=name)
+        missing = [name for name in names if name not in results]
+        tracer.emit(trace_id, "prefetch", started, time.monotonic() - started,
+                    tools=sorted(results), missing=missing)
+        if missing:
+            logger.debug("预取未完成的工具: %s", missing)
+        return results
+
+    @staticmethod
+    def format_context(results: Dict[str, str]) -> str:
+        """内联到用户消息中的上下文段落"""
+        lines = [f"- {name}: {text}" for name, text in results.items()]
+        return "以下信息已提前获取，无需再调用对应的工具：\n" + "\n".join(lines)
+
+    def note_model_call(self, name: str, trace_id: str = None):
+        """模型调用了本轮已预取的工具"""
+        with self._lock:
+            counts = self._counts.setdefault(name, [0, 0])
+            counts[1] += 1
+            prefetched, redundant = counts
+        if metrics.enabled:
+            TOOL_PREFETCH_REDUNDANT.inc(tool=name)
+        tracer.emit(trace_id, "prefetch_redundant", tool=name)
+        logger.info("模型再次调用了已预取的工具 %s（%d / %d 次）", name, redundant, prefetched)
+
+    def stats(self) -> Dict[str, dict]:
+        """各工具的预取次数、模型再次调用次数与比例"""
+        with self._lock:
+            return {
+                name: {"prefetched": p, "redundant": r, "redundant_ratio": r / p if p else 0.0}
+                for name, (p, r) in self._counts.items()
+            }
+
+
+# Global instance for easy access
+context_prefetcher = ContextPrefetcher()
@@ -0,0 +1,609 @@
+"""
+桌面几何模块
+跟踪屏幕上顶层窗口的矩形与层叠顺序，放入均匀网格空间索引并增量更新，供移动引擎查询：
+- 窗口标题栏（窗口上边缘）中未被更上层窗口遮住的部分，宠物可以站在上面行走；
+- 行走到可见部分的端点视为碰壁；窗口移动时站在上面的宠物跟随，窗口关闭/最小化时落回地面。
+每次查询只访问矩形覆盖的网格单元，与打开的窗口总数无关。
+
+窗口信息来源（按可用性选择）：
+- xlib：安装了 python-xlib 时，后台线程监听根窗口的 SubstructureNotify 事件（创建、移动、层叠、映射、销毁），
+  按批次增量更新；层叠顺序按 ConfigureNotify 的 above_sibling 逐个调整，只在启动或引用了未知窗口时完整读取；
+- wmctrl：否则用 `xprop -spy` 监听 _NET_CLIENT_LIST_STACKING 变化，并在需要时用 `wmctrl -lpG` 重新读取
+  （标题栏位置为客户区上沿，不含窗口管理器的边框）。
+Wayland 或两者都不可用时不启用，宠物只在地面行走。
+"""
+
+import os
+import select
+import threading
+from typing import Dict, List, Optional, Set, Tuple
+
+from PyQt6.QtCore import QObject, QProcess, QTimer, pyqtSignal
+from PyQt6.QtGui import QGuiApplication
+
+from .logger import get_logger
+
+logger = get_logger(__name__)
+
+DEFAULT_DESKTOP_GEOMETRY = {
+    "enabled": True,
+    "backend": "auto",      # auto / xlib / wmctrl
+    "cell_size": 256,       # 空间索引网格单元（像素）
+    "poll_seconds": 2.0,    # wmctrl 后端：有宠物站在窗口上时的刷新间隔
+}
+
+Rect = Tuple[int, int, int, int]  # x, y, w, h（全局坐标）
+
+# 层叠操作 (窗口 id, 位置)：位置为下方相邻窗口的 id，或以下常量
+STACK_TOP = None      # 放到最上层（新建窗口、重新成为顶层窗口）
+STACK_BOTTOM = 0      # 放到最下层（ConfigureNotify 的 above_sibling 为 None）
+STACK_REMOVE = -1     # 不再是根窗口的子窗口（销毁、被放进窗口管理器的边框）
+
+
+class SpatialGrid:
+    """均匀网格空间索引：每个矩形登记到它覆盖的网格单元，查询只访问相交的单元"""
+
+    def __init__(self, cell_size: int = 256):
+        self.cell_size = max(16, int(cell_size))
+        self._cells: Dict[Tuple[int, int], Set[int]] = {}
+        self._keys: Dict[int, Tuple[int, int, int, int]] = {}  # key -> 覆盖的单元范围
+
+    def _span(self, rect: Rect) -> Tuple[int, int, int, int]:
+        x, y, w, h = rect
+        size = self.cell_size
+        return x // size, y // size, (x + max(w, 1) - 1) // size, (y + max(h, 1) - 1) // size
+
+    def insert(self, key: int, rect: Rect):
+        span = self._span(rect)
+        if self._keys.get(key) == span:
+            return  # 在同一组单元内移动，无需更新
+        self.remove(key)
+        self._keys[key] = span
+        x0, y0, x1, y1 = span
+        for cx in range(x0, x1 + 1):
+            for cy in range(y0, y1 + 1):
+                self._cells.setdefault((cx, cy), set()).add(key)
+
+    def remove(self, key: int):
+        span = self._keys.pop(key, None)
+        if span is None:
+            return
+        x0, y0, x1, y1 = span
+        for cx in range(x0, x1 + 1):
+            for cy in range(y0, y1 + 1):
+                cell = self._cells.get((cx, cy))
+                if cell is not None:
+                    cell.discard(key)
+                    if not cell:
+                        del self._cells[(cx, cy)]
+
+    def query(self, rect: Rect) -> Set[int]:
+        x0, y0, x1, y1 = self._span(rect)
+        found = set()
+        for cx in range(x0, x1 + 1):
+            for cy in range(y0, y1 + 1):
+                cell = self._cells.get((cx, cy))
+                if cell:
+                    found |= cell
+        return found
+
+    def clear(self):
+        self._cells.clear()
+        self._keys.clear()
+
+
+class _XlibWatcher(threading.Thread):
+    """python-xlib 后台线程：监听根窗口子窗口的变化，按批次回传（批次格式见 DesktopGeometry._apply_batch）"""
+
+    def __init__(self, post):
+        super().__init__(name="DesktopGeometry", daemon=True)
+        self._post = post
+        self._stopped = False
+        self._resync = False
+        # 唤醒管道：线程阻塞在 select 上，stop() / request_order() 通过它立即打断
+        self._wake_r, self._wake_w = os.pipe()
+        self._wake_lock = threading.Lock()
+
+    def stop(self):
+        self._stopped = True
+        self._wake()
+
+    def request_order(self):
+        """重新读取完整的层叠顺序（增量更新引用了未知窗口时）"""
+        self._resync = True
+        self._wake()
+
+    def _wake(self):
+        with self._wake_lock:
+            if self._wake_w is not None:
+                os.write(self._wake_w, b"\0")
+
+    def run(self):
+        from Xlib import X, display, error
+        try:
+            try:
+                self._display = display.Display()
+            except Exception as e:
+                logger.warning("无法连接 X11，窗口几何跟踪不可用: %s", e)
+                return
+            try:
+                self._watch(X, error)
+            finally:
+                self._display.close()
+        finally:
+            with self._wake_lock:
+                os.close(self._wake_r)
+                os.close(self._wake_w)
+                self._wake_w = None
+
+    def _watch(self, X, error):
+        d = self._display
+        self._X, self._errors = X, (error.XError, error.BadWindow, error.BadDrawable)
+        self._root = d.screen().root
+        self._pid_atom = d.intern_atom('_NET_WM_PID')
+        self._own: Dict[int, bool] = {}
+        self._root.change_attributes(event_mask=X.SubstructureNotifyMask)
+
+        windows = {}
+        for child in self._root.query_tree().children:
+            info = self._describe(child)
+            if info is not None:
+                windows[child.id] = info
+        self._post(self, {"reset": windows, "order": self._order()})
+
+        while not self._stopped:
+            if not d.pending_events():
+                readable, _, _ = select.select([d.fileno(), self._wake_r], [], [])
+                if self._wake_r in readable:
+                    os.read(self._wake_r, 64)
+            if self._stopped:
+                break
+            batch = {"upsert": {}, "remove": set(), "restack": [], "order": None}
+            while d.pending_events():
+                self._handle(d.next_event(), batch)
+            self._resolve(batch)
+            if self._resync:
+                self._resync = False
+                batch["order"] = self._order()
+            if batch["upsert"] or batch["remove"] or batch["restack"] or batch["order"] is not None:
+                self._post(self, batch)
+
+    def _order(self) -> List[int]:
+        """根窗口子窗口按层叠顺序排列（从下到上），只在启动与重新同步时读取"""
+        try:
+            return [child.id for child in self._root.query_tree().children]
+        except self._errors:
+            return []
+
+    def _describe(self, window) -> Optional[tuple]:
+        """(x, y, w, h, 是否可见)；覆盖重定向窗口（菜单、提示）与本进程的窗口返回 None"""
+        X = self._X
+        try:
+            attrs = window.get_attributes()
+            if attrs.override_redirect:
+                return None
+            geometry = window.get_geometry()
+            mapped = attrs.map_state == X.IsViewable
+            if mapped and self._is_own(window):
+                return None
+            return geometry.x, geometry.y, geometry.width, geometry.height, mapped
+        except self._errors:
+            return None
+
+    def _is_own(self, window) -> bool:
+        """窗口（或被窗口管理器重新指定父窗口后的客户窗口）属于本进程"""
+        if window.id not in self._own:
+            own = False
+            try:
+                candidates = [window] + list(window.query_tree().children)
+                for candidate in candidates:
+                    prop = candidate.get_full_property(self._pid_atom, self._X.AnyPropertyType)
+                    if prop is not None and prop.value and int(prop.value[0]) == os.getpid():
+                        own = True
+                        break
+            except self._errors:
+                pass
+            self._own[window.id] = own
+        return self._own[window.id]
+
+    def _handle(self, event, batch):
+        """把一个事件合并进批次；层叠变化按事件顺序记为操作（覆盖重定向窗口也参与层叠）"""
+        X = self._X
+        kind = event.type
+        wid = event.window.id
+        if kind == X.ConfigureNotify:
+            # above_sibling：紧贴在其下方的兄弟窗口，None 表示最下层
+            sibling = getattr(event.above_sibling, 'id', event.above_sibling) or STACK_BOTTOM
+            batch["restack"].append((wid, sibling))
+            if not event.override_redirect:
+                batch["upsert"][wid] = None  # 批次结束前统一读取最新状态
+        elif kind == X.CreateNotify:
+            batch["restack"].append((wid, STACK_TOP))
+            if not event.override_redirect:
+                batch["upsert"][wid] = None
+        elif kind in (X.MapNotify, X.UnmapNotify):
+            batch["upsert"][wid] = None
+        elif kind == X.DestroyNotify:
+            self._own.pop(wid, None)
+            batch["upsert"].pop(wid, None)
+            batch["remove"].add(wid)
+            batch["restack"].append((wid, STACK_REMOVE))
+        elif kind == X.ReparentNotify:
+            # 客户窗口被窗口管理器放进边框（离开根窗口）或重新成为顶层窗口（放在最上层）
+            if event.parent.id == self._root.id:
+                batch["upsert"][wid] = None
+                batch["restack"].append((wid, STACK_TOP))
+            else:
+                batch["upsert"].pop(wid, None)
+                batch["remove"].add(wid)
+                batch["restack"].append((wid, STACK_REMOVE))
+
+    def _resolve(self, batch):
+        """读取批次中各窗口的最新几何（同一窗口多次移动只读取一次）"""
+        for wid in list(batch["upsert"]):
+            info = self._describe(self._display.create_resource_object('window', wid))
+            if info is None:
+                del batch["upsert"][wid]
+                batch["remove"].add(wid)
+            else:
+                batch["upsert"][wid] = info
+
+
+class _WmctrlWatcher(QObject):
+    """wmctrl 后端：xprop -spy 监听窗口增删与层叠变化，wmctrl -lpG 读取几何（QProcess，不阻塞界面）"""
+
+    def __init__(self, post, poll_seconds: float, parent=None):
+        super().__init__(parent)
+        self._post = post
+        self._order: List[int] = []
+        self._spy = QProcess(self)
+        self._spy.readyReadStandardOutput.connect(self._on_spy_output)
+        self._query = QProcess(self)
+        self._query.finished.connect(self._on_query_finished)
+        self._pending = False
+        self._poll = QTimer(self)
+        self._poll.setInterval(int(poll_seconds * 1000))
+        self._poll.timeout.connect(self.refresh)
+
+    def start(self):
+        self._spy.start("xprop", ["-root", "-spy", "_NET_CLIENT_LIST_STACKING"])
+        self.refresh()
+
+    def stop(self):
+        self._poll.stop()
+        for process in (self._spy, self._query):
+            if process.state() != QProcess.ProcessState.NotRunning:
+                process.kill()
+
+    def set_polling(self, enabled: bool):
+        """wmctrl 无法得知窗口移动，只在有宠物站在窗口上时定期刷新"""
+        if enabled and not self._poll.isActive():
+            self._poll.start()
+        elif not enabled:
+            self._poll.stop()
+
+    def refresh(self):
+        if self._query.state() != QProcess.ProcessState.NotRunning:
+            self._pending = True
+            return
+        self._query.start("wmctrl", ["-lpG"])
+
+    def _on_spy_output(self):
+        text = bytes(self._spy.readAllStandardOutput()).decode('utf-8', 'replace')
+        for line in text.splitlines():
+            if "#" in line:
+                self._order = [int(token, 16) for token in line.split("#", 1)[1].replace(",", " ").split()
+                               if token.startswith("0x")]
+        self.refresh()
+
+    def _on_query_finished(self, *_args):
+        text = bytes(self._query.readAllStandardOutput()).decode('utf-8', 'replace')
+        windows = {}
+        for line in text.splitlines():
+            # 窗口 id、桌面、pid、x、y、宽、高、主机名、标题
+            parts = line.split(None, 8)
+            if len(parts) < 7:
+                continue
+            try:
+                wid, pid = int(parts[0], 16), int(parts[2])
+                x, y, w, h = (int(value) for value in parts[3:7])
+            except ValueError:
+                continue
+            if pid != os.getpid():
+                windows[wid] = (x, y, w, h, True)
+        self._post(self, {"reset": windows, "order": list(self._order) or list(windows)})
+        if self._pending:
+            self._pending = False
+            self.refresh()
+
+
+class DesktopGeometry(QObject):
+    """顶层窗口几何的空间索引（只在 GUI 线程读写）"""
+
+    # 几何、可见性或层叠顺序发生变化的窗口 id 集合
+    windows_changed = pyqtSignal(object)
+    # 后台线程回传的 (来源, 批次)，排队到 GUI 线程处理
+    _batch_ready = pyqtSignal(object)
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.settings = dict(DEFAULT_DESKTOP_GEOMETRY)
+        self.windows: Dict[int, Rect] = {}      # 可见的顶层窗口
+        # 根窗口全部子窗口的层叠顺序：双向链表 + 可比较的层叠键（越大越靠上），
+        # 单个窗口的层叠变化只需取相邻两个窗口键的中点，无需重新枚举
+        self._stack: Dict[int, float] = {}
+        self._below: Dict[int, Optional[int]] = {}
+        self._above: Dict[int, Optional[int]] = {}
+        self._top: Optional[int] = None
+        self._bottom: Optional[int] = None
+        self._grid = SpatialGrid(self.settings["cell_size"])
+        self._backend = None
+        self._demand = 0
+        self._batch_ready.connect(self._on_batch)
+
+    @property
+    def running(self) -> bool:
+        return self._backend is not None
+
+    # ===== 启停 =====
+
+    def start(self, settings: dict = None):
+        """选择可用的后端并开始跟踪（已启动时先停止）"""
+        self.stop()
+        self.settings = {**DEFAULT_DESKTOP_GEOMETRY, **(settings or {})}
+        self._grid = SpatialGrid(self.settings["cell_size"])
+        if not self.settings["enabled"] or QGuiApplication.platformName() != "xcb":
+            return
+        backend = self.settings["backend"]
+        if backend in ("auto", "xlib"):
+            try:
+                import Xlib  # noqa: F401
+            except ImportError:
+                if backend == "xlib":
+                    logger.warning("未安装 python-xlib，窗口几何跟踪不可用")
+                    return
+            else:
+                watcher = _XlibWatcher(self._post)
+                watcher.start()
+                self._backend = watcher
+                logger.info("窗口几何跟踪已启动（X11 事件）")
+                return
+        from shutil import which
+        if which("wmctrl") and which("xprop"):
+            watcher = _WmctrlWatcher(self._post, self.settings["poll_seconds"], parent=self)
+            watcher.start()
+            watcher.set_polling(self._demand > 0)
+            self._backend = watcher
+            logger.info("窗口几何跟踪已启动（wmctrl）")
+        else:
+            logger.info("缺少 python-xlib 与 wmctrl，宠物不会站到窗口上")
+
+    def stop(self):
+        if self._backend is not None:
+            self._backend.stop()
+            self._backend = None
+        self.windows.clear()
+        self._clear_stack()
+        self._grid.clear()
+
+    def acquire(self):
+        """有宠物站在窗口上（wmctrl 后端据此决定是否定期刷新）"""
+        self._demand += 1
+        if isinstance(self._backend, _WmctrlWatcher):
+            self._backend.set_polling(True)
+
+    def release(self):
+        self._demand = max(0, self._demand - 1)
+        if isinstance(self._backend, _WmctrlWatcher):
+            self._backend.set_polling(self._demand > 0)
+
+    def refresh(self):
+        """尽快重新读取（拖动宠物开始时调用；事件后端始终是最新的）"""
+        if isinstance(self._backend, _WmctrlWatcher):
+            self._backend.refresh()
+
+    # ===== 增量更新 =====
+
+    def _post(self, source, batch: dict):
+        """后端回传批次（可在后台线程调用）"""
+        self._batch_ready.emit((source, batch))
+
+    def _on_batch(self, item):
+        source, batch = item
+        # 已停止的后端在停止前排队的批次不再应用
+        if source is self._backend:
+            self._apply_batch(batch)
+
+    def _apply_batch(self, batch: dict):
+        """批次：{"reset": {id: info}} 为完整快照；否则 {"upsert": {id: info}, "remove": ids}；
+        info 为 (x, y, w, h, 是否可见)；"restack" 为按事件顺序的层叠操作 [(id, 位置)]（见 STACK_*）；
+        "order" 为从下到上的完整层叠顺序（None 表示未提供）"""
+        changed = set()
+        if "reset" in batch:
+            upsert = batch["reset"]
+            removed = set(self.windows) - set(upsert)
+        else:
+            upsert, removed = batch["upsert"], batch["remove"]
+        for wid in removed:
+            if self.windows.pop(wid, None) is not None:
+                self._grid.remove(wid)
+                changed.add(wid)
+        for wid, (x, y, w, h, mapped) in upsert.items():
+            rect = (x, y, w, h)
+            if not mapped or w <= 0 or h <= 0:
+                if self.windows.pop(wid, None) is not None:
+                    self._grid.remove(wid)
+                    changed.add(wid)
+            elif self.windows.get(wid) != rect:
+                self.windows[wid] = rect
+                self._grid.insert(wid, rect)
+                changed.add(wid)
+        for wid, position in batch.get("restack", ()):
+            if self._restack(wid, position) and wid in self.windows:
+                changed.add(wid)
+        if batch.get("order") is not None:
+            changed |= self._set_order(batch["order"])
+        if changed:
+            self.windows_changed.emit(changed)
+
+    # ===== 层叠顺序 =====
+
+    def _clear_stack(self):
+        self._stack.clear()
+        self._below.clear()
+        self._above.clear()
+        self._top = self._bottom = None
+
+    def _set_order(self, order: List[int]) -> Set[int]:
+        """完整的层叠顺序（启动、wmctrl 刷新、重新同步），返回相对顺序变化的可见窗口"""
+        before = sorted(self.windows, key=self._level)
+        self._clear_stack()
+        below = None
+        for position, wid in enumerate(order):
+            self._stack[wid] = float(position)
+            self._below[wid] = below
+            self._above[wid] = None
+            if below is not None:
+                self._above[below] = wid
+            below = wid
+        self._top = below
+        self._bottom = order[0] if order else None
+        after = sorted(self.windows, key=self._level)
+        return {a for a, b in zip(after, before) if a != b}
+
+    def _restack(self, wid: int, position) -> bool:
+        """把窗口移到 position 之上（见 STACK_*），返回层叠位置是否变化"""
+        if position == STACK_REMOVE:
+            if wid not in self._stack:
+                return False
+            self._unlink(wid)
+            return True
+        if position == STACK_TOP:
+            position = self._top if self._top != wid else self._below.get(wid)
+        elif position == STACK_BOTTOM:
+            position = None
+        elif position not in self._stack:
+            # 引用了未记录的窗口（事件丢失）：先放到最上层，再请求完整顺序
+            logger.debug("层叠顺序引用了未知窗口 0x%x，重新同步", position)
+            if isinstance(self._backend, _XlibWatcher):
+                self._backend.request_order()
+            position = self._top if self._top != wid else self._below.get(wid)
+        if wid in self._stack:
+            if self._below[wid] == position:
+                return False
+            self._unlink(wid)
+        self._link_above(wid, position)
+        return True
+
+    def _unlink(self, wid: int):
+        below, above = self._below.pop(wid), self._above.pop(wid)
+        del self._stack[wid]
+        if below is not None:
+            self._above[below] = above
+        else:
+            self._bottom = above
+        if above is not None:
+            self._below[above] = below
+        else:
+            self._top = below
+
+    def _link_above(self, wid: int, below: Optional[int]):
+        """插入到 below 之上（None 表示最下层），层叠键取相邻两个窗口的中点"""
+        above = self._bottom if below is None else self._above[below]
+        low = self._stack[below] if below is not None else None
+        high = self._stack[above] if above is not None else None
+        if low is None and high is None:
+            key = 0.0
+        elif low is None:
+            key = high - 1.0
+        elif high is None:
+            key = low + 1.0
+        else:
+            key = (low + high) / 2
+        self._stack[wid] = key
+        self._below[wid] = below
+        self._above[wid] = above
+        if below is not None:
+            self._above[below] = wid
+        else:
+            self._bottom = wid
+        if above is not None:
+            self._below[above] = wid
+        else:
+            self._top = wid
+        if low is not None and high is not None and not low < key < high:
+            self._renumber()  # 浮点间隔耗尽（极少发生）
+
+    def _level(self, wid: int) -> float:
+        """层叠键（越大越靠上），未记录的窗口视为最下层"""
+        return self._stack.get(wid, float("-inf"))
+
+    def _renumber(self):
+        order = []
+        wid = self._top
+        while wid is not None:
+            order.append(wid)
+            wid = self._below[wid]
+        for position, wid in enumerate(reversed(order)):
+            self._stack[wid] = float(position)
+
+    # ===== 查询 =====
+
+    def window(self, wid: int) -> Optional[Rect]:
+        return self.windows.get(wid)
+
+    def windows_in(self, rect: Rect) -> List[int]:
+        """与矩形相交的窗口，按层叠顺序从上到下"""
+        x, y, w, h = rect
+        found = []
+        for wid in self._grid.query(rect):
+            wx, wy, ww, wh = self.windows[wid]
+            if wx < x + w and x < wx + ww and wy < y + h and y < wy + wh:
+                found.append(wid)
+        found.sort(key=self._level, reverse=True)
+        return found
+
+    def top_edge_segments(self, wid: int) -> List[Tuple[int, int]]:
+        """窗口上边缘未被更上层窗口遮住的区间 [start, end)"""
+        rect = self.windows.get(wid)
+        if rect is None:
+            return []
+        x, y, w, _h = rect
+        level = self._level(wid)
+        segments = [(x, x + w)]
+        for other in self.windows_in((x, y, w, 1)):
+            if self._level(other) <= level:
+                break  # 其余窗口都在下层
+            ox, _oy, ow, _oh = self.windows[other]
+            start, end = ox, ox + ow
+            clipped = []
+            for s, e in segments:
+                if end <= s or e <= start:
+                    clipped.append((s, e))
+                    continue
+                if s < start:
+                    clipped.append((s, start))
+                if end < e:
+                    clipped.append((end, e))
+            segments = clipped
+            if not segments:
+                break
+        return segments
+
+    def segment_at(self, wid: int, x: int) -> Optional[Tuple[int, int]]:
+        for start, end in self.top_edge_segments(wid):
+            if start <= x < end:
+                return start, end
+        return None
+
+    def surface_below(self, x: int, y: int, snap: int) -> Optional[Tuple[int, int]]:
+        """(x, y) 附近 snap 像素内可以站立的最上层窗口标题栏，返回 (窗口 id, 上边缘 y)"""
+        for wid in self.windows_in((x, y - snap, 1, 2 * snap + 1)):
+            top = self.windows[wid][1]
+            if abs(top - y) <= snap and self.segment_at(wid, x) is not None:
+                return wid, top
+        return None
+
+
+# Global instance for easy access
+desktop_geometry = DesktopGeometry()
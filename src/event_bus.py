@@ -0,0 +1,101 @@
+"""
+事件总线模块
+传感器发布带类型的事件，订阅者（触发规则、调度器等）按类型订阅。
+可从任意线程发布，事件总是在总线所属线程（GUI 线程）派发。
+"""
+
+import json
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List
+
+from PyQt6.QtCore import QObject, pyqtSignal
+
+from .logger import get_logger
+
+logger = get_logger(__name__)
+
+# 事件类型
+BATTERY_LOW = "battery_low"
+WINDOW_FOCUS = "window_focus"
+TIME_PERIOD = "time_period"
+CPU_SPIKE = "cpu_spike"
+SESSION_LOCK = "session_lock"
+USER_RETURNED = "user_returned"
+USER_AWAY = "user_away"
+MANUAL = "manual"
+FULLSCREEN = "fullscreen"
+DISPLAY_POWER = "display_power"
+POWER_SOURCE = "power_source"
+
+# 用于写入提示词的事件描述
+EVENT_DESCRIPTIONS = {
+    BATTERY_LOW: "电脑电量过低，而且没有插电",
+    WINDOW_FOCUS: "用户切换了正在使用的窗口",
+    TIME_PERIOD: "时间段发生了变化",
+    CPU_SPIKE: "电脑的 CPU 占用突然变高了",
+    SESSION_LOCK: "屏幕锁定状态发生了变化",
+    USER_RETURNED: "用户离开一段时间后回来了",
+    USER_AWAY: "用户已经有一段时间没有操作电脑了",
+    MANUAL: "用户要求你思考一下",
+    FULLSCREEN: "用户进入或退出了全屏应用",
+    DISPLAY_POWER: "显示器被关闭或重新点亮",
+    POWER_SOURCE: "电脑接上或拔掉了电源",
+}
+
+
+@dataclass
+class PetEvent:
+    """带类型的传感器事件"""
+    kind: str
+    payload: dict = field(default_factory=dict)
+    priority: int = 0
+    timestamp: float = field(default_factory=time.monotonic)
+
+    def describe(self) -> str:
+        """生成紧凑的事件描述，直接放入本轮请求的上下文"""
+        text = EVENT_DESCRIPTIONS.get(self.kind, self.kind)
+        if self.payload:
+            text += " " + json.dumps(self.payload, ensure_ascii=False, separators=(',', ':'))
+        return text
+
+
+class EventBus(QObject):
+    """发布/订阅事件总线"""
+
+    # 跨线程投递用的内部信号
+    _posted = pyqtSignal(object)
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self._subscribers: Dict[str, List[Callable]] = {}
+        self._owner_thread = threading.get_ident()
+        self._posted.connect(self._dispatch)
+
+    def subscribe(self, kind: str, callback: Callable):
+        """订阅某类事件，kind 为 "*" 时订阅全部事件"""
+        self._subscribers.setdefault(kind, []).append(callback)
+
+    def unsubscribe(self, kind: str, callback: Callable):
+        callbacks = self._subscribers.get(kind, [])
+        if callback in callbacks:
+            callbacks.remove(callback)
+
+    def publish(self, event: PetEvent):
+        """发布事件；非 GUI 线程发布时通过信号排队到 GUI 线程"""
+        if threading.get_ident() == self._owner_thread:
+            self._dispatch(event)
+        else:
+            self._posted.emit(event)
+
+    def _dispatch(self, event: PetEvent):
+        for callback in self._subscribers.get(event.kind, []) + self._subscribers.get("*", []):
+            try:
+                callback(event)
+            except Exception as e:
+                logger.exception("事件处理失败 (%s): %s", event.kind, e)
+
+
+# Global instance for easy access
+event_bus = EventBus()
@@ -0,0 +1,297 @@
+"""
+帧缓存模块
+管理动作帧与表情的加载（经 asset_preprocess 裁剪、去重、预乘 alpha）、
+按缩放比例生成的缩放帧缓存，以及与缩放帧一一对应的输入区域（点击穿透掩码）。
+相同内容的帧共用同一个 QPixmap，缩放与掩码也只计算一次。
+
+缩放帧按屏幕的 devicePixelRatio 分别生成（设置了对应 DPR 的物理像素帧），
+宠物移到不同 DPR 的屏幕时切换；非当前 DPR 的动作在第一次显示时才缩放，
+只保留当前连接的屏幕用到的 DPR。输入区域使用逻辑坐标，各 DPR 共用。
+窗口掩码同时限制绘制，输入区域按宠物阴影的模糊半径与偏移膨胀，阴影不会被裁掉；
+裁剪透明边框时同样保留阴影的范围（trim_padding，随缩放比例换算为原图像素）。
+多只宠物使用同一素材目录时共用一个 FrameStore（见 pet_group），重复加载直接返回。
+配置 shared_frames.enabled 时改用 shm_frames.SharedFrameStore，跨进程共享缩放帧。
+"""
+
+import math
+import os
+from typing import Callable, Dict, Iterable, List, Tuple
+
+from PyQt6.QtCore import Qt, QSize, QPoint
+from PyQt6.QtGui import QPixmap, QRegion
+
+from .asset_preprocess import FrameDeduplicator, Padding, ProcessedFrames, load_action_dir, load_expressions_dir
+from .logger import get_logger
+from .metrics import metrics, CACHE_LOOKUPS
+
+logger = get_logger(__name__)
+
+# 输入掩码向外扩展的最少像素，覆盖抗锯齿边缘，便于点中轮廓边缘
+MASK_MARGIN = 2
+# 宠物图片的阴影（pet_widget 的 QGraphicsDropShadowEffect），逻辑像素
+SHADOW_BLUR = 15
+SHADOW_OFFSET = (0, 2)
+
+
+def shadow_extent() -> Tuple[int, int, int, int]:
+    """阴影超出图片轮廓的范围 (左, 上, 右, 下)"""
+    dx, dy = SHADOW_OFFSET
+    return (max(0, SHADOW_BLUR - dx), max(0, SHADOW_BLUR - dy),
+            max(0, SHADOW_BLUR + dx), max(0, SHADOW_BLUR + dy))
+
+
+def trim_padding(scale: float) -> Padding:
+    """裁剪透明边框时保留的边距（原图像素）：缩放后正好容纳阴影"""
+    return tuple(math.ceil(extent / scale) for extent in shadow_extent())
+
+
+def _dilate(region: QRegion, left: int, top: int, right: int, bottom: int) -> QRegion:
+    """按矩形向外膨胀：每个方向平移倍增合并，只需 O(log n) 次合并"""
+    for before, after, horizontal in ((left, right, True), (top, bottom, False)):
+        region = region.translated(-before, 0) if horizontal else region.translated(0, -before)
+        covered, span = 1, before + after + 1
+        while covered < span:
+            step = min(covered, span - covered)
+            region = region.united(region.translated(step, 0) if horizontal else region.translated(0, step))
+            covered += step
+    return region
+
+
+def frame_input_region(pixmap: QPixmap):
+    """由帧的 alpha 通道生成输入区域（透明处点击穿透），没有 alpha 通道时返回 None；
+    区域包含阴影，窗口掩码同时限制绘制，只覆盖轮廓会把阴影裁掉"""
+    if not pixmap.hasAlphaChannel():
+        return None
+    bitmap = pixmap.mask()
+    if bitmap.isNull():
+        return None
+    region = QRegion(bitmap)
+    if region.isEmpty():
+        return None
+    dilated = _dilate(region, *(max(MASK_MARGIN, extent) for extent in shadow_extent()))
+    return dilated.intersected(QRegion(pixmap.rect()))
+
+
+def normalize_dpr(dpr) -> float:
+    return round(float(dpr or 1.0), 3)
+
+
+def create_frame_store(assets_path: str, scale: float, config: dict = None) -> "FrameStore":
+    """按配置创建帧缓存（启用 shared_frames 时跨进程共享）"""
+    settings = (config or {}).get('shared_frames') or {}
+    if settings.get('enabled'):
+        from .shm_frames import SharedFrameStore
+        return SharedFrameStore(assets_path, scale, settings)
+    return FrameStore(assets_path, scale)
+
+
+class FrameStore:
+    """动作帧、缩放帧与输入区域的缓存"""
+
+    def __init__(self, assets_path: str, scale: float = 1.0):
+        self.assets_path = assets_path
+        self.scale = scale
+        # 动作名 -> 原始帧（裁剪后）
+        self.frames: Dict[str, List[QPixmap]] = {}
+        # 动作名 -> 裁剪区域在原画布中的偏移（未缩放）
+        self.anchors: Dict[str, QPoint] = {}
+        # 动作名 -> 输入区域（逻辑坐标，None 表示整个矩形）
+        self.masks: Dict[str, list] = {}
+        self._dedup = FrameDeduplicator()
+        self._expression_names = None
+        # 已加载的帧裁剪时保留的边距；别名 -> 目标动作（重新加载时恢复）
+        self._padding = trim_padding(scale)
+        self._aliases: Dict[str, str] = {}
+        # 同一 QImage 只转换一次 QPixmap；同一 QPixmap 在每个 DPR 下只缩放一次
+        self._pixmaps: Dict[int, QPixmap] = {}
+        self._mask_cache: Dict[int, object] = {}
+        # DPR -> {"scaled": 动作名 -> 缩放帧, "cache": id(原始帧) -> 缩放帧}
+        self.dpr = 1.0
+        self._variants: Dict[float, dict] = {}
+
+    @property
+    def actions_path(self) -> str:
+        return os.path.join(self.assets_path, "actions")
+
+    def action_names(self) -> List[str]:
+        """动作目录列表（standby 排在最前）"""
+        if not os.path.exists(self.actions_path):
+            logger.warning("动作目录不存在: %s", self.actions_path)
+            return []
+        names = sorted(
+            name for name in os.listdir(self.actions_path)
+            if os.path.isdir(os.path.join(self.actions_path, name))
+        )
+        if "standby" in names:
+            names.remove("standby")
+            names.insert(0, "standby")
+        return names
+
+    # ===== 加载 =====
+
+    def load_action(self, name: str) -> bool:
+        """加载单个动作的全部帧并生成缩放缓存（已加载时直接返回）"""
+        if name in self.frames:
+            return True
+        processed = load_action_dir(os.path.join(self.actions_path, name), self._dedup, self._padding)
+        if processed is None:
+            return False
+        self._add(name, processed)
+        logger.debug("加载动作 '%s': %d 帧", name, len(processed.frames))
+        return True
+
+    def load_expressions(self) -> List[str]:
+        """加载表情包，动作名加前缀 'expr:'，返回表情动作名"""
+        if self._expression_names is not None:
+            return list(self._expression_names)
+        expr_path = os.path.join(self.assets_path, "expressions")
+        names = self._expression_names = []
+        if not os.path.exists(expr_path):
+            return []
+        for expr_name, processed in load_expressions_dir(expr_path, self._dedup, self._padding).items():
+            name = f"expr:{expr_name}"
+            self._add(name, processed)
+            names.append(name)
+            logger.debug("加载表情 '%s'", name)
+        return list(names)
+
+    def alias(self, name: str, target: str):
+        """让 name 直接使用 target 的帧（如缺少 standby 时）"""
+        self._aliases[name] = target
+        self.frames[name] = self.frames[target]
+        self.anchors[name] = self.anchors[target]
+        self._scale_action(name, self.dpr)
+
+    def _add(self, name: str, processed: ProcessedFrames):
+        pixmaps = []
+        for image in processed.frames:
+            pixmap = self._pixmaps.get(id(image))
+            if pixmap is None:
+                pixmap = self._pixmaps[id(image)] = QPixmap.fromImage(image)
+            pixmaps.append(pixmap)
+        self.frames[name] = pixmaps
+        self.anchors[name] = QPoint(*processed.anchor)
+        # 当前 DPR 在加载时（延后阶段的空闲时间片）即缩放好
+        self._scale_action(name, self.dpr)
+
+    def publish(self) -> bool:
+        """全部动作加载完成（进程内缓存无需发布，见 SharedFrameStore）"""
+        return False
+
+    def take_idle_jobs(self) -> List[Callable[[], object]]:
+        """取出需要在空闲时间片逐个执行的工作（进程内缓存没有，见 SharedFrameStore）"""
+        return []
+
+    # ===== 缩放 =====
+
+    def set_scale(self, scale: float):
+        """缩放比例变化：丢弃所有 DPR 的缓存，重新生成当前 DPR 的缩放帧与输入区域"""
+        if scale == self.scale and self._variants:
+            return  # 共用缓存的其他宠物已经处理过
+        self.scale = scale
+        self.masks.clear()
+        self._mask_cache.clear()
+        self._variants.clear()
+        padding = trim_padding(scale)
+        if any(new > old for new, old in zip(padding, self._padding)):
+            # 缩小后阴影在原图中占的像素更多，已加载的帧保留的边距不够
+            self._padding = padding
+            self._reload_frames()
+            return
+        logger.info("正在预处理缩放动画帧 (Scale: %s)...", scale)
+        for action in self.frames:
+            self._scale_action(action, self.dpr)
+
+    def _reload_frames(self):
+        """按新的裁剪边距重新读取已加载的动作与表情（加载时即按当前缩放比例缩放）"""
+        names = [name for name in self.frames if name not in self._aliases]
+        expressions = self._expression_names
+        for cache in (self.frames, self.anchors, self._pixmaps):
+            cache.clear()
+        self._dedup = FrameDeduplicator()
+        self._expression_names = None
+        logger.info("裁剪边距变化，重新加载 %d 个动作", len(names))
+        for name in names:
+            if expressions is None or name not in expressions:
+                self.load_action(name)
+        if expressions is not None:
+            self.load_expressions()
+        for name, target in self._aliases.items():
+            if target in self.frames:
+                self.alias(name, target)
+
+    def set_dpr(self, dpr: float):
+        """设置加载时预先缩放的 DPR（宠物所在屏幕）"""
+        self.dpr = normalize_dpr(dpr)
+
+    def retain_dprs(self, dprs: Iterable[float]):
+        """只保留当前连接的屏幕用到的 DPR 缓存"""
+        keep = {normalize_dpr(d) for d in dprs} | {self.dpr}
+        for dpr in list(self._variants):
+            if dpr not in keep:
+                del self._variants[dpr]
+                logger.debug("释放 DPR %s 的帧缓存", dpr)
+
+    def scaled_frames(self, action: str, dpr: float = None) -> List[QPixmap]:
+        """某个 DPR（默认 self.dpr）下的缩放帧，该 DPR 下第一次显示此动作时生成"""
+        dpr = self.dpr if dpr is None else dpr
+        frames = self._variant(dpr)["scaled"].get(action)
+        if frames is None and action in self.frames:
+            frames = self._scale_action(action, dpr)
+            if metrics.enabled:
+                CACHE_LOOKUPS.inc(cache="scaled_frames", result="miss")
+        elif frames is not None and metrics.enabled:
+            CACHE_LOOKUPS.inc(cache="scaled_frames", result="hit")
+        return frames or []
+
+    def scaled_anchor(self, action: str) -> QPoint:
+        anchor = self.anchors.get(action, QPoint())
+        return QPoint(int(anchor.x() * self.scale), int(anchor.y() * self.scale))
+
+    def _variant(self, dpr: float) -> dict:
+        variant = self._variants.get(dpr)
+        if variant is None:
+            variant = self._variants[dpr] = {"scaled": {}, "cache": {}}
+        return variant
+
+    def _logical_size(self, pixmap: QPixmap) -> QSize:
+        return QSize(int(pixmap.width() * self.scale), int(pixmap.height() * self.scale))
+
+    def _scale_action(self, action: str, dpr: float) -> List[QPixmap]:
+        """生成单个动作在某个 DPR 下的缩放缓存与输入区域 (性能优化，播放时不再计算)"""
+        scaled_list = []
+        mask_list = []
+        variant = self._variant(dpr)
+        cache = variant["cache"]
+        for pixmap in self.frames.get(action, []):
+            if pixmap.isNull():
+                continue
+            scaled_pixmap = cache.get(id(pixmap))
+            if scaled_pixmap is None:
+                logical = self._logical_size(pixmap)
+                scaled_pixmap = pixmap.scaled(
+                    logical * dpr,
+                    Qt.AspectRatioMode.KeepAspectRatio,
+                    Qt.TransformationMode.SmoothTransformation
+                )
+                scaled_pixmap.setDevicePixelRatio(dpr)
+                cache[id(pixmap)] = scaled_pixmap
+            scaled_list.append(scaled_pixmap)
+            mask_list.append(self._frame_mask(pixmap, scaled_pixmap))
+        variant["scaled"][action] = scaled_list
+        self.masks[action] = mask_list
+        return scaled_list
+
+    def _frame_mask(self, pixmap: QPixmap, scaled_pixmap: QPixmap):
+        """逻辑坐标下的输入区域，各 DPR 共用"""
+        key = id(pixmap)
+        if key not in self._mask_cache:
+            if scaled_pixmap.devicePixelRatio() != 1:
+                # 物理像素帧的掩码坐标与窗口不一致，按逻辑尺寸快速缩放一份计算
+                scaled_pixmap = pixmap.scaled(
+                    self._logical_size(pixmap),
+                    Qt.AspectRatioMode.KeepAspectRatio,
+                    Qt.TransformationMode.FastTransformation
+                )
+            self._mask_cache[key] = frame_input_region(scaled_pixmap)
+        return self._mask_cache[key]
@@ -0,0 +1,223 @@
+"""
+本地控制接口模块
+通过 Unix Socket 接收 JSON-RPC 2.0 请求（每行一个请求或批量数组），用于脚本化控制宠物。
+连接在后台线程处理：查询直接读取状态快照返回；命令排入队列，
+由排队信号在 GUI 线程批量执行，GUI 线程不会被客户端阻塞。
+"""
+
+import errno
+import inspect
+import json
+import os
+import socketserver
+import threading
+from collections import deque
+from typing import Callable, Dict
+
+from PyQt6.QtCore import QObject, pyqtSignal
+
+from .logger import get_logger
+from .metrics import remove_stale_socket
+
+logger = get_logger(__name__)
+
+DEFAULT_IPC = {
+    "enabled": False,
+    "socket": "",   # 留空时使用 $XDG_RUNTIME_DIR/digital-pet.sock
+}
+
+MAX_REQUEST_BYTES = 64 * 1024
+MAX_PENDING = 1000  # 队列上限，超出后拒绝新命令
+
+# JSON-RPC 错误码
+PARSE_ERROR = -32700
+INVALID_REQUEST = -32600
+METHOD_NOT_FOUND = -32601
+INVALID_PARAMS = -32602
+SERVER_BUSY = -32000
+
+
+def default_socket_path() -> str:
+    runtime_dir = os.environ.get("XDG_RUNTIME_DIR")
+    if runtime_dir:
+        return os.path.join(runtime_dir, "digital-pet.sock")
+    return os.path.join("/tmp", f"digital-pet-{os.getuid()}.sock")
+
+
+class IpcServer(QObject):
+    """JSON-RPC 控制服务"""
+
+    # 有新命令入队（跨线程发出，在 GUI 线程排队执行）
+    _commands_ready = pyqtSignal()
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self._commands: Dict[str, Callable] = {}
+        self._queries: Dict[str, Callable[[dict], object]] = {"ping": lambda params: "pong"}
+        self._snapshot: dict = {}
+        self._lock = threading.Lock()
+        self._pending = deque()
+        self._drain_scheduled = False
+        self._server = None
+        self._socket_path = None
+        self._commands_ready.connect(self._drain)
+
+    # ===== 注册 =====
+
+    def register_command(self, method: str, handler: Callable):
+        """注册命令：在 GUI 线程执行，客户端立即收到 {"queued": true}"""
+        self._commands[method] = handler
+
+    def register_query(self, method: str, handler: Callable[[dict], object]):
+        """注册查询：在连接线程执行，只能读取快照等线程安全的数据"""
+        self._queries[method] = handler
+
+    def update_snapshot(self, **fields):
+        """GUI 线程更新状态快照，查询在后台线程读取"""
+        with self._lock:
+            self._snapshot.update(fields)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return dict(self._snapshot)
+
+    # ===== 服务 =====
+
+    def start(self, settings: dict = None):
+        settings = {**DEFAULT_IPC, **(settings or {})}
+        self.stop()
+        if not settings["enabled"]:
+            return
+        path = settings["socket"] or default_socket_path()
+        try:
+            # 只清理上次异常退出残留的 socket 文件，不接管其他实例正在监听的 socket
+            remove_stale_socket(path)
+            self._server = _UnixServer(path, _RequestHandler)
+            os.chmod(path, 0o600)
+        except OSError as e:
+            if e.errno == errno.EADDRINUSE:
+                logger.warning("另一个实例正在使用控制接口 %s，本实例不启动控制接口", path)
+            else:
+                logger.warning("启动控制接口失败: %s", e)
+            self._server = None
+            return
+        self._server.ipc = self
+        self._socket_path = path
+        threading.Thread(target=self._server.serve_forever, name="IpcServer", daemon=True).start()
+        logger.info("控制接口已启动: %s", path)
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+        if self._socket_path and os.path.exists(self._socket_path):
+            os.remove(self._socket_path)
+        self._socket_path = None
+
+    # ===== 请求处理（连接线程） =====
+
+    def handle_payload(self, line: bytes):
+        """处理一行请求，返回应答对象（单个、数组或 None）"""
+        try:
+            request = json.loads(line)
+        except ValueError:
+            return _error_response(None, PARSE_ERROR, "Parse error")
+        if isinstance(request, list):
+            if not request:
+                return _error_response(None, INVALID_REQUEST, "Invalid Request")
+            responses = [r for r in (self._handle_request(item) for item in request) if r is not None]
+            return responses or None
+        return self._handle_request(request)
+
+    def _handle_request(self, request):
+        if not isinstance(request, dict) or not isinstance(request.get("method"), str):
+            return _error_response(None, INVALID_REQUEST, "Invalid Request")
+        request_id = request.get("id")
+        method = request["method"]
+        params = request.get("params") or {}
+        if not isinstance(params, dict):
+            return _error_response(request_id, INVALID_PARAMS, "params must be an object")
+
+        if method in self._queries:
+            try:
+                result = self._queries[method](params)
+            except Exception as e:
+                return _error_response(request_id, INVALID_PARAMS, str(e))
+        elif method in self._commands:
+            handler = self._commands[method]
+            try:
+                inspect.signature(handler).bind(**params)
+            except TypeError as e:
+                return _error_response(request_id, INVALID_PARAMS, str(e))
+            if not self._enqueue(method, handler, params):
+                return _error_response(request_id, SERVER_BUSY, "Too many pending commands")
+            result = {"queued": True}
+        else:
+            return _error_response(request_id, METHOD_NOT_FOUND, f"Method not found: {method}")
+
+        if "id" not in request:
+            return None  # 通知不需要应答
+        return {"jsonrpc": "2.0", "id": request_id, "result": result}
+
+    def _enqueue(self, method: str, handler: Callable, params: dict) -> bool:
+        with self._lock:
+            if len(self._pending) >= MAX_PENDING:
+                return False
+            self._pending.append((method, handler, params))
+            # 一次排队信号处理当前积压的全部命令
+            notify = not self._drain_scheduled
+            self._drain_scheduled = True
+        if notify:
+            self._commands_ready.emit()
+        return True
+
+    # ===== 命令执行（GUI 线程） =====
+
+    def _drain(self):
+        with self._lock:
+            batch = list(self._pending)
+            self._pending.clear()
+            self._drain_scheduled = False
+        for method, handler, params in batch:
+            try:
+                handler(**params)
+            except Exception as e:
+                logger.exception("执行控制命令 %s 失败: %s", method, e)
+        if len(batch) > 1:
+            logger.debug("批量执行了 %d 条控制命令", len(batch))
+
+
+def _error_response(request_id, code: int, message: str) -> dict:
+    return {"jsonrpc": "2.0", "id": request_id, "error": {"code": code, "message": message}}
+
+
+class _RequestHandler(socketserver.StreamRequestHandler):
+    """每个连接可连续发送多行请求"""
+
+    def handle(self):
+        ipc = self.server.ipc
+        while True:
+            line = self.rfile.readline(MAX_REQUEST_BYTES + 1)
+            if not line:
+                break
+            if len(line) > MAX_REQUEST_BYTES:
+                self._send(_error_response(None, INVALID_REQUEST, "Request too large"))
+                break
+            if not line.strip():
+                continue
+            response = ipc.handle_payload(line)
+            if response is not None:
+                self._send(response)
+
+    def _send(self, response):
+        data = json.dumps(response, ensure_ascii=False, separators=(',', ':')) + "\n"
+        try:
+            self.wfile.write(data.encode("utf-8"))
+            self.wfile.flush()
+        except OSError:
+            pass
+
+
+class _UnixServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
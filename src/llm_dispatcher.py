@@ -0,0 +1,79 @@
+"""
+LLM 请求调度模块
+所有宠物的 ChatWorker 都经过同一个调度器启动：
+- 限制同时进行的请求数（config["llm_dispatch"]["max_concurrent"]）；
+- 每只宠物一个先进先出队列，空出名额时在宠物之间轮流取请求，
+  一只宠物连续触发多次思考也不会让其他宠物一直等待。
+"""
+
+from collections import deque
+from typing import Dict
+
+from PyQt6.QtCore import QObject
+
+from .logger import get_logger
+
+logger = get_logger(__name__)
+
+DEFAULT_DISPATCH = {
+    "max_concurrent": 2,
+}
+
+
+class LlmDispatcher(QObject):
+    """ChatWorker 的公平调度器（只在 GUI 线程调用）"""
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.settings = dict(DEFAULT_DISPATCH)
+        self._queues: Dict[object, deque] = {}
+        self._order = deque()   # 有排队请求的宠物，按轮转顺序
+        self._running = set()
+
+    def configure(self, settings: dict = None):
+        self.settings = {**DEFAULT_DISPATCH, **(settings or {})}
+        self._pump()
+
+    def submit(self, owner, worker):
+        """提交一个尚未启动的 ChatWorker，owner 通常是宠物本身"""
+        queue = self._queues.setdefault(owner, deque())
+        queue.append(worker)
+        if owner not in self._order:
+            self._order.append(owner)
+        # 槽属于调度器（GUI 线程），工作线程结束时自动排队回到 GUI 线程执行
+        worker.finished.connect(self._on_worker_finished)
+        self._pump()
+        if not worker.isRunning():
+            logger.debug("LLM 请求排队中（进行中 %d，排队 %d）", len(self._running), self.pending_count())
+
+    def pending_count(self, owner=None) -> int:
+        if owner is not None:
+            return len(self._queues.get(owner, ()))
+        return sum(len(queue) for queue in self._queues.values())
+
+    def cancel(self, owner):
+        """丢弃宠物尚未开始的请求（宠物关闭时）"""
+        self._queues.pop(owner, None)
+        if owner in self._order:
+            self._order.remove(owner)
+
+    def _pump(self):
+        limit = max(1, int(self.settings["max_concurrent"]))
+        while len(self._running) < limit and self._order:
+            owner = self._order.popleft()
+            queue = self._queues[owner]
+            worker = queue.popleft()
+            if queue:
+                self._order.append(owner)  # 还有请求，排到队尾等下一轮
+            else:
+                del self._queues[owner]
+            self._running.add(worker)
+            worker.start()
+
+    def _on_worker_finished(self):
+        self._running.discard(self.sender())
+        self._pump()
+
+
+# Global instance for easy access
+llm_dispatcher = LlmDispatcher()
@@ -1,10 +1,106 @@
+import atexit
+import gzip
 import logging
-import sys
+import logging.handlers
 import os
+import queue
+import shutil
+import sys
+import time
+
+# 后台写日志线程（QueueListener），在 setup_logging 中创建
+_listener = None
+
+
+def _stop_listener():
+    """退出时停止后台线程，确保队列中的日志全部落盘"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+# 日志行开头的时间格式（与 setup_logging 中的 datefmt 一致）
+LOG_DATE_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+# 默认日志参数（可通过 config["logging"] 覆盖）
+DEFAULT_LOGGING = {
+    "level": "INFO",            # 根日志级别
+    "levels": {},               # 按模块设置级别，如 {"src.tools": "DEBUG"}
+    "max_bytes": 2 * 1024 * 1024,  # 单个日志文件上限
+    "backup_count": 5,          # 保留的压缩归档数量
+    "max_age_hours": 24         # 日志文件最长使用时间，超过后轮转（0 表示只按大小轮转）
+}
+
+
+def _gzip_rotator(source, dest):
+    """轮转时将旧日志压缩为 .gz"""
+    with open(source, 'rb') as f_in, gzip.open(dest, 'wb') as f_out:
+        shutil.copyfileobj(f_in, f_out)
+    os.remove(source)
+
+
+def _log_line_time(line: str):
+    """日志行开头的时间戳，无法解析时返回 None"""
+    try:
+        return time.mktime(time.strptime(line[:19], LOG_DATE_FORMAT))
+    except (ValueError, OverflowError):
+        return None
+
+
+class CompressingRotatingFileHandler(logging.handlers.RotatingFileHandler):
+    """按大小或时间轮转的文件处理器，旧日志压缩保存，磁盘占用有上限"""
+
+    def __init__(self, filename, max_bytes, backup_count, max_age_seconds, line_time=_log_line_time):
+        super().__init__(filename, maxBytes=max_bytes, backupCount=backup_count,
+                         encoding='utf-8', delay=True)
+        self.max_age_seconds = max_age_seconds
+        # 从一行记录中解析时间戳（判断已有文件的年龄）
+        self.line_time = line_time
+        self._opened_at = self._started_at()
+        self.namer = lambda name: name + ".gz"
+        self.rotator = _gzip_rotator
+
+    def _started_at(self) -> float:
+        """
+        当前文件开始写入的时间：重启后继续写同一个文件时按文件本身计时，不会重新开始。
+        取第一条记录的时间戳，无法解析时取文件的修改时间；文件不存在时为现在。
+        """
+        try:
+            mtime = os.path.getmtime(self.baseFilename)
+            with open(self.baseFilename, 'r', encoding='utf-8', errors='replace') as f:
+                first = f.readline()
+        except OSError:
+            return time.time()
+        started = self.line_time(first) if first else None
+        return min(started, mtime) if started is not None else mtime
+
+    def shouldRollover(self, record):
+        if self.max_age_seconds and time.time() - self._opened_at >= self.max_age_seconds:
+            return True
+        return super().shouldRollover(record)
+
+    def doRollover(self):
+        super().doRollover()
+        self._opened_at = time.time()
+
+
+class DeferredQueueHandler(logging.handlers.QueueHandler):
+    """
+    只把日志记录放入队列的处理器。
+    同进程内的队列无需序列化，格式化和磁盘写入全部延迟到后台线程完成。
+    """
+
+    def prepare(self, record):
+        return record
+
+
+def setup_logging(log_file="pet.log", settings: dict = None):
+    """配置全局日志系统（队列 + 后台写线程 + 压缩轮转），并将标准输出重定向到日志文件"""
+    global _listener
+
+    options = dict(DEFAULT_LOGGING)
+    options.update(settings or {})
 
-def setup_logging(log_file="pet.log"):
-    """配置全局日志系统，并将标准输出重定向到日志文件"""
-    
     # 获取日志文件的绝对路径（放在项目根目录）
     project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
     log_path = os.path.join(project_root, log_file)
@@ -12,17 +108,35 @@ def setup_logging(log_file="pet.log"):
     # 创建日志格式
     log_format = logging.Formatter(
         '%(asctime)s [%(levelname)s] %(name)s: %(message)s',
-        datefmt='%Y-%m-%d %H:%M:%S'
+        datefmt=LOG_DATE_FORMAT
     )
 
-    # 文件处理器
-    file_handler = logging.FileHandler(log_path, encoding='utf-8')
+    # 文件处理器：在后台线程中格式化并写入
+    file_handler = CompressingRotatingFileHandler(
+        log_path,
+        max_bytes=int(options['max_bytes']),
+        backup_count=int(options['backup_count']),
+        max_age_seconds=float(options['max_age_hours']) * 3600
+    )
     file_handler.setFormatter(log_format)
 
-    # 根日志记录器
+    if _listener is None:
+        atexit.register(_stop_listener)
+    else:
+        _listener.stop()
+    log_queue = queue.SimpleQueue()
+    _listener = logging.handlers.QueueListener(log_queue, file_handler, respect_handler_level=True)
+    _listener.start()
+
+    # 根日志记录器：GUI 线程上只做一次入队
     root_logger = logging.getLogger()
-    root_logger.setLevel(logging.INFO)
-    root_logger.addHandler(file_handler)
+    for handler in list(root_logger.handlers):
+        if isinstance(handler, DeferredQueueHandler):
+            root_logger.removeHandler(handler)
+    root_logger.addHandler(DeferredQueueHandler(log_queue))
+
+    # 按模块设置日志级别
+    apply_levels(options)
 
     # 为了将 print 语句也捕获到日志中，我们可以自定义一个流对象来重定向 sys.stdout/stderr
     class StreamToLogger:
@@ -32,6 +146,9 @@ def setup_logging(log_file="pet.log"):
             self.linebuf = ''
 
         def write(self, buf):
+            # 级别被禁用时直接丢弃，不做任何字符串处理
+            if not self.logger.isEnabledFor(self.level):
+                return
             for line in buf.rstrip().splitlines():
                 self.logger.log(self.level, line.rstrip())
 
@@ -41,8 +158,21 @@ def setup_logging(log_file="pet.log"):
     sys.stdout = StreamToLogger(logging.getLogger('STDOUT'), logging.INFO)
     sys.stderr = StreamToLogger(logging.getLogger('STDERR'), logging.ERROR)
 
-    logging.info(f"--- 日志系统初始化成功，日志文件：{log_path} ---")
+    logging.info("--- 日志系统初始化成功，日志文件：%s ---", log_path)
+
+def apply_levels(settings: dict):
+    """应用根日志级别与按模块的日志级别（配置热更新时也会调用）"""
+    options = dict(DEFAULT_LOGGING)
+    options.update(settings or {})
+    logging.getLogger().setLevel(str(options['level']).upper())
+    for name, level in (options.get('levels') or {}).items():
+        logging.getLogger(name).setLevel(str(level).upper())
 
 # 获取各模块使用的 logger
+def queue_depth() -> int:
+    """等待后台线程写入的日志条数"""
+    return _listener.queue.qsize() if _listener is not None else 0
+
+
 def get_logger(name):
     return logging.getLogger(name)
@@ -10,21 +10,35 @@
 - 可拖拽、可交互
 """
 
+import time
+_START_TIME = time.perf_counter()
+
 import sys
 import os
-import json
 
 # 添加项目根目录到 Python 路径
 PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 if PROJECT_ROOT not in sys.path:
     sys.path.insert(0, PROJECT_ROOT)
 
+# --profile-startup：在导入 PyQt 与其他模块之前开始记录导入耗时
+from src.startup_profiler import startup_profiler
+if "--profile-startup" in sys.argv:
+    startup_profiler.install(_START_TIME)
+
 from PyQt6.QtWidgets import QApplication, QSystemTrayIcon, QMenu
 from PyQt6.QtGui import QIcon, QAction
 from PyQt6.QtCore import Qt
 
 from src.pet_widget import PetWidget
+from src.chat_bubble import PRIORITY_LOW
+from src.overlay_surface import OverlaySurface, RENDER_OVERLAY
 from src.logger import setup_logging
+from src.tracing import tracer
+from src.metrics import metrics
+from src.config_service import ConfigService
+from src.pet_group import PetGroup, pet_entries
+from src.llm_dispatcher import llm_dispatcher
 
 
 def get_config_path() -> str:
@@ -32,48 +46,23 @@ def get_config_path() -> str:
     return os.path.join(PROJECT_ROOT, "config.json")
 
 
-def load_config() -> dict:
-    """加载配置"""
-    config_path = get_config_path()
-    default_config = {
-        "api_key": "YOUR_API_KEY_HERE",
-        "model": "glm-4.6",
-        "api_endpoint": "https://open.bigmodel.cn/api/paas/v4/chat/completions",
-        "system_prompt": "你是一个可爱的桌面宠物助手，性格温柔、活泼、乐于助人。请用简短、可爱的语气回复用户，回复控制在50字以内。",
-        "animation_interval": 150,
-        "pet_scale": 0.5
-    }
-    
-    if os.path.exists(config_path):
-        try:
-            with open(config_path, 'r', encoding='utf-8') as f:
-                config = json.load(f)
-                # 合并默认配置（补充缺失的键）
-                for key, value in default_config.items():
-                    if key not in config:
-                        config[key] = value
-                return config
-        except Exception as e:
-            print(f"加载配置失败: {e}")
-    
-    # 创建默认配置文件
-    try:
-        with open(config_path, 'w', encoding='utf-8') as f:
-            json.dump(default_config, f, ensure_ascii=False, indent=4)
-    except Exception as e:
-        print(f"创建配置文件失败: {e}")
-    
-    return default_config
-
-
 def get_assets_path() -> str:
     """获取资源目录路径"""
     return os.path.join(PROJECT_ROOT, "assets")
 
 
-def setup_tray_icon(app: QApplication, pet_widget: PetWidget) -> QSystemTrayIcon:
-    """设置系统托盘图标"""
+def setup_tray_icon(app: QApplication, group: PetGroup) -> QSystemTrayIcon:
+    """设置系统托盘图标（显示/隐藏作用于所有宠物，其余操作作用于第一只宠物）"""
     tray = QSystemTrayIcon()
+    pet_widget = group.primary
+
+    def show_all():
+        for pet in group.pets:
+            pet.show()
+
+    def hide_all():
+        for pet in group.pets:
+            pet.hide()
     
     # 尝试加载图标
     icon_path = os.path.join(get_assets_path(), "expressions", "icon")
@@ -91,9 +80,10 @@ def setup_tray_icon(app: QApplication, pet_widget: PetWidget) -> QSystemTrayIcon
         # 使用默认图标（从第一帧动画获取）
         if pet_widget.animation_frames:
             first_action = list(pet_widget.animation_frames.keys())[0]
-            if pet_widget.animation_frames[first_action]:
-                first_frame = pet_widget.animation_frames[first_action][0]
-                tray.setIcon(QIcon(first_frame))
+            # 使用缩放帧（共享帧缓存模式下原始帧是 QImage）
+            frames = pet_widget.frame_store.scaled_frames(first_action)
+            if frames:
+                tray.setIcon(QIcon(frames[0]))
     
     tray.setToolTip("桌面宠物 🐾")
     
@@ -101,17 +91,17 @@ def setup_tray_icon(app: QApplication, pet_widget: PetWidget) -> QSystemTrayIcon
     tray_menu = QMenu()
     
     show_action = QAction("显示宠物", tray_menu)
-    show_action.triggered.connect(pet_widget.show)
+    show_action.triggered.connect(show_all)
     tray_menu.addAction(show_action)
     
     hide_action = QAction("隐藏宠物", tray_menu)
-    hide_action.triggered.connect(pet_widget.hide)
+    hide_action.triggered.connect(hide_all)
     tray_menu.addAction(hide_action)
     
     tray_menu.addSeparator()
     
     think_action = QAction("强制思考 💭", tray_menu)
-    think_action.triggered.connect(pet_widget.send_brain_message)
+    think_action.triggered.connect(lambda: pet_widget.send_brain_message())
     tray_menu.addAction(think_action)
     
     settings_action = QAction("设置", tray_menu)
@@ -125,7 +115,7 @@ def setup_tray_icon(app: QApplication, pet_widget: PetWidget) -> QSystemTrayIcon
     tray_menu.addAction(quit_action)
     
     tray.setContextMenu(tray_menu)
-    tray.activated.connect(lambda reason: pet_widget.show() if reason == QSystemTrayIcon.ActivationReason.DoubleClick else None)
+    tray.activated.connect(lambda reason: show_all() if reason == QSystemTrayIcon.ActivationReason.DoubleClick else None)
     
     return tray
 
@@ -135,17 +125,27 @@ def main():
     # 启用高 DPI 缩放
     # PyQt6 默认启用高 DPI 支持
     
-    # 初始化日志系统
-    setup_logging("pet.log")
+    # 加载配置
+    config_path = get_config_path()
+    config_service = ConfigService(config_path)
+    config = config_service.load()
+    
+    # 初始化日志系统（后台线程写入，按配置轮转与分模块设置级别）
+    setup_logging("pet.log", config.get('logging'))
+    tracing = config.get('tracing', {})
+    tracer.configure(tracing.get('enabled', False), settings=tracing)
+    metrics.configure(config.get('metrics'))
+    llm_dispatcher.configure(config.get('llm_dispatch'))
     
     # 创建应用
     app = QApplication(sys.argv)
     app.setApplicationName("桌面宠物")
     app.setQuitOnLastWindowClosed(False)  # 关闭窗口不退出应用
+    startup_profiler.mark("QApplication")
+    
+    # 监听配置文件的外部修改（如集中下发的配置），无需重启即可生效
+    config_service.watch()
     
-    # 加载配置
-    config = load_config()
-    config_path = get_config_path()
     assets_path = get_assets_path()
     
     # 检查资源目录
@@ -154,17 +154,41 @@ def main():
         print("请确保 assets/actions 目录包含宠物动画帧图片")
         sys.exit(1)
     
-    # 创建宠物窗口
-    pet = PetWidget(assets_path, config, config_path)
-    pet.show()
-    
-    # 设置系统托盘
-    tray = setup_tray_icon(app, pet)
-    tray.show()
+    # 创建宠物窗口；overlay 模式下宠物与气泡合成到同一个透明覆盖层
+    surface = None
+    if config.get('render_mode') == RENDER_OVERLAY:
+        surface = OverlaySurface()
+        surface.show()
+    # 多只宠物（config["pets"]）共用帧缓存、动画时钟、传感器与 LLM 调度
+    group = PetGroup()
+    for index, entry in enumerate(pet_entries(config, assets_path)):
+        group.add(PetWidget(entry["assets"], config, config_path, config_service=config_service,
+                            surface=surface, group=group, name=entry["name"], index=index))
+    pet = group.primary
+    startup_profiler.mark("PetWidget 构建")
+    
+    # 系统托盘在首帧之后创建，不占用首帧前的时间
+    tray_holder = []
+    
+    def on_first_frame():
+        startup_profiler.mark("首帧")
+        tray = setup_tray_icon(app, group)
+        tray.show()
+        tray_holder.append(tray)  # 保持引用，防止托盘被回收
+        startup_profiler.mark("托盘")
+    
+    def on_startup_completed():
+        startup_profiler.mark("空闲阶段完成")
+        startup_profiler.finish()
+    
+    pet.first_frame_painted.connect(on_first_frame)
+    pet.startup_completed.connect(on_startup_completed)
+    for member in group.pets:
+        member.show()
     
     # 显示欢迎消息
     from PyQt6.QtCore import QTimer
-    QTimer.singleShot(500, lambda: pet._show_bubble("你好呀！我是你的桌面宠物~ 以后我会自己说话啦，你可以右键点击我来互动哦！", duration=5000))
+    QTimer.singleShot(500, lambda: pet._show_bubble("你好呀！我是你的桌面宠物~ 以后我会自己说话啦，你可以右键点击我来互动哦！", duration=5000, priority=PRIORITY_LOW))
     
     # 运行应用
     sys.exit(app.exec())
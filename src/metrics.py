@@ -0,0 +1,341 @@
+"""
+运行指标模块
+以 Prometheus 文本格式导出宠物的运行指标（动画帧、LLM 请求延迟、工具耗时、token 用量、
+进程 CPU/内存、各后台队列深度、各缓存的命中与未命中次数），通过本地 Unix Socket 或 127.0.0.1 端口供本机采集器抓取。
+关闭时调用方通过 `if metrics.enabled:` 跳过记录，没有任何开销。
+"""
+
+import bisect
+import errno
+import os
+import socket
+import stat
+import threading
+from typing import Callable, Dict, List, Tuple
+
+from .logger import get_logger
+
+logger = get_logger(__name__)
+
+DEFAULT_METRICS = {
+    "enabled": False,
+    "socket": "",       # Unix Socket 路径，留空时使用 $XDG_RUNTIME_DIR/digital-pet-metrics.sock
+    "port": 0,          # 大于 0 时改为监听 127.0.0.1:port
+}
+
+# 延迟类直方图的默认分桶（秒）
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+
+def _format_labels(names: Tuple[str, ...], values: Tuple[str, ...], extra: str = "") -> str:
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _label_value(value) -> str:
+    return ("true" if value else "false") if isinstance(value, bool) else str(value)
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help_text: str, labels: Tuple[str, ...] = ()):
+        self.name = name
+        self.help = help_text
+        self.label_names = tuple(labels)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: dict) -> tuple:
+        return tuple(_label_value(labels.get(n, "")) for n in self.label_names)
+
+    def header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    """只增不减的计数器"""
+    kind = "counter"
+
+    def __init__(self, name, help_text, labels=()):
+        super().__init__(name, help_text, labels)
+        self._values: Dict[tuple, float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self) -> List[str]:
+        with self._lock:
+            items = list(self._values.items())
+        return [f"{self.name}{_format_labels(self.label_names, k)} {_format_value(v)}" for k, v in items]
+
+
+class Gauge(_Metric):
+    """可任意设置的瞬时值"""
+    kind = "gauge"
+
+    def __init__(self, name, help_text, labels=()):
+        super().__init__(name, help_text, labels)
+        self._values: Dict[tuple, float] = {}
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def render(self) -> List[str]:
+        with self._lock:
+            items = list(self._values.items())
+        return [f"{self.name}{_format_labels(self.label_names, k)} {_format_value(v)}" for k, v in items]
+
+
+class Histogram(_Metric):
+    """分桶直方图（累计分桶在导出时计算）"""
+    kind = "histogram"
+
+    def __init__(self, name, help_text, labels=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help_text, labels)
+        self.buckets = tuple(sorted(buckets))
+        # key -> [各桶计数..., +Inf 桶计数, sum]
+        self._values: Dict[tuple, list] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            data = self._values.get(key)
+            if data is None:
+                data = self._values[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            data[index] += 1
+            data[-1] += value
+
+    def render(self) -> List[str]:
+        with self._lock:
+            items = [(k, list(v)) for k, v in self._values.items()]
+        lines = []
+        for key, data in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), data[:-1]):
+                cumulative += count
+                labels = _format_labels(self.label_names, key, f'le="{_format_value(bound)}"')
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.label_names, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(data[-1])}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+class MetricsRegistry:
+    """指标注册表与导出服务"""
+
+    def __init__(self):
+        self.enabled = False
+        self.settings = dict(DEFAULT_METRICS)
+        self._metrics: List[_Metric] = []
+        # 抓取时才执行的采集回调（进程资源、队列深度等），平时没有开销
+        self._collectors: List[Callable[[], None]] = []
+        self._server = None
+        self._socket_path = None
+
+    def counter(self, name, help_text, labels=()) -> Counter:
+        return self._add(Counter(name, help_text, labels))
+
+    def gauge(self, name, help_text, labels=()) -> Gauge:
+        return self._add(Gauge(name, help_text, labels))
+
+    def histogram(self, name, help_text, labels=(), buckets=LATENCY_BUCKETS) -> Histogram:
+        return self._add(Histogram(name, help_text, labels, buckets))
+
+    def _add(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def add_collector(self, callback: Callable[[], None]):
+        self._collectors.append(callback)
+
+    def render(self) -> str:
+        for collect in self._collectors:
+            try:
+                collect()
+            except Exception as e:
+                logger.debug("采集指标失败: %s", e)
+        lines = []
+        for metric in self._metrics:
+            samples = metric.render()
+            if samples:
+                lines.extend(metric.header())
+                lines.extend(samples)
+        return "\n".join(lines) + "\n"
+
+    # ===== 导出服务 =====
+
+    def configure(self, settings: dict = None):
+        """按配置启动或停止导出服务"""
+        new_settings = {**DEFAULT_METRICS, **(settings or {})}
+        if new_settings == self.settings and (self._server is not None) == bool(new_settings["enabled"]):
+            return
+        self.settings = new_settings
+        self.stop()
+        self.enabled = bool(self.settings["enabled"])
+        if self.enabled:
+            try:
+                self._start_server()
+            except OSError as e:
+                self.enabled = False
+                logger.warning("启动指标服务失败: %s", e)
+
+    def _start_server(self):
+        tcp_server, unix_server, handler = _server_classes()
+        if self.settings["port"]:
+            self._server = tcp_server(("127.0.0.1", int(self.settings["port"])), handler)
+            where = f"127.0.0.1:{self.settings['port']}"
+        else:
+            path = self.settings["socket"] or default_socket_path()
+            remove_stale_socket(path)
+            self._server = unix_server(path, handler)
+            os.chmod(path, 0o600)
+            self._socket_path = path
+            where = path
+        self._server.registry = self
+        threading.Thread(target=self._server.serve_forever, name="MetricsServer", daemon=True).start()
+        logger.info("指标服务已启动: %s", where)
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+        if self._socket_path and os.path.exists(self._socket_path):
+            os.remove(self._socket_path)
+        self._socket_path = None
+        self.enabled = False
+
+
+def default_socket_path() -> str:
+    runtime_dir = os.environ.get("XDG_RUNTIME_DIR")
+    if runtime_dir:
+        return os.path.join(runtime_dir, "digital-pet-metrics.sock")
+    return os.path.join("/tmp", f"digital-pet-metrics-{os.getuid()}.sock")
+
+
+def remove_stale_socket(path: str):
+    """清理上次异常退出残留的 socket 文件；路径不是 socket 或仍有进程在监听时不删除，抛出 OSError"""
+    try:
+        mode = os.lstat(path).st_mode
+    except FileNotFoundError:
+        return
+    if not stat.S_ISSOCK(mode):
+        raise OSError(errno.EEXIST, "路径已存在且不是 socket", path)
+    probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    probe.settimeout(1)
+    try:
+        probe.connect(path)
+    except (ConnectionRefusedError, FileNotFoundError):
+        # 没有进程在监听
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        return
+    finally:
+        probe.close()
+    raise OSError(errno.EADDRINUSE, "另一个进程正在使用该 socket", path)
+
+
+def _server_classes():
+    """HTTP 服务类（http.server 只在启用时导入）"""
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn, UnixStreamServer
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] not in ("/", "/metrics"):
+                self.send_error(404)
+                return
+            body = self.server.registry.render().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def address_string(self):
+            # Unix Socket 连接没有客户端地址
+            return self.client_address[0] if self.client_address else "unix"
+
+        def log_message(self, format, *args):
+            pass
+
+    class ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+        daemon_threads = True
+
+    class UnixHTTPServer(ThreadingMixIn, UnixStreamServer):
+        daemon_threads = True
+
+    return ThreadingHTTPServer, UnixHTTPServer, MetricsHandler
+
+
+# Global instance for easy access
+metrics = MetricsRegistry()
+
+# ===== 指标定义 =====
+# 记录方需先判断 metrics.enabled
+
+ANIMATION_TICKS = metrics.counter("pet_animation_ticks_total", "Animation frame ticks")
+ANIMATION_TICK_SECONDS = metrics.histogram(
+    "pet_animation_tick_seconds", "Time spent handling one animation tick",
+    buckets=(0.0005, 0.001, 0.002, 0.004, 0.008, 0.016, 0.033, 0.1)
+)
+LLM_TURN_SECONDS = metrics.histogram(
+    "pet_llm_turn_seconds", "End-to-end LLM turn latency", labels=("trigger", "ok")
+)
+LLM_HTTP_SECONDS = metrics.histogram(
+    "pet_llm_http_seconds", "Latency of a single LLM HTTP request", labels=("status",)
+)
+LLM_TOKENS = metrics.counter("pet_llm_tokens_total", "LLM tokens used", labels=("kind",))
+TOOL_CALL_SECONDS = metrics.histogram("pet_tool_call_seconds", "Tool call latency", labels=("tool",))
+TOOL_ERRORS = metrics.counter("pet_tool_errors_total", "Tool calls that returned an error", labels=("tool",))
+TOOL_PREFETCHES = metrics.counter("pet_tool_prefetches_total", "Tool results inlined into the prompt", labels=("tool",))
+TOOL_PREFETCH_REDUNDANT = metrics.counter(
+    "pet_tool_prefetch_redundant_total", "Model calls to tools whose result was already inlined", labels=("tool",)
+)
+PROCESS_RSS = metrics.gauge("pet_process_resident_memory_bytes", "Resident memory of the pet process")
+PROCESS_CPU = metrics.gauge("pet_process_cpu_percent", "CPU usage of the pet process")
+QUEUE_DEPTH = metrics.gauge("pet_queue_depth", "Pending items in background queues", labels=("queue",))
+# 命中率 = hit / (hit + miss)；cache 为 scaled_frames、shared_segment、shared_display、speculation
+CACHE_LOOKUPS = metrics.counter(
+    "pet_cache_lookups_total", "Cache lookups by cache and result (hit/miss)", labels=("cache", "result")
+)
+
+
+_process = None
+
+
+def _collect_runtime():
+    """抓取时采集进程资源与后台队列深度"""
+    global _process
+    from .tracing import tracer
+    from .logger import queue_depth
+    QUEUE_DEPTH.set(tracer.queue_depth(), queue="trace")
+    QUEUE_DEPTH.set(queue_depth(), queue="log")
+
+    import psutil
+    if _process is None:
+        _process = psutil.Process()
+    PROCESS_RSS.set(_process.memory_info().rss)
+    PROCESS_CPU.set(_process.cpu_percent())
+
+
+metrics.add_collector(_collect_runtime)
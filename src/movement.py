@@ -0,0 +1,316 @@
+"""
+移动引擎模块
+宠物行走改为按速度（像素/秒）移动：浮点位置累积亚像素位移，只有整数坐标变化时才移动窗口；
+所有宠物的移动引擎共用一个精确定时器（MovementScheduler），每次唤醒批量更新全部正在行走的宠物，
+频率不超过屏幕刷新率与配置上限，与动画帧率无关；
+屏幕几何信息缓存起来，只在屏幕增删或几何变化时刷新。
+拖放到窗口标题栏附近时站到标题栏上（窗口几何来自 desktop_geometry 的空间索引），
+在标题栏可见部分的两端转身，窗口移动时跟随，窗口关闭或被遮住时回到地面。
+"""
+
+import time
+from typing import Callable, List
+
+from PyQt6.QtCore import QObject, QTimer, QPoint, QRect, Qt, pyqtSignal
+from PyQt6.QtGui import QGuiApplication
+
+from .desktop_geometry import desktop_geometry
+from .logger import get_logger
+
+logger = get_logger(__name__)
+
+DEFAULT_MOVEMENT = {
+    "speed": 80,       # 行走速度（像素/秒），与旧版每 250ms 移动 20px 相同
+    "max_fps": 60,     # 移动更新频率上限
+    "window_surfaces": True,  # 拖放到窗口标题栏附近时站在上面
+    "snap_distance": 24,      # 脚下与标题栏相距多少像素以内算落在上面
+}
+
+# 左侧保留的边距（与旧版行走逻辑一致）
+LEFT_MARGIN = 100
+
+
+class MovementEngine(QObject):
+    """驱动窗口（或覆盖层中的子控件）按速度平滑移动"""
+
+    # 碰到边界："left" / "right"
+    boundary_hit = pyqtSignal(str)
+
+    def __init__(self, widget, settings: dict = None, to_local: Callable[[QPoint], QPoint] = None, parent=None):
+        super().__init__(parent)
+        self.widget = widget
+        self.settings = {**DEFAULT_MOVEMENT, **(settings or {})}
+        # 全局坐标 -> widget.move() 坐标的转换（覆盖层模式下相对覆盖层）
+        self._to_local = to_local or (lambda point: point)
+        self.velocity = 0.0
+        self._x = float(widget.x())
+        self._last_pos = widget.pos()
+        self._bounds = QRect()
+        self.interval_ms = 16
+        # 省电策略临时施加的频率上限（None 表示不限制）与暂停标记
+        self.fps_cap = None
+        self._paused = False
+        self._scheduler = movement_scheduler
+        # 站立的窗口（None 表示地面）及其上一次的矩形；地面高度为最近一次落在地面时的 y
+        self.surface = None
+        self._surface_rect = None
+        self._floor_y = widget.y()
+        desktop_geometry.windows_changed.connect(self._on_windows_changed)
+
+        self._watched_screens = set()
+        app = QGuiApplication.instance()
+        app.screenAdded.connect(self._on_screens_changed)
+        app.screenRemoved.connect(self._on_screens_changed)
+        self._on_screens_changed()
+
+    # ===== 屏幕几何缓存 =====
+
+    def _on_screens_changed(self, *_args):
+        for screen in QGuiApplication.screens():
+            if screen not in self._watched_screens:
+                self._watched_screens.add(screen)
+                screen.geometryChanged.connect(self.refresh_geometry)
+                screen.refreshRateChanged.connect(self.refresh_geometry)
+        self._watched_screens &= set(QGuiApplication.screens())
+        self.refresh_geometry()
+
+    def refresh_geometry(self, *_args):
+        """重新读取宠物所在屏幕的几何与刷新率（仅在屏幕变化时调用）"""
+        screen = self.widget.screen() or QGuiApplication.primaryScreen()
+        if screen is None:
+            return
+        geometry = screen.geometry()
+        self._bounds = QRect(self._to_local(geometry.topLeft()), geometry.size())
+        refresh_rate = screen.refreshRate() or 60
+        fps = min(refresh_rate, self.settings["max_fps"])
+        if self.fps_cap:
+            fps = min(fps, self.fps_cap)
+        fps = max(1, fps)
+        self.interval_ms = max(1, int(1000 / fps))
+        self._scheduler.engine_changed(self)
+
+    def update_config(self, settings: dict = None):
+        self.settings = {**DEFAULT_MOVEMENT, **(settings or {})}
+        self.refresh_geometry()
+
+    def set_fps_cap(self, fps_cap=None):
+        """限制移动更新频率（省电策略使用电池时调用）"""
+        if fps_cap != self.fps_cap:
+            self.fps_cap = fps_cap
+            self.refresh_geometry()
+
+    # ===== 控制 =====
+
+    def set_direction(self, direction: int):
+        """direction: -1 向左，1 向右，0 停止"""
+        self.set_velocity(direction * float(self.settings["speed"]))
+
+    def set_velocity(self, velocity: float):
+        self.velocity = velocity
+        if self._paused:
+            return
+        if velocity and not self.active:
+            # 开始行走时顺便刷新一次（宠物可能已被拖到其他屏幕）
+            self.refresh_geometry()
+            self._sync()
+            self._scheduler.add(self)
+        elif not velocity:
+            self._scheduler.remove(self)
+        else:
+            self._scheduler.engine_changed(self)
+
+    def pause(self):
+        """暂停移动（保留速度，resume 后继续）"""
+        self._paused = True
+        self._scheduler.remove(self)
+
+    def resume(self):
+        self._paused = False
+        if self.velocity and not self.active:
+            self._sync()
+            self._scheduler.add(self)
+
+    @property
+    def active(self) -> bool:
+        return self._scheduler.contains(self)
+
+    def _sync(self):
+        """窗口被拖动等外部原因移动后，从实际位置重新开始累积"""
+        pos = self.widget.pos()
+        if pos != self._last_pos:
+            self._x = float(pos.x())
+            self._last_pos = pos
+
+    def limits(self):
+        """当前可行走的 x 范围（宽度随动作帧变化，每次更新时读取）；站在窗口上时限制在标题栏可见部分内"""
+        left, right = self._bounds.left() + LEFT_MARGIN, self._bounds.right() + 1 - self.widget.width()
+        if self.surface is None:
+            return left, right
+        segment = desktop_geometry.segment_at(self.surface, self._foot().x())
+        if segment is None:
+            self._fall()
+            return left, right
+        offset = self._origin().x() - self.widget.width() // 2
+        return max(left, segment[0] + offset), min(right, segment[1] - 1 + offset)
+
+    # ===== 窗口标题栏 =====
+
+    def _origin(self) -> QPoint:
+        """全局坐标原点在 move() 坐标系中的位置（覆盖层模式下不为零）"""
+        return self._to_local(QPoint(0, 0))
+
+    def _foot(self) -> QPoint:
+        """脚下中点的全局坐标"""
+        widget = self.widget
+        return QPoint(widget.x() + widget.width() // 2, widget.y() + widget.height()) - self._origin()
+
+    def lift(self):
+        """开始拖动：离开站立的窗口，并让窗口几何尽快刷新以便放下时判断"""
+        self._set_surface(None)
+        desktop_geometry.refresh()
+
+    def land(self) -> bool:
+        """拖放结束：脚下 snap_distance 以内有可站立的标题栏时站上去，否则以当前位置作为地面"""
+        self._set_surface(None)
+        self._sync()
+        hit = None
+        if self.settings["window_surfaces"] and desktop_geometry.running:
+            foot = self._foot()
+            hit = desktop_geometry.surface_below(foot.x(), foot.y(), self.settings["snap_distance"])
+            # 站上去后头顶不能超出屏幕
+            screen_top = self._bounds.top() - self._origin().y()
+            if hit is not None and hit[1] - self.widget.height() < screen_top:
+                hit = None
+        if hit is None:
+            self._floor_y = self.widget.y()
+            return False
+        self._set_surface(hit[0])
+        self._follow_surface()
+        return self.surface is not None
+
+    def _set_surface(self, wid):
+        if wid == self.surface:
+            return
+        if self.surface is not None:
+            desktop_geometry.release()
+        self.surface = wid
+        self._surface_rect = desktop_geometry.window(wid) if wid is not None else None
+        if wid is not None:
+            desktop_geometry.acquire()
+            logger.debug("站到窗口 0x%x 的标题栏上", wid)
+
+    def _on_windows_changed(self, _ids):
+        # 其他窗口移动也可能遮住脚下的标题栏，站在窗口上时每次变化都重新检查
+        if self.surface is not None:
+            self._follow_surface()
+
+    def _follow_surface(self):
+        """跟随站立的窗口移动；窗口消失或脚下被遮住时回到地面"""
+        rect = desktop_geometry.window(self.surface)
+        if rect is None:
+            self._fall()
+            return
+        dx = rect[0] - self._surface_rect[0] if self._surface_rect else 0
+        self._surface_rect = rect
+        self._sync()
+        self._place(self.widget.x() + dx, rect[1] - self.widget.height() + self._origin().y())
+        if desktop_geometry.segment_at(self.surface, self._foot().x()) is None:
+            self._fall()
+
+    def _fall(self):
+        logger.debug("脚下的标题栏不可站立，回到地面")
+        self._set_surface(None)
+        self._place(self.widget.x(), self._floor_y)
+
+    def _place(self, x: int, y: int):
+        self._x = float(x)
+        self._last_pos = QPoint(x, y)
+        if self.widget.pos() != self._last_pos:
+            self.widget.move(self._last_pos)
+
+    # ===== 每帧更新 =====
+
+    def _step(self, dt: float):
+        """更新一帧位置（由调度器调用）"""
+        self._sync()
+        self._x += self.velocity * dt
+        left, right = self.limits()
+        if self.velocity < 0 and self._x < left:
+            self._x = float(left)
+            self._apply()
+            self.boundary_hit.emit("left")
+            return
+        if self.velocity > 0 and self._x > right:
+            self._x = float(right)
+            self._apply()
+            self.boundary_hit.emit("right")
+            return
+        self._apply()
+
+    def _apply(self):
+        self._move_to(int(round(self._x)))
+
+    def _move_to(self, x: int):
+        if x != self._last_pos.x():
+            self._last_pos = QPoint(x, self._last_pos.y())
+            self.widget.move(self._last_pos)
+
+
+class MovementScheduler(QObject):
+    """所有移动引擎共用的精确定时器：一次唤醒批量更新全部正在行走的宠物"""
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self._engines: List[MovementEngine] = []
+        self._last_tick = 0.0
+        self._timer = None
+
+    def _ensure_timer(self):
+        # QTimer 需在 QApplication 创建之后构造
+        if self._timer is None:
+            self._timer = QTimer(self)
+            self._timer.setTimerType(Qt.TimerType.PreciseTimer)
+            self._timer.timeout.connect(self._tick)
+
+    def contains(self, engine: MovementEngine) -> bool:
+        return engine in self._engines
+
+    def add(self, engine: MovementEngine):
+        if engine in self._engines:
+            return
+        self._engines.append(engine)
+        self._ensure_timer()
+        if not self._timer.isActive():
+            self._last_tick = time.monotonic()
+        self._reschedule()
+
+    def remove(self, engine: MovementEngine):
+        if engine in self._engines:
+            self._engines.remove(engine)
+            self._reschedule()
+
+    def engine_changed(self, engine: MovementEngine):
+        if engine in self._engines:
+            self._reschedule()
+
+    def _reschedule(self):
+        if not self._engines:
+            self._timer.stop()
+            return
+        # 频率取所有行走中宠物的最高值
+        interval = min(engine.interval_ms for engine in self._engines)
+        if self._timer.interval() != interval or not self._timer.isActive():
+            self._timer.start(interval)
+
+    def _tick(self):
+        now = time.monotonic()
+        # 限制单帧步长，避免系统卡顿后一次跳得太远
+        dt = min(now - self._last_tick, 0.1)
+        self._last_tick = now
+        # 回调中可能改变行走状态（碰到边界转身），遍历副本
+        for engine in list(self._engines):
+            engine._step(dt)
+
+
+# Global instance for easy access
+movement_scheduler = MovementScheduler()
@@ -0,0 +1,110 @@
+"""
+合成覆盖层模块
+render_mode 为 "overlay" 时，宠物与气泡不再是三个独立的置顶窗口，
+而是作为子控件绘制在同一个覆盖整个桌面的透明窗口上：
+移动宠物只是窗口内的一次重绘，不再产生窗口系统的移动请求；
+窗口的输入区域（mask）只包含可见的子控件，空白处的点击穿透到下层窗口。
+"""
+
+from PyQt6.QtWidgets import QWidget, QApplication
+from PyQt6.QtCore import Qt, QTimer, QEvent, QPoint
+from PyQt6.QtGui import QRegion, QGuiApplication
+
+from .logger import get_logger
+
+logger = get_logger(__name__)
+
+RENDER_WINDOW = "window"
+RENDER_OVERLAY = "overlay"
+
+
+class OverlaySurface(QWidget):
+    """覆盖整个虚拟桌面的透明置顶窗口，承载宠物与气泡"""
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.setWindowFlags(
+            Qt.WindowType.FramelessWindowHint |
+            Qt.WindowType.WindowStaysOnTopHint |
+            Qt.WindowType.Tool
+        )
+        self.setAttribute(Qt.WidgetAttribute.WA_TranslucentBackground)
+        self.setAttribute(Qt.WidgetAttribute.WA_NoSystemBackground)
+
+        # 子控件变化时合并到下一轮事件循环统一更新输入区域
+        self._mask_timer = QTimer(self)
+        self._mask_timer.setSingleShot(True)
+        self._mask_timer.timeout.connect(self.update_mask)
+        # 子控件提供的自定义输入区域（如宠物的逐帧 alpha 掩码），坐标相对子控件
+        self._child_regions = {}
+
+        self._fit_to_desktop()
+        app = QApplication.instance()
+        app.screenAdded.connect(self._on_screen_added)
+        app.screenRemoved.connect(lambda _screen: self._fit_to_desktop())
+        for screen in QGuiApplication.screens():
+            self._watch_screen(screen)
+
+    def _watch_screen(self, screen):
+        screen.virtualGeometryChanged.connect(lambda _geo: self._fit_to_desktop())
+
+    def _on_screen_added(self, screen):
+        # 之后加入的屏幕同样跟踪几何变化（分辨率、排列调整）
+        self._watch_screen(screen)
+        self._fit_to_desktop()
+
+    def _fit_to_desktop(self):
+        screen = QGuiApplication.primaryScreen()
+        if screen is None:
+            return
+        geometry = screen.virtualGeometry()
+        if geometry != self.geometry():
+            self.setGeometry(geometry)
+            logger.debug("覆盖层尺寸: %dx%d", geometry.width(), geometry.height())
+        self.schedule_mask_update()
+
+    # ===== 坐标 =====
+
+    def map_from_global(self, point: QPoint) -> QPoint:
+        return point - self.geometry().topLeft()
+
+    # ===== 子控件 =====
+
+    def attach(self, widget: QWidget):
+        """把控件作为覆盖层的子控件，并跟踪其几何变化"""
+        widget.setParent(self)
+        widget.installEventFilter(self)
+        self.schedule_mask_update()
+
+    def set_input_region(self, widget: QWidget, region: QRegion = None):
+        """为子控件指定输入区域（相对子控件坐标），None 表示使用整个矩形"""
+        if region is None:
+            self._child_regions.pop(widget, None)
+        else:
+            self._child_regions[widget] = region
+        self.schedule_mask_update()
+
+    def eventFilter(self, obj, event):
+        if event.type() in (QEvent.Type.Move, QEvent.Type.Resize, QEvent.Type.Show, QEvent.Type.Hide):
+            self.schedule_mask_update()
+        return False
+
+    def schedule_mask_update(self):
+        if not self._mask_timer.isActive():
+            self._mask_timer.start(0)
+
+    def update_mask(self):
+        """输入区域 = 所有可见子控件区域的并集"""
+        region = QRegion()
+        for child in self.children():
+            if not isinstance(child, QWidget) or not child.isVisible():
+                continue
+            child_region = self._child_regions.get(child)
+            if child_region is None:
+                region = region.united(QRegion(child.geometry()))
+            else:
+                region = region.united(child_region.translated(child.pos()))
+        if region.isEmpty():
+            # 空区域等同于取消掩码（整个窗口都会接收点击），保留一个像素
+            region = QRegion(0, 0, 1, 1)
+        self.setMask(region)
@@ -0,0 +1,189 @@
+"""
+多宠物模块
+同一进程中运行多只宠物（config["pets"]），共享：
+- 帧缓存：相同素材目录的宠物共用一个 FrameStore，解码后的帧只保存一份；
+- 动画时钟：所有宠物的动画帧由同一个定时器批量推进；
+- 传感器：只采样一次，快照与事件供所有宠物使用；
+- 事件触发：只有一份触发规则，一次传感器事件只让一只宠物（轮流、优先空闲的）开始思考；
+- LLM 请求：经 llm_dispatcher 限制并发并在宠物之间轮流调度（见 llm_dispatcher.py）。
+行走由 movement.movement_scheduler 统一驱动。
+"""
+
+import os
+import time
+from typing import Dict, List
+
+from PyQt6.QtCore import QObject, QTimer, Qt, pyqtSignal
+
+from .frame_store import FrameStore, create_frame_store
+from .logger import get_logger
+
+logger = get_logger(__name__)
+
+MAX_PETS = 64
+
+
+def pet_entries(config: dict, default_assets: str) -> List[dict]:
+    """解析 config["pets"]，未配置时只有一只宠物"""
+    entries = []
+    for index, entry in enumerate(config.get('pets') or [{}]):
+        if index >= MAX_PETS:
+            logger.warning("最多同时运行 %d 只宠物，其余配置被忽略", MAX_PETS)
+            break
+        if isinstance(entry, str):
+            entry = {"name": entry}
+        assets = entry.get("assets") or default_assets
+        entries.append({"name": entry.get("name", ""), "assets": os.path.abspath(assets)})
+    return entries
+
+
+class ClockTimer(QObject):
+    """AnimationClock 上的一个订阅，接口与 QTimer 相同（start/stop/setInterval/isActive/timeout）"""
+
+    timeout = pyqtSignal()
+
+    def __init__(self, clock: "AnimationClock", parent=None):
+        super().__init__(parent)
+        self._clock = clock
+        self._interval = 0
+        self._active = False
+        self._elapsed = 0.0
+
+    def start(self, interval: int = None):
+        if interval is not None:
+            self._interval = interval
+        self._active = True
+        self._elapsed = 0.0
+        self._clock._reschedule()
+
+    def stop(self):
+        self._active = False
+        self._clock._reschedule()
+
+    def setInterval(self, interval: int):
+        self._interval = interval
+        if self._active:
+            self._clock._reschedule()
+
+    def interval(self) -> int:
+        return self._interval
+
+    def isActive(self) -> bool:
+        return self._active
+
+    def remainingTime(self) -> int:
+        return max(0, int(self._interval - self._elapsed)) if self._active else -1
+
+
+class AnimationClock(QObject):
+    """所有宠物共用的动画时钟：按最短的订阅间隔唤醒一次，依次推进到期的订阅"""
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self._subscribers: List[ClockTimer] = []
+        self._timer = QTimer(self)
+        self._timer.setTimerType(Qt.TimerType.PreciseTimer)
+        self._timer.timeout.connect(self._tick)
+        self._last_tick = 0.0
+
+    def timer(self, parent=None) -> ClockTimer:
+        subscriber = ClockTimer(self, parent)
+        self._subscribers.append(subscriber)
+        subscriber.destroyed.connect(lambda: self._subscribers.remove(subscriber))
+        return subscriber
+
+    def _reschedule(self):
+        intervals = [s._interval for s in self._subscribers if s._active and s._interval > 0]
+        if not intervals:
+            self._timer.stop()
+            return
+        interval = min(intervals)
+        if not self._timer.isActive():
+            self._last_tick = time.monotonic()
+        if self._timer.interval() != interval or not self._timer.isActive():
+            self._timer.start(interval)
+
+    def _tick(self):
+        now = time.monotonic()
+        elapsed_ms = (now - self._last_tick) * 1000
+        self._last_tick = now
+        # 间隔相同的宠物在同一次唤醒中更新；容许半个周期的误差，避免定时器抖动导致跳过一帧
+        slack = self._timer.interval() / 2
+        for subscriber in list(self._subscribers):
+            if not subscriber._active:
+                continue
+            subscriber._elapsed += elapsed_ms
+            if subscriber._elapsed + slack >= subscriber._interval:
+                subscriber._elapsed = max(0.0, subscriber._elapsed - subscriber._interval)
+                subscriber.timeout.emit()
+
+
+class PetGroup(QObject):
+    """同一进程中的一组宠物及其共享资源"""
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.pets: list = []
+        self.clock = AnimationClock(self)
+        self._frame_stores: Dict[str, FrameStore] = {}
+        self._sensor_hub = None
+        self._trigger_rules = None
+        self._next_speaker = 0
+
+    @property
+    def primary(self):
+        """第一只宠物负责托盘、控制接口等进程级功能"""
+        return self.pets[0] if self.pets else None
+
+    def add(self, pet):
+        self.pets.append(pet)
+
+    def remove(self, pet):
+        """宠物关闭：不再参与事件触发，全部关闭后取消触发规则的订阅"""
+        if pet in self.pets:
+            self.pets.remove(pet)
+        if not self.pets and self._trigger_rules is not None:
+            self._trigger_rules.stop()
+
+    def frame_store(self, assets_path: str, scale: float, config: dict = None) -> FrameStore:
+        """相同素材目录的宠物共用帧缓存"""
+        key = os.path.abspath(assets_path)
+        store = self._frame_stores.get(key)
+        if store is None:
+            store = self._frame_stores[key] = create_frame_store(assets_path, scale, config)
+        return store
+
+    def trigger_rules(self, min_gap: float):
+        """事件触发规则只创建一份（第一次调用时），胜出的事件交给一只宠物"""
+        if self._trigger_rules is None:
+            from .trigger_rules import TriggerRules
+            self._trigger_rules = TriggerRules(min_gap=min_gap, gate=self._allows_event, parent=self)
+            self._trigger_rules.brain_trigger.connect(self._on_brain_trigger)
+        return self._trigger_rules
+
+    def _listeners(self, event) -> list:
+        """愿意因该事件说话的宠物（已开始自主思考，且未被用户不在、高负载或 Token 预算拦下）"""
+        return [pet for pet in self.pets if pet.trigger_rules is not None and pet._allows_event(event)]
+
+    def _allows_event(self, event) -> bool:
+        return bool(self._listeners(event))
+
+    def _on_brain_trigger(self, event):
+        """轮流选一只宠物响应事件，优先没有进行中请求、未暂停的宠物"""
+        pets = self._listeners(event)
+        if not pets:
+            return
+        idle = [pet for pet in pets if not pet._llm_busy()
+                and not (pet.power_policy is not None and pet.power_policy.suspended)]
+        pets = idle or pets
+        pet = pets[self._next_speaker % len(pets)]
+        self._next_speaker += 1
+        pet._on_brain_event(event)
+
+    def sensor_hub(self, config: dict):
+        """传感器只采样一次（第一次调用时创建并启动）"""
+        if self._sensor_hub is None:
+            from .sensors import SensorHub
+            self._sensor_hub = SensorHub(config, parent=self)
+            self._sensor_hub.start()
+        return self._sensor_hub
@@ -5,51 +5,90 @@
 
 import os
 import json
+import time
 from PyQt6.QtWidgets import (
     QWidget, QLabel, QMenu, QApplication,
     QSystemTrayIcon, QGraphicsDropShadowEffect
 )
 from PyQt6.QtCore import (
-    Qt, QTimer, QPoint, pyqtSignal, QSize, QRect, QEvent
+    Qt, QTimer, QPoint, pyqtSignal, QEvent
 )
 from PyQt6.QtGui import (
-    QPixmap, QAction, QIcon, QCursor, QGuiApplication, QMouseEvent, QColor
+    QAction, QIcon, QCursor, QGuiApplication, QMouseEvent, QColor
 )
 
-from .chat_bubble import ChatBubble
-from .chat_bubble import ChatBubble
+from .chat_bubble import ChatBubble, PRIORITY_LOW, PRIORITY_NORMAL, PRIORITY_HIGH
 # from .chat_window import ChatWindow # 已移除
-from .settings_dialog import SettingsDialog
-from .chat_worker import ChatWorker
+# 设置对话框、聊天线程（requests）、工具与传感器（psutil）在首帧之后才用到，按需导入以缩短启动时间
 from .styles import COLORS, CONTEXT_MENU_STYLE
-from .tools import tool_manager
+from . import structured_output
+from .usage_ledger import usage_ledger
+from .event_bus import PetEvent
+from .logger import get_logger, apply_levels
+from .config_service import ConfigService
+from .tracing import tracer
+from .metrics import metrics, ANIMATION_TICKS, ANIMATION_TICK_SECONDS
+from .movement import MovementEngine
+from .desktop_geometry import desktop_geometry
+from .frame_store import create_frame_store, normalize_dpr, SHADOW_BLUR, SHADOW_OFFSET
+from .animation_fsm import AnimationStateMachine, load_action_spec
+from .llm_dispatcher import llm_dispatcher
 
-# 动作分类定义
-REPEAT_ACTIONS = {'discomfort', 'left', 'right', 'mention', 'sleep', 'standby'}
-ONCE_ACTIONS = {'eat', 'love'}  # 表情包也是一次性的，需动态判断
+logger = get_logger(__name__)
 
+# 行走动作对应的移动方向
+WALK_DIRECTIONS = {'left': -1, 'right': 1}
 
 
 class PetWidget(QWidget):
     """宠物窗口组件"""
     
-    def __init__(self, assets_path: str, config: dict, config_path: str, parent=None):
+    # 第一帧绘制完成
+    first_frame_painted = pyqtSignal()
+    # 延后的启动阶段（其余动作帧、表情、自主思考）全部完成
+    startup_completed = pyqtSignal()
+    
+    def __init__(self, assets_path: str, config: dict, config_path: str, parent=None,
+                 config_service: ConfigService = None, surface=None,
+                 group=None, name: str = "", index: int = 0):
         super().__init__(parent)
         
+        # 多宠物：同组的宠物共用帧缓存、动画时钟与传感器（见 pet_group），index 决定初始位置
+        self.group = group
+        self.pet_name = name
+        self.pet_index = index
+        
+        # 覆盖层模式：宠物与气泡都是 surface（OverlaySurface）的子控件
+        self.surface = surface
+        if surface is not None:
+            surface.attach(self)
+        
         self.assets_path = assets_path
-        self.config = config
         self.config_path = config_path
+        # 配置服务：self.config 与服务共享同一个实时字典，变更按键通知
+        self.config_service = config_service or ConfigService(config_path, initial=config, parent=self)
+        self.config = self.config_service.config
+        self.config_service.key_changed.connect(self._on_config_key_changed)
         
-        # 动画相关
-        self.current_action = "standby"
-        self.previous_action = "standby"  # 记录上一个重复型动作
-        self.is_one_time_action = False   # 标记当前是否为一次性动作
+        # 动画相关：动作切换、循环与回落由表驱动的状态机决定（见 animation_fsm）
+        self.animation = AnimationStateMachine(entered=self._on_action_entered)
         self.current_scale = self.config.get('pet_scale', 0.5)
-        self.scaled_animation_frames = {}
-        self.animation_frames = {}
-        self.current_frame_index = 0
-        self.action_loop_count = 0        # 记录一次性动作的播放次数
-        self.animation_timer = QTimer(self)
+        # 帧缓存：原始帧、按 DPR 缩放的帧与输入区域；animation_frames 为原始帧字典的别名
+        if group is not None:
+            self.frame_store = group.frame_store(assets_path, self.current_scale, self.config)
+        else:
+            self.frame_store = create_frame_store(assets_path, self.current_scale, self.config)
+        # 宠物所在屏幕的 DPR（同组宠物可能在不同屏幕上）；覆盖层模式下为取得 DPR 的屏幕的全局矩形
+        self._screen_geometry = None
+        self._dpr = self._screen_dpr()
+        self.frame_store.set_dpr(self._dpr)
+        self.animation_frames = self.frame_store.frames
+        self._applied_mask = None
+        self._screen_window = None
+        # 当前显示帧的裁剪偏移（切换动作时据此平移窗口，保持角色位置不动）
+        self._frame_anchor = QPoint()
+        # 同组宠物的动画帧由共用时钟批量推进，接口与 QTimer 相同
+        self.animation_timer = group.clock.timer(self) if group is not None else QTimer(self)
         self.animation_timer.timeout.connect(self._next_frame)
         
         # 拖动相关
@@ -66,25 +105,60 @@ class PetWidget(QWidget):
         self.brain_timer.timeout.connect(self._on_brain_tick)
         self.brain_timer.setSingleShot(True) # 每次触发后重新计算随机时间
         
+        # 传感器、调度器与触发规则在首帧之后的空闲阶段创建（见 _init_brain）
+        self.sensor_hub = None
+        self.brain_scheduler = None
+        self.trigger_rules = None
+        # 本地控制接口（配置启用时在延后阶段创建）
+        self.ipc_server = None
+        # 省电策略与独白预生成（随传感器一起创建）
+        self.power_policy = None
+        self.speculator = None
+        
+        # 分阶段启动：构造时只加载首个动作，其余资源在首帧后逐个空闲时间片加载
+        self._first_frame_done = False
+        self._startup_scheduled = False
+        self._startup_done = False
+        self._pending_asset_jobs = []
+        # 启动后的空闲任务（如为新屏幕的 DPR 发布共享帧），同样每个空闲时间片执行一项
+        self._idle_jobs = []
+        
         # 初始化
         self.setup_ui()
         self.load_animations()
         self.setup_components()
         self.start_animation()
-        self.start_brain()
+        
+        # 行走：按速度平滑移动，与动画帧率无关
+        self.movement = MovementEngine(self, self.config.get('movement'), to_local=self._from_global, parent=self)
+        self.movement.boundary_hit.connect(self._on_boundary_hit)
+        
+        # 首帧绘制后开始延后阶段；窗口未显示时由定时器兜底
+        self.first_frame_painted.connect(self._schedule_deferred_startup)
+        QTimer.singleShot(1000, self._schedule_deferred_startup)
+        
+        # 屏幕增删时只保留仍连接的屏幕所用 DPR 的帧缓存
+        app = QApplication.instance()
+        app.screenAdded.connect(self._retain_screen_frames)
+        app.screenRemoved.connect(self._retain_screen_frames)
+        if self.surface is not None:
+            # 覆盖层的窗口屏幕不随宠物变化，屏幕增删时按宠物位置重新确定 DPR
+            app.screenAdded.connect(self._on_screen_changed)
+            app.screenRemoved.connect(self._on_screen_changed)
         
         # 安装全局事件过滤器以处理菜单自动收起
         QApplication.instance().installEventFilter(self)
         
     def setup_ui(self):
         """设置 UI"""
-        # 窗口设置：无边框、透明、始终置顶
-        self.setWindowFlags(
-            Qt.WindowType.FramelessWindowHint |
-            Qt.WindowType.WindowStaysOnTopHint |
-            Qt.WindowType.Tool
-        )
-        self.setAttribute(Qt.WidgetAttribute.WA_TranslucentBackground)
+        if self.surface is None:
+            # 窗口设置：无边框、透明、始终置顶
+            self.setWindowFlags(
+                Qt.WindowType.FramelessWindowHint |
+                Qt.WindowType.WindowStaysOnTopHint |
+                Qt.WindowType.Tool
+            )
+            self.setAttribute(Qt.WidgetAttribute.WA_TranslucentBackground)
         
         # 宠物图片标签
         self.pet_label = QLabel(self)
@@ -92,122 +166,204 @@ class PetWidget(QWidget):
         self.pet_label.setScaledContents(False)
         
         # 添加阴影效果 (美化)
+        # 阴影的范围与输入掩码的膨胀一致（见 frame_store.SHADOW_BLUR）
         shadow = QGraphicsDropShadowEffect(self)
-        shadow.setBlurRadius(15)
-        shadow.setXOffset(0)
-        shadow.setYOffset(2)
+        shadow.setBlurRadius(SHADOW_BLUR)
+        shadow.setXOffset(SHADOW_OFFSET[0])
+        shadow.setYOffset(SHADOW_OFFSET[1])
         shadow.setColor(QColor(0, 0, 0, 60))  # 柔和的黑色阴影
         self.pet_label.setGraphicsEffect(shadow)
         
-        # 初始位置（屏幕右下角）
+        # 初始位置（屏幕右下角，多只宠物依次向左排开）
         screen = QApplication.primaryScreen()
         if screen:
             screen_geo = screen.geometry()
-            self.move(screen_geo.width() - 250, screen_geo.height() - 300)
+            x = max(0, screen_geo.width() - 250 - self.pet_index * 200)
+            self.move(self._from_global(QPoint(x, screen_geo.height() - 300)))
+        
+    def _from_global(self, point: QPoint) -> QPoint:
+        """全局坐标 -> move() 使用的坐标（覆盖层模式下相对覆盖层）"""
+        if self.surface is not None:
+            return self.surface.map_from_global(point)
+        return point
         
     def load_animations(self):
-        """加载所有动画帧"""
-        actions_path = os.path.join(self.assets_path, "actions")
+        """加载首个动作（优先 standby）的动画帧，其余动作与表情排入延后阶段"""
+        action_names = self.frame_store.action_names()
         
-        if not os.path.exists(actions_path):
-            print(f"动作目录不存在: {actions_path}")
-            return
+        while action_names and not self.animation_frames:
+            self._load_action(action_names.pop(0))
         
-        for action_name in os.listdir(actions_path):
-            action_path = os.path.join(actions_path, action_name)
-            if os.path.isdir(action_path):
-                frames = []
-                # 获取该动作的所有帧（按文件名排序）
-                frame_files = sorted([
-                    f for f in os.listdir(action_path)
-                    if f.endswith(('.png', '.jpg', '.jpeg', '.gif'))
-                ])
-                
-                for frame_file in frame_files:
-                    frame_path = os.path.join(action_path, frame_file)
-                    pixmap = QPixmap(frame_path)
-                    if not pixmap.isNull():
-                        frames.append(pixmap)
-                
-                if frames:
-                    self.animation_frames[action_name] = frames
-                    print(f"加载动作 '{action_name}': {len(frames)} 帧")
-        for action_name in os.listdir(actions_path):
-            action_path = os.path.join(actions_path, action_name)
-            if os.path.isdir(action_path):
-                frames = []
-                # 获取该动作的所有帧（按文件名排序）
-                frame_files = sorted([
-                    f for f in os.listdir(action_path)
-                    if f.lower().endswith(('.png', '.jpg', '.jpeg', '.gif'))
-                ])
-                
-                for frame_file in frame_files:
-                    frame_path = os.path.join(action_path, frame_file)
-                    pixmap = QPixmap(frame_path)
-                    if not pixmap.isNull():
-                        frames.append(pixmap)
-                
-                if frames:
-                    self.animation_frames[action_name] = frames
-                    print(f"加载动作 '{action_name}': {len(frames)} 帧")
-        
-        # 加载表情包 (expressions) 到 animation_frames，前缀 'expr:'
-        expr_path = os.path.join(self.assets_path, "expressions")
-        if os.path.exists(expr_path):
-            for expr_file in os.listdir(expr_path):
-                if expr_file.lower().endswith(('.png', '.jpg', '.jpeg', '.gif')):
-                    # 表情包通常是单帧，但为了统一处理，作为单帧动画
-                    pixmap = QPixmap(os.path.join(expr_path, expr_file))
-                    if not pixmap.isNull():
-                        # 去掉扩展名作为动作名
-                        action_name = f"expr:{os.path.splitext(expr_file)[0]}"
-                        self.animation_frames[action_name] = [pixmap]
-                        ONCE_ACTIONS.add(action_name) # 标记为一次性
-                        print(f"加载表情 '{action_name}'")
-
-        if "standby" not in self.animation_frames:
-            # 如果没有 standby 动作，使用第一个可用的动作
-            if self.animation_frames:
-                first_action = list(self.animation_frames.keys())[0]
-                self.animation_frames["standby"] = self.animation_frames[first_action]
-        
-        # 预先生成缩放缓存 (性能优化)
-        self._update_scaled_frames()
+        if "standby" not in self.animation_frames and self.animation_frames:
+            first_action = list(self.animation_frames.keys())[0]
+            self.frame_store.alias("standby", first_action)
+            self._register_action("standby")
+        
+        self._pending_asset_jobs = [
+            (lambda name=name: self._load_action(name)) for name in action_names
+        ]
+        self._pending_asset_jobs.append(self._load_expressions)
+
+    def _load_action(self, name: str):
+        """加载动作帧，并按动作目录中的 action.json 注册到状态机"""
+        if self.frame_store.load_action(name):
+            self._register_action(name, os.path.join(self.frame_store.actions_path, name))
+
+    def _load_expressions(self):
+        """加载表情包 (expressions) 到 animation_frames，前缀 'expr:'（默认为一次性动作）"""
+        for action_name in self.frame_store.load_expressions():
+            self._register_action(action_name)
+
+    def _register_action(self, name: str, action_path: str = None):
+        self.animation.add_action(name, load_action_spec(name, action_path), len(self.animation_frames[name]))
 
     def _update_scaled_frames(self):
         """更新缩放后的动画帧缓存"""
-        self.scaled_animation_frames.clear()
+        self.frame_store.set_scale(self.current_scale)
+        self._schedule_idle_jobs()
+
+    # ===== 分阶段启动 =====
+
+    def paintEvent(self, event):
+        super().paintEvent(event)
+        if not self._first_frame_done:
+            self._first_frame_done = True
+            self.first_frame_painted.emit()
+
+    def _schedule_deferred_startup(self):
+        """首帧之后（或兜底定时器到期）开始延后阶段，只执行一次"""
+        if self._startup_scheduled:
+            return
+        self._startup_scheduled = True
+        QTimer.singleShot(0, self._run_deferred_startup)
+
+    def _run_deferred_startup(self):
+        """每个空闲时间片只处理一项资源加载，保持动画与交互流畅"""
+        if self._pending_asset_jobs:
+            job = self._pending_asset_jobs.pop(0)
+            try:
+                job()
+            except Exception as e:
+                logger.exception("延后加载资源失败: %s", e)
+            QTimer.singleShot(0, self._run_deferred_startup)
+            return
         
-        if not self.animation_frames:
+        self._init_brain()
+        self._init_ipc()
+        # 跟踪桌面窗口几何，宠物可以站在窗口标题栏上（多只宠物共用）
+        if not desktop_geometry.running:
+            desktop_geometry.start(self.config.get('desktop_geometry'))
+        # 全部动作已加载，启用跨进程共享时发布缩放帧（在之后的空闲时间片逐个动作进行）
+        self.frame_store.publish()
+        self._schedule_idle_jobs()
+        self._startup_done = True
+        logger.info("启动完成，共加载 %d 个动作", len(self.animation_frames))
+        self.startup_completed.emit()
+
+    def _schedule_idle_jobs(self):
+        """取出帧缓存的空闲任务，排入空闲时间片"""
+        jobs = self.frame_store.take_idle_jobs()
+        if not jobs:
             return
-            
-        print(f"正在预处理缩放动画帧 (Scale: {self.current_scale})...")
-        
-        for action, frames in self.animation_frames.items():
-            scaled_list = []
-            for pixmap in frames:
-                if pixmap.isNull():
-                    continue
-                    
-                new_size = QSize(
-                    int(pixmap.width() * self.current_scale),
-                    int(pixmap.height() * self.current_scale)
-                )
-                
-                scaled_pixmap = pixmap.scaled(
-                    new_size,
-                    Qt.AspectRatioMode.KeepAspectRatio,
-                    Qt.TransformationMode.SmoothTransformation
-                )
-                scaled_list.append(scaled_pixmap)
-            
-            self.scaled_animation_frames[action] = scaled_list
+        if not self._idle_jobs:
+            QTimer.singleShot(0, self._run_idle_jobs)
+        self._idle_jobs.extend(jobs)
+
+    def _run_idle_jobs(self):
+        """每个空闲时间片只执行一项，显示与交互不会被整套素材的处理阻塞"""
+        if not self._idle_jobs:
+            return
+        job = self._idle_jobs.pop(0)
+        try:
+            job()
+        except Exception as e:
+            logger.exception("空闲任务失败: %s", e)
+        if self._idle_jobs:
+            QTimer.singleShot(0, self._run_idle_jobs)
+
+    def _init_ipc(self):
+        """按配置启动本地控制接口（JSON-RPC over Unix Socket），多宠物时只由第一只宠物提供"""
+        if not self.config.get('ipc', {}).get('enabled'):
+            return
+        if self.group is not None and self.group.primary is not self:
+            return
+        from .ipc_server import IpcServer
+        self.ipc_server = IpcServer(self)
+        self.ipc_server.register_command("set_action", self.set_action)
+        self.ipc_server.register_command("show_bubble", self._show_bubble)
+        self.ipc_server.register_command("send_chat_message", self.send_chat_message)
+        self.ipc_server.register_command("send_brain_message", lambda: self.send_brain_message())
+        self.ipc_server.register_query("get_state", self._query_state)
+        self._publish_state()
+        self.ipc_server.start(self.config.get('ipc'))
+
+    def _publish_state(self, **extra):
+        """把当前状态写入控制接口的快照，供后台线程应答查询"""
+        if self.ipc_server is None:
+            return
+        self.ipc_server.update_snapshot(
+            action=self.current_action,
+            previous_action=self.previous_action,
+            position=[self.x(), self.y()],
+            size=[self.width(), self.height()],
+            visible=self.isVisible(),
+            scale=self.current_scale,
+            actions=sorted(self.animation_frames),
+            **extra
+        )
+
+    def _query_state(self, params: dict) -> dict:
+        """get_state 查询（在控制接口的连接线程执行，只读快照与线程安全的 isRunning）"""
+        worker = self.chat_worker
+        return dict(self.ipc_server.snapshot(), busy=bool(worker and worker.isRunning()))
+
+    def _init_brain(self):
+        """创建传感器、调度器与触发规则，并开始自主思考"""
+        if self.sensor_hub is not None:
+            return
+        from .sensors import SensorHub
+        from .brain_scheduler import BrainScheduler
+        from .trigger_rules import TriggerRules
+        
+        # 传感器采样 -> 事件总线 -> 触发规则；调度器根据传感器快照调整思考频率
+        # 同组宠物共用一个已启动的 SensorHub，只采样一次
+        shared = self.group is not None
+        self.sensor_hub = self.group.sensor_hub(self.config) if shared else SensorHub(self.config, parent=self)
+        self.brain_scheduler = BrainScheduler(self.config, self.sensor_hub, self)
+        # 同组宠物共用一份触发规则，一次事件只由一只宠物响应（见 PetGroup.trigger_rules）
+        min_gap = self.brain_scheduler.settings['min_trigger_gap']
+        if shared:
+            self.trigger_rules = self.group.trigger_rules(min_gap)
+        else:
+            self.trigger_rules = TriggerRules(min_gap=min_gap, gate=self._allows_event, parent=self)
+            self.trigger_rules.brain_trigger.connect(self._on_brain_event)
+        
+        # 到期前预生成下一段独白
+        from .speculative import ThoughtSpeculator
+        self.speculator = ThoughtSpeculator(self, self.config.get('speculation'), parent=self)
+        
+        # 锁屏、熄屏、全屏或隐藏时暂停动画与思考，使用电池时降频
+        from .power_policy import PowerPolicy
+        self.power_policy = PowerPolicy(self, self.sensor_hub, self.config, parent=self)
+        
+        self.start_brain()
+        if not shared:
+            self.sensor_hub.start()
+        # 先按窗口可见性确定初始模式，采样完成后由 probed 信号复核
+        self.power_policy.evaluate()
+        
+        # 预先启动隔离工具的子进程池
+        from .tool_sandbox import tool_sandbox
+        tool_sandbox.configure(self.config.get('tool_sandbox'))
+        tool_sandbox.start()
+        # 自主思考请求前预取的感知工具
+        from .context_prefetch import context_prefetcher
+        context_prefetcher.configure(self.config.get('context_prefetch'))
         
     def setup_components(self):
         """设置子组件"""
         # 创建聊天气泡
-        self.chat_bubble = ChatBubble()
+        self.chat_bubble = ChatBubble(surface=self.surface)
         
         # 获取可用动作列表
         available_actions = list(self.animation_frames.keys())
@@ -220,65 +376,57 @@ class PetWidget(QWidget):
         
     def start_animation(self):
         """开始播放动画"""
-        interval = self.config.get('animation_interval', 150)
-        self.animation_timer.start(interval)
+        self.animation_timer.start(self._animation_interval())
         self._show_current_frame()
         
-    def _next_frame(self):
-        """切换到下一帧"""
-        # 处理移动逻辑
-        self._handle_movement()
+    def _animation_interval(self) -> int:
+        """动画帧间隔（使用电池时按省电策略放慢）"""
+        interval = self.config.get('animation_interval', 150)
+        if self.power_policy is not None:
+            interval = int(interval * self.power_policy.slowdown)
+        return interval
         
-        frames = self.animation_frames.get(self.current_action, [])
-        if not frames:
+    def _next_frame(self):
+        """切换到下一帧（启用指标时记录每帧耗时）"""
+        if not metrics.enabled:
+            self._advance_frame()
             return
-            
-        next_index = self.current_frame_index + 1
-        
-        # 检查是否播放结束
-        if next_index >= len(frames):
-            if self.is_one_time_action:
-                self.action_loop_count += 1
-                if self.action_loop_count >= 2:
-                    # 一次性动作播放结束（已完成2次），恢复之前的动作
-                    self.set_action(self.previous_action)
-                    return
-                else:
-                    # 开始第二次循环
-                    next_index = 0
-            else:
-                # 重复性动作，循环播放
-                next_index = 0
-                
-        self.current_frame_index = next_index
-        self._show_current_frame()
+        started = time.perf_counter()
+        self._advance_frame()
+        ANIMATION_TICKS.inc()
+        ANIMATION_TICK_SECONDS.observe(time.perf_counter() - started)
+
+    def _advance_frame(self):
+        """切换到下一帧（循环、一次性动作结束与排队的切换由状态机处理，行走位移由 MovementEngine 独立驱动）"""
+        if self.animation.advance():
+            self._show_current_frame()
     
-    def _handle_movement(self):
-        """处理行走移动逻辑"""
-        step = 20  # 每次移动像素
-        
-        if self.current_action == 'left':
-            new_pos = self.x() - step
-            if new_pos < 100:
-                # 碰到左边界，转身向右
-                self.set_action('right')
-            else:
-                self.move(new_pos, self.y())
-                
-        elif self.current_action == 'right':
-            screen = self.screen()
-            if screen:
-                screen_width = screen.geometry().width()
-                new_pos = self.x() + step
-                if new_pos + self.width() > screen_width:
-                    # 碰到右边界，转身向左
-                    self.set_action('left')
-                else:
-                    self.move(new_pos, self.y())
-                    
+    @property
+    def current_action(self) -> str:
+        return self.animation.current
+    
+    @property
+    def previous_action(self) -> str:
+        """一次性动作结束后回到的常驻动作"""
+        return self.animation.resting
+    
+    @property
+    def current_frame_index(self) -> int:
+        return self.animation.frame
+    
+    def _on_boundary_hit(self, side: str):
+        """行走碰到屏幕边界（或站立的标题栏的尽头）时转身"""
+        self.set_action('right' if side == 'left' else 'left')
+
     def moveEvent(self, event):
         """窗口移动事件"""
         self.update_components_position()
+        # 覆盖层横跨所有屏幕：宠物中心离开当前屏幕时按新屏幕切换 DPR
+        if self.surface is not None and (
+                self._screen_geometry is None or not self._screen_geometry.contains(self._global_center())):
+            self._on_screen_changed()
+        if self.ipc_server is not None:
+            self.ipc_server.update_snapshot(position=[self.x(), self.y()])
         super().moveEvent(event)
         
     def resizeEvent(self, event):
@@ -299,48 +447,89 @@ class PetWidget(QWidget):
     def _show_current_frame(self):
         """显示当前帧"""
         # 使用缓存的缩放帧 (性能优化)
-        frames = self.scaled_animation_frames.get(self.current_action, [])
+        frames = self.frame_store.scaled_frames(self.current_action, self._dpr)
         if frames and 0 <= self.current_frame_index < len(frames):
             pixmap = frames[self.current_frame_index]
             self.pet_label.setPixmap(pixmap)
             self.pet_label.adjustSize()
             self.setFixedSize(self.pet_label.size())
+            self._apply_anchor(self.frame_store.scaled_anchor(self.current_action))
+            self._apply_input_mask(self.frame_store.masks[self.current_action][self.current_frame_index])
     
-    def set_action(self, action: str):
-        """设置当前动作"""
-        if action not in self.animation_frames:
-            return
-            
-        # 判断动作类型
-        is_once = action in ONCE_ACTIONS or action.startswith('expr:') or action not in REPEAT_ACTIONS
-        
-        # 如果是 mention 且正在进行中，不重复设置
-        if action == 'mention' and self.current_action == 'mention':
+    # ===== 多屏 / HiDPI =====
+    
+    def _track_screen(self):
+        """跟踪顶层窗口（覆盖层模式下为覆盖层）所在的屏幕，窗口句柄在显示后才存在"""
+        handle = self.window().windowHandle()
+        if handle is None or handle is self._screen_window:
             return
+        self._screen_window = handle
+        handle.screenChanged.connect(self._on_screen_changed)
+        self._on_screen_changed()
+    
+    def _global_center(self) -> QPoint:
+        return self.mapToGlobal(self.rect().center())
 
-        if is_once:
-            # 如果是一次性动作，记录当前状态（如果当前不是一次性动作）
-            if not self.is_one_time_action:
-                self.previous_action = self.current_action
-            self.is_one_time_action = True
+    def _screen_dpr(self) -> float:
+        """宠物所在屏幕的 DPR：覆盖层模式下窗口横跨所有屏幕，按宠物中心所在的屏幕取"""
+        if self.surface is not None:
+            screen = QGuiApplication.screenAt(self._global_center())
+            if screen is not None:
+                self._screen_geometry = screen.geometry()
+                return normalize_dpr(screen.devicePixelRatio())
+            self._screen_geometry = None
+        return normalize_dpr(self.devicePixelRatioF())
+
+    def _on_screen_changed(self, *_args):
+        """移到不同 DPR 的屏幕时切换到对应的帧缓存（没有时逐个动作按需生成）"""
+        dpr = self._screen_dpr()
+        if dpr != self._dpr:
+            self._dpr = dpr
+            self.frame_store.set_dpr(dpr)
+            self._retain_screen_frames()
+            # 只为正在显示的动作生成新 DPR 的帧，其余工作排入空闲时间片
+            self._show_current_frame()
+            self._schedule_idle_jobs()
+    
+    def _retain_screen_frames(self, *_args):
+        self.frame_store.retain_dprs(screen.devicePixelRatio() for screen in QGuiApplication.screens())
+    
+    def event(self, event):
+        # 屏幕缩放设置变化（DPR 改变但屏幕不变）
+        if event.type() == QEvent.Type.DevicePixelRatioChange:
+            self._on_screen_changed()
+        return super().event(event)
+    
+    def _apply_anchor(self, anchor: QPoint):
+        """各动作裁剪的透明边框不同，切换时按偏移差平移窗口，使角色在屏幕上的位置不变"""
+        if anchor != self._frame_anchor:
+            self.move(self.pos() + anchor - self._frame_anchor)
+            self._frame_anchor = anchor
+    
+    def _apply_input_mask(self, region):
+        """输入区域变化时才更新掩码（同一帧重复显示时直接跳过）"""
+        if region is self._applied_mask:
+            return
+        self._applied_mask = region
+        if self.surface is not None:
+            self.surface.set_input_region(self, region)
+        elif region is None:
+            self.clearMask()
         else:
-            # 如果是重复动作，更新 previous_action 为这个新动作（除非它是临时的 mention）
-            if action != 'mention':
-                self.previous_action = action
-            self.is_one_time_action = False
-            
-        self.current_action = action
-        self.current_frame_index = 0
-        self.action_loop_count = 0  # 重置播放次数
-        self._show_current_frame()
-        
-        # 更新菜单中的当前动作（仅当是重复动作时，或者是正在展示的菜单需要更新状态时）
-        # if self.menu_widget and not is_once:
-        #     self.menu_widget.set_current_action(action)
+            self.setMask(region)
     
-    def send_chat_message(self, message: str):
-        """发送聊天消息"""
-        # 获取当前 Provider 设置
+    def set_action(self, action: str):
+        """请求切换动作（是否立即切换、排队或忽略由状态机的转移表决定）"""
+        if self.animation.request(action):
+            self._show_current_frame()
+    
+    def _on_action_entered(self, action: str):
+        """状态机进入新动作（直接请求、排队切换或一次性动作结束回落）"""
+        self.movement.set_direction(WALK_DIRECTIONS.get(action, 0))
+        self._publish_state()
+    
+    def _resolve_provider(self):
+        """解析当前 Provider 的 API Key、端点与模型，未配置 API Key 时返回 None"""
         provider = self.config.get('api_provider', 'zhipu')
         provider_settings = self.config.get('api_settings', {}).get(provider, {})
         
@@ -350,12 +539,7 @@ class PetWidget(QWidget):
              start_api_key = self.config.get('api_key', '')
 
         if not start_api_key or start_api_key == 'YOUR_API_KEY_HERE':
-            self._show_bubble("请先在设置中配置 API Key 哦~")
-            return
-        
-        # 显示思考中 (仅当聊天窗口不可见时显示气泡)
-        # 始终显示气泡，因为聊天窗口已移除
-        self._show_bubble("让我想想...")
+            return None
         
         # 获取默认配置
         default_endpoints = {
@@ -380,20 +564,45 @@ class PetWidget(QWidget):
                 endpoint = f"{endpoint}/chat/completions"
 
         model = provider_settings.get('model_name', '') or default_models.get(provider, 'glm-4-flash')
-        system_prompt = self.config.get('system_prompt', '你是一个可爱的桌面宠物助手')
+        return {
+            'provider': provider,
+            'api_key': start_api_key,
+            'endpoint': endpoint,
+            'model': model
+        }
+
+    def send_chat_message(self, message: str):
+        """发送聊天消息"""
+        provider = self._resolve_provider()
+        if provider is None:
+            self._show_bubble("请先在设置中配置 API Key 哦~", priority=PRIORITY_HIGH, key="provider")
+            return
+        from .chat_worker import ChatWorker
+        trace_id = tracer.new_trace_id()
+        build_started = time.monotonic()
+        
+        # 显示思考中 (仅当聊天窗口不可见时显示气泡)
+        # 始终显示气泡，因为聊天窗口已移除
+        self._show_bubble("让我想想...", key="reply")
+        
+        system_prompt = self._base_system_prompt()
 
         # 创建工作线程
         self.chat_worker = ChatWorker(
-            api_key=start_api_key,
-            endpoint=endpoint,
-            model_name=model,
+            api_key=provider['api_key'],
+            endpoint=provider['endpoint'],
+            model_name=provider['model'],
             system_prompt=system_prompt,
-            user_message=message
+            user_message=message,
+            provider=provider['provider'],
+            trigger="chat",
+            trace_id=trace_id
         )
         
         self.chat_worker.response_received.connect(self._on_chat_response)
         self.chat_worker.error_occurred.connect(self._on_chat_error)
-        self.chat_worker.start()
+        llm_dispatcher.submit(self, self.chat_worker)
+        tracer.emit(trace_id, "request_build", build_started, time.monotonic() - build_started, trigger="chat")
         
         # 显示在聊天窗口
         # 聊天窗口已移除
@@ -404,9 +613,11 @@ class PetWidget(QWidget):
         """处理用户从窗口输入的聊天消息"""
         self.send_chat_message(message)
     
-    def _on_chat_response(self, response: str):
-        """处理聊天响应"""
-        print(f"Raw Brain Response: {response}")
+    def _on_chat_response(self, response: str, trace_id: str = None):
+        """处理聊天响应（[TEXT]/[STATE] 标签格式）"""
+        logger.info("Raw Brain Response: %s", response)
+        trace_id = trace_id or getattr(self.sender(), 'trace_id', None)
+        parse_started = time.monotonic()
         # 解析响应：可能包含 [TEXT] 和 [STATE]
         text_content = ""
         state_content = ""
@@ -430,54 +641,73 @@ class PetWidget(QWidget):
         # 最终保险：强行抹除 text_content 中可能残留的任何标签字符，确保用户看不到 [TEXT] 或 [STATE]
         text_content = re.sub(r"\[/?(TEXT|STATE)\]", "", text_content, flags=re.IGNORECASE).strip()
 
+        if state_content:
+            # 清理可能的标点符号（如 eat. -> eat）
+            state_content = re.sub(r'[^\w\s]', '', state_content).strip()
+
+        tracer.emit(trace_id, "parse", parse_started, time.monotonic() - parse_started, format="tags")
+        self._apply_reply(text_content, state_content, trace_id)
 
+    def _on_structured_reply(self, reply: dict, trace_id: str = None):
+        """处理结构化响应：state 已被 JSON Schema 枚举约束，直接查表即可"""
+        logger.info("Structured Brain Response: %s", reply)
+        trace_id = trace_id or getattr(self.sender(), 'trace_id', None)
+        tracer.emit(trace_id, "parse", time.monotonic(), 0.0, format="structured")
+        self._apply_reply(reply.get('text', ''), reply.get('state', ''), trace_id)
+
+    def _resolve_state(self, state_content: str):
+        """将模型给出的状态映射为可用动作，无法映射时返回 None"""
+        if state_content in self.animation_frames:
+            return state_content
+        
+        # 映射表：处理模型常见的表达偏差
+        mappings = {
+            "discomfortable": "discomfort",
+            "sad": "discomfort",
+            "hungry": "eat",
+            "eating": "eat",
+            "sleeping": "sleep",
+            "tired": "sleep",
+            "walking": "left", # 默认走路选左
+            "moving": "right"
+        }
+        
+        mapped = mappings.get(state_content)
+        if mapped in self.animation_frames:
+            return mapped
+        return None
+
+    def _apply_reply(self, text_content: str, state_content: str, trace_id: str = None):
+        """显示回复文本并切换状态"""
+        apply_started = time.monotonic()
         # 显示文本气泡
         if text_content:
-            self._show_bubble(text_content, duration=8000)
+            self._show_bubble(text_content, duration=8000, key="reply")
             
         # 切换状态
         if state_content:
-            # 尝试模糊匹配或直接匹配
-            target_state = None
-            # 清理可能的标点符号（如 eat. -> eat）
-            state_content = re.sub(r'[^\w\s]', '', state_content).strip()
-            
-            if state_content in self.animation_frames:
-                target_state = state_content
-            # 映射表：处理模型常见的表达偏差
-            mappings = {
-                "discomfortable": "discomfort",
-                "sad": "discomfort",
-                "hungry": "eat",
-                "eating": "eat",
-                "sleeping": "sleep",
-                "tired": "sleep",
-                "walking": "left", # 默认走路选左
-                "moving": "right"
-            }
+            target_state = self._resolve_state(state_content.lower())
             
-            if not target_state and state_content in mappings:
-                mapped = mappings[state_content]
-                if mapped in self.animation_frames:
-                    target_state = mapped
+            if target_state == "mention":
+                logger.info("LLM 试图调用受限动作 'mention'，已拦截。")
+                target_state = None
             
             if target_state:
-                if target_state == "mention":
-                    print("LLM 试图调用受限动作 'mention'，已拦截。")
-                    target_state = None
-            
-            if target_state:
-                print(f"LLM 请求切换状态: {target_state}")
+                logger.info("LLM 请求切换状态: %s", target_state)
                 self.set_action(target_state)
             else:
-                print(f"LLM 请求了不可用的状态: {state_content}")
+                logger.warning("LLM 请求了不可用的状态: %s", state_content)
+        
+        tracer.emit(trace_id, "ui_apply", apply_started, time.monotonic() - apply_started)
+        self._publish_state(last_reply=text_content)
         
         # 安排下一次“思考”
         self.start_brain()
     
     def _on_chat_error(self, error: str):
         """处理聊天错误"""
-        print(f"Brain Error: {error}")
+        logger.error("Brain Error: %s", error)
+        tracer.emit(getattr(self.sender(), 'trace_id', None), "error", message=error)
         # 安排下一次“思考”
         self.start_brain()
         
@@ -486,51 +716,112 @@ class PetWidget(QWidget):
         import random
         # 随机时间：120秒到480秒之间
         interval = random.randint(120000, 480000)
+        # 无人注视时指数退避
+        if self.brain_scheduler is not None:
+            interval = self.brain_scheduler.next_interval_ms(interval)
+        
+        # Token 预算：超出每小时/每天预算时，拉长间隔直到用量回落
+        budget_delay = self._budget_delay()
+        if budget_delay * 1000 > interval:
+            interval = int(budget_delay * 1000)
+            logger.info("Token 预算已用尽，自主思考推迟 %.0f 秒", budget_delay)
+        
+        if self.power_policy is not None:
+            interval = int(interval * self.power_policy.slowdown)
+            # 没人能看到宠物时不计时，恢复后再开始
+            if self.power_policy.hold_brain(interval):
+                return
+        
         self.brain_timer.start(interval)
-        print(f"下一次自主思考将在 {interval/1000} 秒后发生")
+        logger.info("下一次自主思考将在 %s 秒后发生", interval / 1000)
+        if self.speculator is not None:
+            self.speculator.schedule(interval)
 
     def _on_brain_tick(self):
         """自主思考触发"""
+        # 锁屏或高负载时暂停，稍后再试
+        defer = self.brain_scheduler.defer_ms() if self.brain_scheduler else 0
+        if defer:
+            logger.info("锁屏或系统负载过高，自主思考推迟 %s 秒", defer / 1000)
+            self.brain_timer.start(defer)
+            return
+        # 上下文与预生成时一致则直接显示预生成的独白
+        if self.speculator is not None and self.speculator.deliver():
+            return
         self.send_brain_message()
 
-    def send_brain_message(self):
-        """向 LLM 发送自主思考请求"""
-        # 获取当前 Provider 设置
-        provider = self.config.get('api_provider', 'zhipu')
-        provider_settings = self.config.get('api_settings', {}).get(provider, {})
-        
-        start_api_key = provider_settings.get('api_key', '')
-        if not start_api_key:
-             start_api_key = self.config.get('api_key', '')
+    def _budget_delay(self) -> float:
+        """超出 Token 预算时需要等待的秒数，未超出为 0"""
+        budget = self.config.get('token_budget', {})
+        return usage_ledger.budget_delay(budget.get('hourly', 0), budget.get('daily', 0))
 
-        if not start_api_key or start_api_key == 'YOUR_API_KEY_HERE':
+    def _allows_event(self, event: PetEvent) -> bool:
+        """触发规则的闸门：用户不在、高负载或 Token 预算已用尽时不因事件说话"""
+        if not self.brain_scheduler.allows_event(event):
+            return False
+        if self._budget_delay() > 0:
+            logger.info("Token 预算已用尽，忽略事件 '%s'", event.kind)
+            return False
+        return True
+
+    def _on_brain_event(self, event: PetEvent):
+        """事件触发的即时思考，触发事件直接作为本轮上下文"""
+        if self._llm_busy():
             return
-        
-        # 获取默认配置
-        default_endpoints = {
-            'zhipu': 'https://open.bigmodel.cn/api/paas/v4/chat/completions',
-            'deepseek': 'https://api.deepseek.com/chat/completions',
-            'model_scope': 'https://api-inference.modelscope.cn/v1/chat/completions'
-        }
-        
-        default_models = {
-            'zhipu': 'glm-4-flash',
-            'deepseek': 'deepseek-chat',
-            'model_scope': 'qwen-turbo'
-        }
-        
-        endpoint = provider_settings.get('base_url', '')
-        if not endpoint:
-            endpoint = default_endpoints.get(provider, '')
+        if self.power_policy is not None and self.power_policy.suspended:
+            return
+        logger.info("检测到事件 '%s'，立即触发自主思考", event.kind)
+        self.send_brain_message(event)
+
+    def _llm_busy(self) -> bool:
+        """本宠物有进行中或排队中的 LLM 请求（含预生成）"""
+        worker = self.chat_worker
+        if self.speculator is not None and self.speculator.busy:
+            return True
+        return bool(worker and worker.isRunning()) or llm_dispatcher.pending_count(self) > 0
+
+    def _base_system_prompt(self) -> str:
+        prompt = self.config.get('system_prompt', '你是一个可爱的桌面宠物助手')
+        if self.pet_name:
+            prompt = f"{prompt}\n你的名字是「{self.pet_name}」。"
+        return prompt
+
+    def send_brain_message(self, event: PetEvent = None):
+        """向 LLM 发送自主思考请求，event 为触发本轮思考的事件（可选）"""
+        worker = self._create_brain_worker(event)
+        if worker is None:
+            return
+        if self.trigger_rules is not None:
+            self.trigger_rules.note_turn_started()
+        self.chat_worker = worker
+        self.chat_worker.response_received.connect(self._on_chat_response)
+        self.chat_worker.reply_received.connect(self._on_structured_reply)
+        self.chat_worker.error_occurred.connect(self._on_chat_error)
+        llm_dispatcher.submit(self, self.chat_worker)
+
+    def _apply_speculation(self, speculation):
+        """显示预生成的独白（到期时指纹一致，见 speculative）"""
+        if self.trigger_rules is not None:
+            self.trigger_rules.note_turn_started()
+        if speculation.kind == "structured":
+            self._on_structured_reply(speculation.payload, speculation.trace_id)
         else:
-            endpoint = endpoint.strip('/')
-            if not endpoint.endswith('chat/completions'):
-                endpoint = f"{endpoint}/chat/completions"
+            self._on_chat_response(speculation.payload, speculation.trace_id)
 
-        model = provider_settings.get('model_name', '') or default_models.get(provider, 'glm-4-flash')
+    def _create_brain_worker(self, event: PetEvent = None, trigger: str = None):
+        """构建自主思考的 ChatWorker（未启动），未配置供应商时返回 None"""
+        provider = self._resolve_provider()
+        if provider is None:
+            return None
+        from .chat_worker import ChatWorker
+        from .context_prefetch import context_prefetcher
+        from .tools import tool_manager
+        trace_id = tracer.new_trace_id()
+        build_started = time.monotonic()
+        trigger = trigger or (f"event:{event.kind}" if event is not None else "brain")
         
         # 构建增强型 System Prompt
-        base_prompt = self.config.get('system_prompt', '你是一个可爱的桌面宠物助手')
+        base_prompt = self._base_system_prompt()
         # 过滤掉 mention 动作，模型不允许主动触发它
         allowed_states = [s for s in self.animation_frames.keys() if s != 'mention']
         available_states = ", ".join(allowed_states)
@@ -549,51 +840,106 @@ class PetWidget(QWidget):
 2. 你可以随时调用工具来了解外部世界。
 """
 
+        # 结构化输出模式：用 JSON Schema / set_pet_state 工具替代标签格式
+        structured_mode = structured_output.normalize_mode(self.config.get('structured_output'))
+        structured_prompt = f"""
+{base_prompt}
+
+你需要结合工具返回的信息（如时间、宠物状态等）向用户撒欢或撒娇。
+{structured_output.format_instructions(structured_mode)}
+注意：
+1. 你的话语要短小精悍，通常在 20 字以内。
+2. 你可以随时调用工具来了解外部世界。
+"""
+
+        user_message = "请根据当前情况自主产生一段独白或行为。"
+        if event is not None:
+            # 把触发事件放进上下文，省去模型再调用工具发现变化的一轮往返
+            user_message = f"刚刚发生了：{event.describe()}。请结合这件事自主产生一段独白或行为。"
+
         # 创建工作线程
-        self.chat_worker = ChatWorker(
-            api_key=start_api_key,
-            endpoint=endpoint,
-            model_name=model,
-            system_prompt=system_prompt,
-            user_message="请根据当前情况自主产生一段独白或行为。",
-            tools=tool_manager.get_tool_definitions()
+        worker = ChatWorker(
+            api_key=provider['api_key'],
+            endpoint=provider['endpoint'],
+            model_name=provider['model'],
+            system_prompt=structured_prompt if structured_mode != structured_output.MODE_OFF else system_prompt,
+            user_message=user_message,
+            tools=tool_manager.get_tool_definitions(),
+            structured_mode=structured_mode,
+            structured_states=allowed_states,
+            fallback_system_prompt=system_prompt,
+            provider=provider['provider'],
+            trigger=trigger,
+            trace_id=trace_id,
+            prefetch_tools=context_prefetcher.tool_names()
         )
-        
-        self.chat_worker.response_received.connect(self._on_chat_response)
-        self.chat_worker.error_occurred.connect(self._on_chat_error)
-        self.chat_worker.start()
+        tracer.emit(trace_id, "request_build", build_started, time.monotonic() - build_started, trigger=trigger)
+        return worker
     
-    def _show_bubble(self, text: str, duration: int = 5000):
-        """显示聊天气泡"""
+    def _show_bubble(self, text: str, duration: int = 5000, priority: int = PRIORITY_NORMAL, key: str = None):
+        """显示聊天气泡（经消息队列，key 相同的排队消息会被合并）"""
         if self.chat_bubble:
             # 先更新位置，确保在正确位置显示
             self.update_components_position()
-            self.chat_bubble.show_message(text, duration)
+            self.chat_bubble.enqueue(text, duration, priority, key)
     
     def show_settings(self):
         """显示设置对话框"""
-        dialog = SettingsDialog(self.config, self.config_path, self)
+        from .settings_dialog import SettingsDialog
+        dialog = SettingsDialog(self.config, self.config_path, self, config_service=self.config_service)
         dialog.settings_changed.connect(self._on_settings_changed)
         dialog.exec()
     
     def _on_settings_changed(self, new_config: dict):
-        """处理设置变更"""
-        old_scale = self.current_scale
-        self.config = new_config
-        
-        # 更新动画速度
-        interval = self.config.get('animation_interval', 150)
-        self.animation_timer.setInterval(interval)
-        
-        # 更新缩放
-        new_scale = self.config.get('pet_scale', 0.5)
-        if abs(new_scale - old_scale) > 0.001: 
-            self.current_scale = new_scale
-            self._update_scaled_frames()
-            
-        self._show_current_frame()
-        
-        self._show_bubble("设置已保存~")
+        """设置对话框保存成功（具体变更已由配置服务按键分发）"""
+        self._show_bubble("设置已保存~", priority=PRIORITY_LOW, key="settings")
+
+    def _on_config_key_changed(self, key: str, value):
+        """只针对真正变化的配置项更新对应组件"""
+        if key == 'animation_interval':
+            # 更新动画速度
+            self.animation_timer.setInterval(self._animation_interval())
+        elif key == 'pet_scale':
+            # 更新缩放
+            if abs(value - self.current_scale) > 0.001:
+                self.current_scale = value
+                self._update_scaled_frames()
+                self._show_current_frame()
+        elif key == 'sensors' and self.sensor_hub is not None:
+            self.sensor_hub.update_config(self.config)
+        elif key == 'brain_schedule' and self.brain_scheduler is not None:
+            self.brain_scheduler.update_config(self.config)
+            self.trigger_rules.min_gap = self.brain_scheduler.settings['min_trigger_gap']
+        elif key == 'logging':
+            apply_levels(value)
+        elif key == 'tracing':
+            tracer.configure(value.get('enabled', False), settings=value)
+        elif key == 'metrics':
+            metrics.configure(value)
+        elif key == 'movement':
+            self.movement.update_config(value)
+        elif key == 'power' and self.power_policy is not None:
+            self.power_policy.update_config(self.config)
+        elif key == 'render_mode':
+            self._show_bubble("渲染模式将在重启后生效~", priority=PRIORITY_LOW, key="settings")
+        elif key == 'ipc' and self._startup_done:
+            if self.ipc_server is None:
+                self._init_ipc()
+            else:
+                self.ipc_server.start(value)
+        elif key == 'desktop_geometry' and self._startup_done:
+            desktop_geometry.start(value)
+        elif key == 'speculation' and self.speculator is not None:
+            self.speculator.update_config(value)
+        elif key == 'llm_dispatch':
+            llm_dispatcher.configure(value)
+        elif key == 'context_prefetch':
+            from .context_prefetch import context_prefetcher
+            context_prefetcher.configure(value)
+        elif key == 'tool_sandbox' and self.sensor_hub is not None:
+            from .tool_sandbox import tool_sandbox
+            tool_sandbox.configure(value)
+            tool_sandbox.start()
     
     # toggle_menu 方法已移除
 
@@ -608,6 +954,7 @@ class PetWidget(QWidget):
         if event.button() == Qt.MouseButton.LeftButton:
             self.dragging = True
             self.drag_offset = event.position().toPoint()
+            self.movement.lift()
             self.setCursor(QCursor(Qt.CursorShape.ClosedHandCursor))
             
             # 触发 mention 动作
@@ -623,7 +970,7 @@ class PetWidget(QWidget):
         """鼠标移动"""
         if self.dragging:
             new_pos = event.globalPosition().toPoint() - self.drag_offset
-            self.move(new_pos)
+            self.move(self._from_global(new_pos))
             
             # 位置更新由 moveEvent 自动处理
             
@@ -634,6 +981,8 @@ class PetWidget(QWidget):
         if event.button() == Qt.MouseButton.LeftButton:
             self.dragging = False
             self.setCursor(QCursor(Qt.CursorShape.ArrowCursor))
+            # 放在窗口标题栏附近时站到标题栏上
+            self.movement.land()
             
             # 恢复动作 (如果当前是 mention)
             if self.current_action == 'mention':
@@ -649,6 +998,21 @@ class PetWidget(QWidget):
     def enterEvent(self, event):
         """鼠标进入"""
         self.setCursor(QCursor(Qt.CursorShape.OpenHandCursor))
+        if self.power_policy is not None:
+            self.power_policy.user_interacted()
+    
+    def showEvent(self, event):
+        """窗口显示时立即恢复动画"""
+        super().showEvent(event)
+        self._track_screen()
+        if self.power_policy is not None:
+            self.power_policy.set_hidden(False)
+    
+    def hideEvent(self, event):
+        """窗口隐藏（含最小化）时暂停动画"""
+        super().hideEvent(event)
+        if self.power_policy is not None:
+            self.power_policy.set_hidden(True)
     
     def leaveEvent(self, event):
         """鼠标离开"""
@@ -668,7 +1032,7 @@ class PetWidget(QWidget):
         # menu.addAction(chat_action)
         
         think_action = QAction("💭 强制思考", self)
-        think_action.triggered.connect(self.send_brain_message)
+        think_action.triggered.connect(lambda: self.send_brain_message())
         menu.addAction(think_action)
         
         settings_action = QAction("⚙️ 设置", self)
@@ -708,6 +1072,20 @@ class PetWidget(QWidget):
         # 移除事件过滤器
         QApplication.instance().removeEventFilter(self)
         
+        if self.ipc_server is not None:
+            self.ipc_server.stop()
+        # 丢弃尚未开始的 LLM 请求
+        llm_dispatcher.cancel(self)
+        if self.speculator is not None:
+            self.speculator.cancel()
+        if self.power_policy is not None:
+            self.power_policy.stop()
+        # 不再响应传感器事件（同组时由 PetGroup 在最后一只宠物关闭后取消订阅）
+        if self.group is not None:
+            self.group.remove(self)
+        elif self.trigger_rules is not None:
+            self.trigger_rules.stop()
+        
         if self.chat_bubble:
             self.chat_bubble.close()
         
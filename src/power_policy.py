@@ -0,0 +1,176 @@
+"""
+省电策略模块
+根据锁屏、显示器关闭（DPMS）、全屏应用、宠物窗口是否可见以及是否使用电池，
+暂停或降频动画、行走与自主思考：
+- 没人能看到宠物时（锁屏、熄屏、全屏应用、窗口隐藏）完全暂停，定时器不再唤醒；
+  暂停期间对可见性的复查由共用的 SensorHub 统一进行，间隔指数退避，
+  窗口显示、鼠标移入与屏幕变化时立即复查；
+- 使用电池时降低动画与行走的刷新频率，拉长思考间隔；
+- 宠物重新可见时立即恢复。
+"""
+
+from PyQt6.QtCore import QObject, pyqtSignal
+from PyQt6.QtGui import QGuiApplication
+
+from .event_bus import (
+    event_bus, PetEvent, SESSION_LOCK, FULLSCREEN, DISPLAY_POWER, POWER_SOURCE, BATTERY_LOW
+)
+from .logger import get_logger
+
+logger = get_logger(__name__)
+
+DEFAULT_POWER = {
+    "enabled": True,
+    "pause_on_fullscreen": True,
+    "battery_slowdown": 2,      # 使用电池时动画间隔与思考间隔的倍数
+    "battery_max_fps": 30,      # 使用电池时行走更新频率上限
+    "recheck_seconds": 3,       # 暂停后第一次复查锁屏/全屏/熄屏的间隔，之后逐次加倍
+    "max_recheck_seconds": 30,  # 复查间隔的上限
+}
+
+WATCHED_EVENTS = (SESSION_LOCK, FULLSCREEN, DISPLAY_POWER, POWER_SOURCE, BATTERY_LOW)
+
+MODE_ACTIVE = "active"
+MODE_REDUCED = "reduced"
+MODE_SUSPENDED = "suspended"
+
+
+class PowerPolicy(QObject):
+    """省电策略：汇总各项条件并调整宠物的定时器"""
+
+    # 模式变化：active / reduced / suspended
+    mode_changed = pyqtSignal(str)
+
+    def __init__(self, pet, sensor_hub, config: dict, bus=None, parent=None):
+        super().__init__(parent)
+        self.pet = pet
+        self.sensor_hub = sensor_hub
+        self.bus = bus or event_bus
+        self.settings = {**DEFAULT_POWER, **config.get('power', {})}
+        self.mode = MODE_ACTIVE
+        self.hidden = not pet.isVisible()
+        self._brain_remaining = None
+
+        # 暂停期间的可见性复查由 SensorHub 进行（同组宠物共用一个定时器，见 watch_visibility）；
+        # 屏幕增删或主屏变化（如显示器唤醒后重新连接）时立即复查
+        app = QGuiApplication.instance()
+        if app is not None:
+            app.screenAdded.connect(self._on_screens_changed)
+            app.screenRemoved.connect(self._on_screens_changed)
+            app.primaryScreenChanged.connect(self._on_screens_changed)
+
+        for kind in WATCHED_EVENTS:
+            self.bus.subscribe(kind, self._on_event)
+        # 首次采样不发布事件，采样结果合并后统一复核
+        sensor_hub.probed.connect(self.evaluate)
+
+    def update_config(self, config: dict):
+        self.settings = {**DEFAULT_POWER, **config.get('power', {})}
+        self.evaluate()
+
+    def stop(self):
+        """宠物关闭：不再接收事件，也不再让共用的 SensorHub 为本宠物复查"""
+        for kind in WATCHED_EVENTS:
+            self.bus.unsubscribe(kind, self._on_event)
+        self.sensor_hub.unwatch_visibility(self)
+
+    # ===== 条件 =====
+
+    @property
+    def on_battery(self) -> bool:
+        battery = self.sensor_hub.snapshot['battery']
+        return bool(battery.get('has_battery')) and not battery.get('power_plugged', True)
+
+    def invisible_reasons(self) -> list:
+        snap = self.sensor_hub.snapshot
+        reasons = []
+        if snap['locked']:
+            reasons.append("locked")
+        if snap.get('display_off'):
+            reasons.append("display_off")
+        if snap.get('fullscreen') and self.settings['pause_on_fullscreen']:
+            reasons.append("fullscreen")
+        if self.hidden:
+            reasons.append("hidden")
+        return reasons
+
+    def _on_event(self, event: PetEvent):
+        self.evaluate()
+
+    def set_hidden(self, hidden: bool):
+        """宠物窗口显示/隐藏时由 PetWidget 调用，显示时立即恢复"""
+        if hidden != self.hidden:
+            self.hidden = hidden
+            self.evaluate()
+
+    def user_interacted(self):
+        """用户与宠物交互（鼠标进入、点击）说明宠物可见，立即复查"""
+        if self.mode == MODE_SUSPENDED:
+            self._recheck()
+
+    def _on_screens_changed(self, *_args):
+        if self.mode == MODE_SUSPENDED:
+            self._recheck()
+
+    def _recheck(self):
+        """只采样决定可见性的传感器（后台线程，不阻塞 GUI），结果经 probed 信号回来后复核"""
+        self.sensor_hub.recheck_visibility()
+
+    # ===== 应用 =====
+
+    def evaluate(self):
+        if not self.settings['enabled']:
+            mode = MODE_ACTIVE
+        elif self.invisible_reasons():
+            mode = MODE_SUSPENDED
+        elif self.on_battery:
+            mode = MODE_REDUCED
+        else:
+            mode = MODE_ACTIVE
+        if mode == self.mode:
+            return
+        previous, self.mode = self.mode, mode
+        logger.info("省电策略: %s -> %s %s", previous, mode, self.invisible_reasons() or "")
+        self._apply(previous)
+        self.mode_changed.emit(mode)
+
+    @property
+    def suspended(self) -> bool:
+        return self.mode == MODE_SUSPENDED
+
+    @property
+    def slowdown(self) -> float:
+        """动画间隔与思考间隔的倍数"""
+        return self.settings['battery_slowdown'] if self.mode == MODE_REDUCED else 1
+
+    def hold_brain(self, interval_ms: int) -> bool:
+        """暂停期间安排的思考先保存下来，恢复后再开始计时；返回是否已保存"""
+        if self.mode != MODE_SUSPENDED:
+            return False
+        self._brain_remaining = interval_ms
+        return True
+
+    @property
+    def movement_fps_cap(self):
+        return self.settings['battery_max_fps'] if self.mode == MODE_REDUCED else None
+
+    def _apply(self, previous: str):
+        pet = self.pet
+        if self.mode == MODE_SUSPENDED:
+            pet.animation_timer.stop()
+            pet.movement.pause()
+            # 暂停思考定时器，恢复时继续剩余的时间
+            if pet.brain_timer.isActive():
+                self._brain_remaining = pet.brain_timer.remainingTime()
+                pet.brain_timer.stop()
+            self.sensor_hub.watch_visibility(
+                self, self.settings['recheck_seconds'], self.settings['max_recheck_seconds'])
+            return
+
+        self.sensor_hub.unwatch_visibility(self)
+        pet.movement.set_fps_cap(self.movement_fps_cap)
+        pet.start_animation()
+        pet.movement.resume()
+        if previous == MODE_SUSPENDED and self._brain_remaining is not None:
+            pet.brain_timer.start(max(0, self._brain_remaining))
+            self._brain_remaining = None
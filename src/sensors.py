@@ -0,0 +1,277 @@
+"""
+传感器采样模块
+周期性读取 tools.py 提供的传感器（空闲时间、锁屏、CPU、电量、活动窗口、时间段），
+保存最新快照，并在状态发生变化时向事件总线发布事件。
+传感器在后台线程读取，快照只在 GUI 线程修改；采样完成后发出 probed 信号。
+"""
+
+import threading
+import time
+from datetime import datetime
+from PyQt6.QtCore import QObject, QTimer, pyqtSignal
+from PyQt6.QtGui import QCursor
+
+from .event_bus import (
+    event_bus, PetEvent, BATTERY_LOW, WINDOW_FOCUS, TIME_PERIOD,
+    CPU_SPIKE, SESSION_LOCK, USER_RETURNED, USER_AWAY,
+    FULLSCREEN, DISPLAY_POWER, POWER_SOURCE
+)
+from .tools import (
+    read_system_health, read_battery_status, read_active_window,
+    read_idle_seconds, read_session_locked, read_display_off
+)
+
+# 默认采样参数（可通过 config["sensors"] 覆盖）
+DEFAULT_SENSORS = {
+    "probe_interval": 30,   # 采样间隔（秒）
+    "away_seconds": 300,    # 空闲超过该时间视为离开
+    "cpu_spike": 75         # CPU 突增阈值
+}
+
+
+def current_period(hour: int) -> str:
+    if 6 <= hour < 12:
+        return "morning"
+    if 12 <= hour < 18:
+        return "afternoon"
+    if 18 <= hour < 24:
+        return "evening"
+    return "night"
+
+
+def window_category(window: dict) -> str:
+    if window.get('is_coding'):
+        return "coding"
+    if window.get('is_browsing'):
+        return "browsing"
+    return "other"
+
+
+class SensorHub(QObject):
+    """传感器采样器：维护快照并发布变化事件"""
+
+    # 一次采样的结果已合并进快照（GUI 线程）
+    probed = pyqtSignal()
+    # 后台线程读到的原始值，排队回到 GUI 线程
+    _sampled = pyqtSignal(object)
+
+    def __init__(self, config: dict, bus=None, parent=None):
+        super().__init__(parent)
+        self.bus = bus or event_bus
+        self.settings = dict(DEFAULT_SENSORS)
+        self.settings.update(config.get('sensors', {}))
+
+        # 最新传感器快照
+        self.snapshot = {
+            "idle_seconds": 0.0,
+            "locked": False,
+            "cpu_usage": 0.0,
+            "battery": {"has_battery": False},
+            "active_window": {},
+            "fullscreen": False,
+            "display_off": False,
+            "period": current_period(datetime.now().hour)
+        }
+
+        self._last_cursor_pos = None
+        self._last_probe_time = None
+        self._away = False
+        self._probing = False
+        self._queued = None   # 采样进行中时又请求的采样（True 表示只需可见性）
+        self._sampled.connect(self._apply)
+
+        self.probe_timer = QTimer(self)
+        self.probe_timer.timeout.connect(self.probe)
+
+        # 有宠物暂停期间的可见性复查：共用此采样器的宠物只共用一个定时器，间隔指数退避
+        self._recheck_owners = set()
+        self._recheck_seconds = (0.0, 0.0)   # (初始间隔, 最长间隔)
+        self._recheck_interval = 0.0
+        self._recheck_timer = QTimer(self)
+        self._recheck_timer.setSingleShot(True)
+        self._recheck_timer.timeout.connect(self._visibility_recheck)
+
+    def start(self):
+        """开始周期性采样"""
+        self.probe_timer.start(int(self.settings['probe_interval'] * 1000))
+        self.probe()
+
+    def stop(self):
+        self.probe_timer.stop()
+        self._recheck_timer.stop()
+
+    def update_config(self, config: dict):
+        self.settings = dict(DEFAULT_SENSORS)
+        self.settings.update(config.get('sensors', {}))
+        if self.probe_timer.isActive():
+            self.probe_timer.setInterval(int(self.settings['probe_interval'] * 1000))
+
+    # ===== 暂停期间的可见性复查 =====
+
+    def watch_visibility(self, owner, base_seconds: float, max_seconds: float):
+        """owner（宠物的省电策略）进入暂停：开始复查锁屏、熄屏与全屏，从 base_seconds 起退避到 max_seconds"""
+        first = not self._recheck_owners
+        self._recheck_owners.add(owner)
+        if first:
+            self._recheck_seconds = (base_seconds, max(base_seconds, max_seconds))
+            self._restart_recheck()
+
+    def unwatch_visibility(self, owner):
+        """owner 恢复：没有暂停中的宠物时停止复查"""
+        self._recheck_owners.discard(owner)
+        if not self._recheck_owners:
+            self._recheck_timer.stop()
+
+    def recheck_visibility(self):
+        """立即复查一次（显示、鼠标移入、屏幕变化等迹象表明宠物可能重新可见），退避从头开始"""
+        self.probe(visibility_only=True)
+        if self._recheck_owners:
+            self._restart_recheck()
+
+    def _restart_recheck(self):
+        self._recheck_interval = self._recheck_seconds[0]
+        self._recheck_timer.start(int(self._recheck_interval * 1000))
+
+    def _visibility_recheck(self):
+        self.probe(visibility_only=True)
+        self._recheck_interval = min(self._recheck_interval * 2, self._recheck_seconds[1])
+        self._recheck_timer.start(int(self._recheck_interval * 1000))
+
+    def _publish(self, kind: str, **payload):
+        self.bus.publish(PetEvent(kind, payload))
+
+    # ===== 采样 =====
+    # 传感器依赖 xprop、loginctl 等外部命令（各自最多等待 2 秒），在后台线程读取原始值，
+    # 经排队信号回到 GUI 线程比较快照并发布事件（与 EventBus 的跨线程投递相同）
+
+    def probe(self, visibility_only: bool = False):
+        """开始一次采样（不阻塞）；visibility_only 只读取锁屏、熄屏与全屏"""
+        if self._probing:
+            # 进行中的采样结束后补一次，完整采样优先
+            self._queued = visibility_only and self._queued is not False
+            return
+        self._probing = True
+        # QCursor 只能在 GUI 线程读取
+        cursor_pos = QCursor.pos() if not visibility_only else None
+        was_fullscreen = self.snapshot['fullscreen']
+        threading.Thread(
+            target=self._sample, args=(visibility_only, was_fullscreen, cursor_pos),
+            name="SensorProbe", daemon=True
+        ).start()
+
+    def _sample(self, visibility_only: bool, was_fullscreen: bool, cursor_pos):
+        """后台线程：只读取原始值，不修改任何状态"""
+        raw = {
+            "locked": bool(read_session_locked()),
+            "display_off": bool(read_display_off()),
+        }
+        if visibility_only:
+            # 只有已处于全屏时才需要确认是否退出
+            if was_fullscreen:
+                try:
+                    raw['active_window'] = read_active_window()
+                except Exception:
+                    raw['active_window'] = {}
+        else:
+            raw['idle_seconds'] = read_idle_seconds()
+            raw['cursor_pos'] = cursor_pos
+            try:
+                raw['cpu_usage'] = read_system_health()['cpu_usage']
+                raw['battery'] = read_battery_status()
+            except ImportError:
+                pass
+            try:
+                raw['active_window'] = read_active_window()
+            except Exception:
+                pass
+        try:
+            self._sampled.emit(raw)
+        except RuntimeError:
+            pass  # 采样器已销毁
+
+    def _read_idle(self, idle, cursor_pos, now: float) -> float:
+        """优先使用 xprintidle，不可用时以光标是否移动估算空闲时间"""
+        if idle is None:
+            if self._last_cursor_pos is not None and cursor_pos == self._last_cursor_pos:
+                idle = self.snapshot['idle_seconds'] + (now - self._last_probe_time)
+            else:
+                idle = 0.0
+        self._last_cursor_pos = cursor_pos
+        return idle
+
+    def _apply(self, raw: dict):
+        """GUI 线程：合并采样结果，并对发生变化的状态发布事件"""
+        self._probing = False
+        try:
+            self._apply_sample(raw)
+        finally:
+            self.probed.emit()
+            if self._queued is not None:
+                visibility_only, self._queued = self._queued, None
+                self.probe(visibility_only)
+
+    def _apply_sample(self, raw: dict):
+        now = time.monotonic()
+        full = 'idle_seconds' in raw
+        first = full and self._last_probe_time is None
+        prev = dict(self.snapshot)
+        snap = self.snapshot
+
+        if full:
+            snap['idle_seconds'] = self._read_idle(raw['idle_seconds'], raw['cursor_pos'], now)
+            self._last_probe_time = now
+
+        locked = raw['locked']
+        snap['locked'] = locked
+        if not first and locked != prev['locked']:
+            self._publish(SESSION_LOCK, locked=locked)
+
+        display_off = raw['display_off']
+        snap['display_off'] = display_off
+        if not first and display_off != prev['display_off']:
+            self._publish(DISPLAY_POWER, off=display_off)
+
+        away = locked or snap['idle_seconds'] >= self.settings['away_seconds']
+        if full and away != self._away:
+            self._away = away
+            if not first:
+                self._publish(USER_AWAY if away else USER_RETURNED)
+
+        if 'cpu_usage' in raw:
+            cpu = raw['cpu_usage']
+            snap['cpu_usage'] = cpu
+            threshold = self.settings['cpu_spike']
+            if not first and cpu >= threshold > prev['cpu_usage']:
+                self._publish(CPU_SPIKE, cpu_usage=cpu)
+
+            battery = raw['battery']
+            was_low = prev['battery'].get('is_low') and not prev['battery'].get('power_plugged')
+            snap['battery'] = battery
+            # 首次采样没有之前的状态可比较，启动时电量已低不算“变低”
+            if (not first and battery.get('has_battery') and battery['is_low']
+                    and not battery['power_plugged'] and not was_low):
+                self._publish(BATTERY_LOW, percent=battery['percent'])
+            if not first and battery.get('power_plugged') != prev['battery'].get('power_plugged'):
+                self._publish(POWER_SOURCE, plugged=battery.get('power_plugged'))
+
+        if 'active_window' in raw:
+            window = raw['active_window']
+            if full:
+                snap['active_window'] = window
+                if not first and window.get('active_window') != prev['active_window'].get('active_window'):
+                    self._publish(
+                        WINDOW_FOCUS,
+                        title=window.get('active_window'),
+                        category=window_category(window),
+                        previous_category=window_category(prev['active_window'])
+                    )
+            fullscreen = bool(window.get('is_fullscreen'))
+            snap['fullscreen'] = fullscreen
+            if not first and fullscreen != prev['fullscreen']:
+                self._publish(FULLSCREEN, active=fullscreen)
+
+        if full:
+            period = current_period(datetime.now().hour)
+            snap['period'] = period
+            if not first and period != prev['period']:
+                self._publish(TIME_PERIOD, period=period)
@@ -1,3 +1,4 @@
+import copy
 import json
 import os
 from PyQt6.QtWidgets import (
@@ -22,10 +23,12 @@ class SettingsDialog(QDialog):
     
     settings_changed = pyqtSignal(dict)
     
-    def __init__(self, config: dict, config_path: str, parent=None):
+    def __init__(self, config: dict, config_path: str, parent=None, config_service=None):
         super().__init__(parent)
-        self.config = config.copy()
+        # 深拷贝，避免在保存前修改到共享的嵌套配置（如 api_settings）
+        self.config = copy.deepcopy(config)
         self.config_path = config_path
+        self.config_service = config_service
         self.setup_ui()
         self.load_settings()
         
@@ -387,8 +390,12 @@ class SettingsDialog(QDialog):
             self.config['system_prompt'] = "你是一个可爱的桌面宠物助手。"
 
         try:
-            with open(self.config_path, 'w', encoding='utf-8') as f:
-                json.dump(self.config, f, ensure_ascii=False, indent=4)
+            if self.config_service is not None:
+                # 原子写入，并只对变化的配置项发出通知
+                self.config_service.save(self.config)
+            else:
+                with open(self.config_path, 'w', encoding='utf-8') as f:
+                    json.dump(self.config, f, ensure_ascii=False, indent=4)
             self.settings_changed.emit(self.config)
             self.accept()
         except Exception as e:
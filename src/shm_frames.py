@@ -0,0 +1,599 @@
+"""
+共享内存帧缓存模块
+同一台机器上的多个宠物进程（多席位、终端服务器上每个用户一个进程）共用一份解码并缩放好的帧：
+- 第一个进程加载完全部动作后，把当前缩放比例与 DPR 下的预乘 ARGB32 缩放帧写入
+  /dev/shm 下的一个段文件（带版本号的索引，按素材目录 + 缩放比例 + DPR 区分，素材内容变化后自动换名）；
+- 之后启动的进程直接映射该文件，用 QImage 零拷贝包装其中的像素，不再解码与缩放，
+  帧数据只占用共享的页面，每个进程只额外转换正在播放的少数几个动作用于显示。
+
+段文件先写到临时文件再以硬链接原子发布，读者不会看到写了一半的段；以私有写时复制方式映射，
+即使 Qt 写入像素也不会影响其他进程。段按 DPR 分别映射，不同 DPR 屏幕上的宠物各用各的段，
+没有对应段的 DPR 本地解码（只解码正在显示的动作，整套素材的发布在空闲时间片逐个动作进行）；
+缩放比例改变时重新映射。
+
+/dev/shm 占用的是内存：映射段的进程对段文件持有共享 flock（mmap 复制了描述符，锁随映射存在），
+发布者在使用对应的缩放比例期间也持有；
+发布与映射时回收本用户的、没有任何进程持有的段（旧缩放比例、旧版素材）以及已退出进程留下的临时文件。
+
+段文件布局：
+    头部（HEADER）| 按 DATA_ALIGN 对齐的帧像素 | JSON 索引
+"""
+
+import fcntl
+import hashlib
+import json
+import mmap
+import os
+import stat
+import struct
+import tempfile
+from collections import OrderedDict
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from PyQt6 import sip
+from PyQt6.QtCore import Qt, QPoint, QSize
+from PyQt6.QtGui import QImage, QPixmap
+
+from .asset_preprocess import FRAME_FORMAT, IMAGE_EXTENSIONS, MANIFEST_VERSION, _image_bytes
+from .frame_store import FrameStore, frame_input_region, normalize_dpr, shadow_extent
+from .logger import get_logger
+from .metrics import metrics, CACHE_LOOKUPS
+
+logger = get_logger(__name__)
+
+DEFAULT_SHARED_FRAMES = {
+    "enabled": False,
+    "directory": "",     # 为空时使用 /dev/shm（不存在时使用临时目录）
+    "max_mb": 256,       # 单个段文件的大小上限
+    "trusted_uids": [],  # 除本用户与 root 外，接受哪些用户发布的段（如多用户主机上统一发布的账号）
+}
+
+SEGMENT_PREFIX = "digital-pet-frames"
+MAGIC = b"DPETFRM\0"
+LAYOUT_VERSION = 1
+# 魔数、布局版本、索引长度、索引偏移
+HEADER = struct.Struct("<8sIIQ")
+DATA_ALIGN = 64
+# 共享模式下每个进程保留显示用 QPixmap 的动作数
+DISPLAY_CACHE_ACTIONS = 4
+
+
+def default_directory() -> str:
+    if os.path.isdir("/dev/shm") and os.access("/dev/shm", os.W_OK):
+        return "/dev/shm"
+    return tempfile.gettempdir()
+
+
+def _align(offset: int) -> int:
+    return (offset + DATA_ALIGN - 1) // DATA_ALIGN * DATA_ALIGN
+
+
+class SharedSegment:
+    """已映射的段：动作名 -> 零拷贝包装的 QImage 列表"""
+
+    def __init__(self, path: str, buffer: mmap.mmap, index: dict):
+        self.path = path
+        self.scale = index["scale"]
+        self.dpr = index["dpr"]
+        self.order: List[str] = list(index["actions"])
+        self.anchors: Dict[str, Tuple[int, int]] = {}
+        self.actions: Dict[str, List[QImage]] = {}
+        # QImage 不持有像素内存，映射与视图必须和段对象一起存活（不主动关闭）
+        self._buffer = buffer
+        self._view = memoryview(buffer)
+        images: Dict[int, QImage] = {}
+        for name, entry in index["actions"].items():
+            self.anchors[name] = tuple(entry["anchor"])
+            frames = []
+            for offset, width, height, bytes_per_line in entry["frames"]:
+                image = images.get(offset)
+                if image is None:
+                    view = self._view[offset:offset + bytes_per_line * height]
+                    image = images[offset] = QImage(sip.voidptr(view), width, height, bytes_per_line, FRAME_FORMAT)
+                frames.append(image)
+            self.actions[name] = frames
+        self.frame_count = len(images)
+
+
+class SharedFrameCache:
+    """按素材目录定位、映射与发布段文件"""
+
+    def __init__(self, assets_path: str, settings: dict = None):
+        self.assets_path = os.path.abspath(assets_path)
+        self.settings = {**DEFAULT_SHARED_FRAMES, **(settings or {})}
+        self.directory = self.settings["directory"] or default_directory()
+        self.trusted_uids = {os.getuid(), 0} | {int(uid) for uid in self.settings["trusted_uids"]}
+        self._signature = None
+        # 段路径 -> 持有共享锁的文件描述符（本进程发布且仍在使用的段）
+        self._holds: Dict[str, int] = {}
+
+    def signature(self) -> str:
+        """素材内容签名（文件名、大小、修改时间），素材更新后段文件随之换名"""
+        if self._signature is None:
+            digest = hashlib.blake2b(digest_size=8)
+            # 裁剪边距由阴影范围与缩放比例决定，阴影变化后不再共用旧的段
+            digest.update(f"{LAYOUT_VERSION}|{MANIFEST_VERSION}|{FRAME_FORMAT}|{shadow_extent()}".encode())
+            for sub in ("actions", "expressions"):
+                root = os.path.join(self.assets_path, sub)
+                for dirpath, dirnames, filenames in os.walk(root):
+                    dirnames.sort()
+                    for filename in sorted(filenames):
+                        if not filename.lower().endswith(IMAGE_EXTENSIONS + ('.json',)):
+                            continue
+                        path = os.path.join(dirpath, filename)
+                        try:
+                            stat = os.stat(path)
+                        except OSError:
+                            continue
+                        rel = os.path.relpath(path, self.assets_path)
+                        digest.update(f"{rel}|{stat.st_size}|{stat.st_mtime_ns}\n".encode())
+            self._signature = digest.hexdigest()
+        return self._signature
+
+    def _variant(self, scale: float, dpr: float) -> str:
+        key = f"{self.assets_path}|{scale}|{dpr}".encode()
+        return hashlib.blake2b(key, digest_size=4).hexdigest()
+
+    def segment_path(self, scale: float, dpr: float) -> str:
+        name = f"{SEGMENT_PREFIX}-{self._variant(scale, dpr)}-{self.signature()}"
+        return os.path.join(self.directory, name)
+
+    # ===== 读取 =====
+
+    def _open_segment(self, path: str) -> Optional[int]:
+        """打开段文件；目录对所有用户可写，只接受受信任用户发布的、他人不可写的普通文件"""
+        try:
+            # 不跟随符号链接；FIFO 等特殊文件不会阻塞在 open 上
+            fd = os.open(path, os.O_RDONLY | os.O_NOFOLLOW | os.O_NONBLOCK | os.O_CLOEXEC)
+        except FileNotFoundError:
+            return None
+        except OSError as e:
+            logger.warning("无法打开共享帧缓存 %s: %s", path, e)
+            return None
+        info = os.fstat(fd)
+        if (not stat.S_ISREG(info.st_mode) or info.st_uid not in self.trusted_uids
+                or info.st_mode & (stat.S_IWGRP | stat.S_IWOTH)):
+            logger.warning("忽略不可信的共享帧缓存 %s（uid=%d, mode=%o）", path, info.st_uid, info.st_mode)
+            os.close(fd)
+            return None
+        return fd
+
+    def attach(self, scale: float, dpr: float) -> Optional[SharedSegment]:
+        """映射已发布的段，不存在、不可信或无效时返回 None"""
+        path = self.segment_path(scale, dpr)
+        fd = self._open_segment(path)
+        if fd is None:
+            return None
+        try:
+            # 映射存活期间段不会被回收；加锁失败说明正在被回收
+            fcntl.flock(fd, fcntl.LOCK_SH | fcntl.LOCK_NB)
+            size = os.fstat(fd).st_size
+            if size < HEADER.size:
+                return None
+            # 私有写时复制映射：页面与其他进程共享，Qt 的写入只影响本进程
+            buffer = mmap.mmap(fd, size, flags=mmap.MAP_PRIVATE,
+                               prot=mmap.PROT_READ | mmap.PROT_WRITE)
+        except BlockingIOError:
+            return None
+        except (OSError, ValueError) as e:
+            logger.warning("映射共享帧缓存失败 %s: %s", path, e)
+            return None
+        finally:
+            os.close(fd)
+
+        index = self._read_index(buffer, size, scale, dpr)
+        if index is None:
+            logger.warning("共享帧缓存无效，忽略: %s", path)
+            buffer.close()
+            return None
+        segment = SharedSegment(path, buffer, index)
+        logger.info("使用共享帧缓存 %s（%d 个动作，%d 帧，%.1f MB）",
+                    path, len(segment.order), segment.frame_count, size / 1048576)
+        self.collect_garbage()
+        return segment
+
+    def release(self, path: str):
+        """发布者不再使用某个段（没有其他进程映射时可以被回收）"""
+        fd = self._holds.pop(path, None)
+        if fd is not None:
+            os.close(fd)
+
+    def release_all(self):
+        for path in list(self._holds):
+            self.release(path)
+
+    @staticmethod
+    def _read_index(buffer: mmap.mmap, size: int, scale: float, dpr: float) -> Optional[dict]:
+        magic, version, index_len, index_offset = HEADER.unpack_from(buffer, 0)
+        if magic != MAGIC or version != LAYOUT_VERSION or index_offset + index_len > size:
+            return None
+        try:
+            index = json.loads(bytes(buffer[index_offset:index_offset + index_len]))
+            if index["scale"] != scale or index["dpr"] != dpr:
+                return None
+            # 越界的帧会在访问时崩溃，逐项检查
+            for entry in index["actions"].values():
+                QPoint(*entry["anchor"])
+                for offset, width, height, bytes_per_line in entry["frames"]:
+                    if (width <= 0 or height <= 0 or bytes_per_line < width * 4 or offset < HEADER.size
+                            or offset + bytes_per_line * height > index_offset):
+                        return None
+        except (ValueError, KeyError, TypeError, AttributeError):
+            return None
+        return index
+
+    # ===== 发布 =====
+
+    def publish(self, scale: float, dpr: float, actions: Dict[str, Tuple[List[QImage], QPoint]]) -> bool:
+        """写入段文件并原子发布；已有其他进程发布时直接返回"""
+        path = self.segment_path(scale, dpr)
+        if os.path.lexists(path):
+            return False
+
+        # 相同的帧只写一次
+        offsets: Dict[int, int] = {}
+        images: List[QImage] = []
+        entries = {}
+        offset = _align(HEADER.size)
+        for name, (frames, anchor) in actions.items():
+            frame_entries = []
+            for image in frames:
+                if id(image) not in offsets:
+                    offsets[id(image)] = offset
+                    images.append(image)
+                    offset = _align(offset + image.sizeInBytes())
+                frame_entries.append([offsets[id(image)], image.width(), image.height(), image.bytesPerLine()])
+            entries[name] = {"anchor": [anchor.x(), anchor.y()], "frames": frame_entries}
+        index = json.dumps({"scale": scale, "dpr": dpr, "actions": entries}).encode()
+        total = offset + len(index)
+        if total > self.settings["max_mb"] * 1048576:
+            logger.warning("共享帧缓存需要 %.1f MB，超过上限 %s MB，不发布", total / 1048576, self.settings["max_mb"])
+            return False
+
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        hold = None
+        try:
+            fd = os.open(tmp_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY | os.O_CLOEXEC, 0o644)
+            # 发布前就持有共享锁，其他进程的回收不会删掉刚发布的段
+            hold = os.open(tmp_path, os.O_RDONLY | os.O_CLOEXEC)
+            fcntl.flock(hold, fcntl.LOCK_SH)
+            with os.fdopen(fd, 'wb') as f:
+                f.write(HEADER.pack(MAGIC, LAYOUT_VERSION, len(index), offset))
+                for image in images:
+                    f.seek(offsets[id(image)])
+                    f.write(_image_bytes(image))
+                f.seek(offset)
+                f.write(index)
+                # 发布后只读，其他用户的进程也能映射
+                os.fchmod(f.fileno(), 0o444)
+            os.link(tmp_path, path)
+        except OSError as e:
+            if not isinstance(e, FileExistsError):
+                logger.warning("发布共享帧缓存失败 %s: %s", path, e)
+            if hold is not None:
+                os.close(hold)
+            return False
+        finally:
+            try:
+                os.unlink(tmp_path)
+            except OSError:
+                pass
+
+        self.release(path)
+        self._holds[path] = hold
+        logger.info("已发布共享帧缓存 %s（%d 帧，%.1f MB）", path, len(images), total / 1048576)
+        self.collect_garbage()
+        return True
+
+    def collect_garbage(self):
+        """删除本用户的、没有进程持有的段（已映射的进程不受影响），以及已退出进程留下的临时文件"""
+        try:
+            names = os.listdir(self.directory)
+        except OSError:
+            return
+        uid = os.getuid()
+        for name in names:
+            if not name.startswith(SEGMENT_PREFIX + "-"):
+                continue
+            path = os.path.join(self.directory, name)
+            if name.endswith(".tmp"):
+                self._remove_orphan_tmp(path, name)
+                continue
+            try:
+                fd = os.open(path, os.O_RDONLY | os.O_NOFOLLOW | os.O_NONBLOCK | os.O_CLOEXEC)
+            except OSError:
+                continue
+            try:
+                info = os.fstat(fd)
+                if not stat.S_ISREG(info.st_mode) or info.st_uid != uid:
+                    continue
+                # 排他锁失败说明有进程（包括本进程）正在使用
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                os.unlink(path)
+                logger.info("回收不再使用的共享帧缓存 %s（%.1f MB）", path, info.st_size / 1048576)
+            except OSError:
+                pass
+            finally:
+                os.close(fd)
+
+    @staticmethod
+    def _remove_orphan_tmp(path: str, name: str):
+        try:
+            pid = int(name.rsplit(".", 2)[-2])
+            os.kill(pid, 0)
+            return  # 发布者还在写
+        except ProcessLookupError:
+            pass
+        except (ValueError, IndexError, OSError):
+            return
+        try:
+            if os.lstat(path).st_uid == os.getuid():
+                os.unlink(path)
+        except OSError:
+            pass
+
+
+class SharedFrameStore(FrameStore):
+    """优先使用共享内存段的 FrameStore：段按 DPR 分别映射（与 FrameStore 按 DPR 分别缓存缩放帧相同），
+    没有对应段的 DPR 由内部的本地 FrameStore 解码缩放，并在全部动作加载完成后发布段供其他进程使用"""
+
+    def __init__(self, assets_path: str, scale: float = 1.0, settings: dict = None):
+        super().__init__(assets_path, scale)
+        self.cache = SharedFrameCache(assets_path, settings)
+        # DPR -> 已映射的段（None 表示该 DPR 没有可用的段）
+        self.segments: Dict[float, Optional[SharedSegment]] = {}
+        # frames 中引用了其像素的段所在的 DPR，这些段在重新加载前不能释放
+        self._pinned = set()
+        # 没有对应段的 DPR 使用本地解码，第一次需要时创建
+        self._local: Optional[FrameStore] = None
+        # 全部动作已加载（publish 被调用过）；已发布与正在发布的 (缩放比例, DPR)
+        self._complete = False
+        self._published = set()
+        self._publishing = set()
+        # 等待发布的 (缩放比例, DPR)（由宠物通过 take_idle_jobs 取出，在空闲时间片逐个动作执行）
+        self._publish_queue: List[Tuple[float, float]] = []
+        self._aliases: Dict[str, str] = {}
+        # DPR -> 动作名 -> 显示用 QPixmap（每个 DPR 只保留最近播放的几个动作）
+        self._display: Dict[float, "OrderedDict[str, List[QPixmap]]"] = {}
+
+    def _segment(self, dpr: float) -> Optional[SharedSegment]:
+        """某个 DPR 的段，每个 DPR 只尝试映射一次"""
+        if dpr not in self.segments:
+            self.segments[dpr] = self.cache.attach(self.scale, dpr)
+            if metrics.enabled:
+                CACHE_LOOKUPS.inc(cache="shared_segment", result="miss" if self.segments[dpr] is None else "hit")
+            if self.segments[dpr] is None and self._complete:
+                logger.info("DPR %s 没有共享帧缓存，改为本地解码", dpr)
+        return self.segments[dpr]
+
+    def _local_store(self) -> FrameStore:
+        if self._local is None:
+            self._local = FrameStore(self.assets_path, self.scale)
+            self._local.set_dpr(self.dpr)
+        return self._local
+
+    def _ensure_local(self, name: str) -> FrameStore:
+        """本地解码某个动作（别名与表情按各自的方式加载）"""
+        local = self._local_store()
+        if name not in local.frames:
+            target = self._aliases.get(name)
+            if target is not None:
+                self._ensure_local(target)
+                local.alias(name, target)
+            elif name.startswith("expr:"):
+                local.load_expressions()
+            else:
+                local.load_action(name)
+        return local
+
+    # ===== 加载 =====
+
+    def load_action(self, name: str) -> bool:
+        if name in self.frames:
+            return True
+        # 第一次加载时 DPR 已按宠物所在屏幕设置好
+        segment = self._segment(self.dpr)
+        if segment is not None and name in segment.actions:
+            self._add_shared(name, segment)
+            return True
+        if not self._local_store().load_action(name):
+            return False
+        self._add_local(name)
+        return True
+
+    def load_expressions(self) -> List[str]:
+        if self._expression_names is not None:
+            return list(self._expression_names)
+        segment = self._segment(self.dpr)
+        if segment is not None:
+            names = [name for name in segment.order if name.startswith("expr:")]
+            for name in names:
+                self._add_shared(name, segment)
+        else:
+            names = self._local_store().load_expressions()
+            for name in names:
+                self._add_local(name)
+        self._expression_names = names
+        return list(names)
+
+    def alias(self, name: str, target: str):
+        self._aliases[name] = target
+        self.frames[name] = self.frames[target]
+        self.anchors[name] = self.anchors[target]
+        self.masks[name] = self.masks[target]
+        if self._local is not None and target in self._local.frames:
+            self._local.alias(name, target)
+
+    def _add_shared(self, name: str, segment: SharedSegment):
+        images = segment.actions[name]
+        self.frames[name] = images
+        self.anchors[name] = QPoint(*segment.anchors[name])
+        self.masks[name] = [self._image_mask(image, segment.dpr) for image in images]
+        self._pinned.add(segment.dpr)
+
+    def _add_local(self, name: str):
+        local = self._local
+        self.frames[name] = local.frames[name]
+        self.anchors[name] = local.anchors[name]
+        self.masks[name] = local.masks[name]
+
+    def _image_mask(self, image: QImage, dpr: float):
+        key = id(image)
+        if key not in self._mask_cache:
+            if dpr != 1:
+                logical = QSize(round(image.width() / dpr), round(image.height() / dpr))
+                image = image.scaled(logical, Qt.AspectRatioMode.KeepAspectRatio,
+                                     Qt.TransformationMode.FastTransformation)
+            self._mask_cache[key] = frame_input_region(QPixmap.fromImage(image))
+        return self._mask_cache[key]
+
+    # ===== 缩放与显示 =====
+
+    def set_scale(self, scale: float):
+        if scale == self.scale:
+            return  # 共用缓存的其他宠物已经处理过
+        self.scale = scale
+        if self._local is not None:
+            self._local.set_scale(scale)
+        # 新缩放比例下若已有其他进程发布的段则继续共享，否则本地解码
+        self._reload()
+
+    def set_dpr(self, dpr: float):
+        super().set_dpr(dpr)
+        if self._local is not None:
+            self._local.set_dpr(dpr)
+
+    def retain_dprs(self, dprs: Iterable[float]):
+        keep = {normalize_dpr(d) for d in dprs} | {self.dpr} | self._pinned
+        for dpr in list(self.segments):
+            if dpr not in keep:
+                self.segments.pop(dpr)
+                self._display.pop(dpr, None)
+                self.cache.release(self.cache.segment_path(self.scale, dpr))
+                logger.debug("释放 DPR %s 的共享帧缓存", dpr)
+        if self._local is not None:
+            self._local.retain_dprs(keep)
+
+    def scaled_frames(self, action: str, dpr: float = None) -> List[QPixmap]:
+        dpr = self.dpr if dpr is None else dpr
+        if action not in self.frames:
+            return []
+        segment = self._segment(dpr)
+        if segment is not None:
+            key = action if action in segment.actions else self._aliases.get(action)
+            if key in segment.actions:
+                return self._display_frames(segment, action, key, dpr)
+        # 只为正在显示的动作本地缩放，其余动作的发布排入空闲时间片
+        local = self._ensure_local(action)
+        if self._complete:
+            self._queue_publish(dpr)
+        return local.scaled_frames(action, dpr)
+
+    def _display_frames(self, segment: SharedSegment, action: str, key: str, dpr: float) -> List[QPixmap]:
+        cache = self._display.setdefault(dpr, OrderedDict())
+        frames = cache.get(action)
+        if metrics.enabled:
+            CACHE_LOOKUPS.inc(cache="shared_display", result="miss" if frames is None else "hit")
+        if frames is None:
+            # QLabel 只能显示 QPixmap，转换时复制像素；只为最近播放的动作保留
+            frames = cache[action] = [self._to_pixmap(image, dpr) for image in segment.actions[key]]
+            while len(cache) > DISPLAY_CACHE_ACTIONS:
+                cache.popitem(last=False)
+        else:
+            cache.move_to_end(action)
+        return frames
+
+    @staticmethod
+    def _to_pixmap(image: QImage, dpr: float) -> QPixmap:
+        pixmap = QPixmap.fromImage(image)
+        pixmap.setDevicePixelRatio(dpr)
+        return pixmap
+
+    def _reload(self):
+        """缩放比例变化：丢弃所有段并按原顺序重新加载已加载的动作"""
+        names = [name for name in self.frames if name not in self._aliases and not name.startswith("expr:")]
+        had_expressions = self._expression_names is not None
+        for cache in (self.frames, self.anchors, self.masks, self._mask_cache, self.segments, self._display):
+            cache.clear()
+        self._pinned.clear()
+        self._expression_names = None
+        # 不再使用旧缩放比例的段，允许回收
+        self.cache.release_all()
+        for name in names:
+            self.load_action(name)
+        if had_expressions:
+            self.load_expressions()
+        for name, target in list(self._aliases.items()):
+            if target in self.frames:
+                self.alias(name, target)
+        if self._complete:
+            self.publish()
+
+    # ===== 发布 =====
+
+    def publish(self) -> bool:
+        """全部动作加载完成：没有共享段的 DPR（当前 DPR 与已显示过的）排队发布给其他进程"""
+        self._complete = True
+        if not self.frames:
+            return False
+        dprs = [self.dpr] + [dpr for dpr in self.segments if dpr != self.dpr]
+        queued = False
+        for dpr in dprs:
+            if self._segment(dpr) is None:
+                queued = self._queue_publish(dpr) or queued
+        return queued
+
+    def _queue_publish(self, dpr: float) -> bool:
+        """本地解码的 DPR 排队发布（每个缩放比例与 DPR 只发布一次）"""
+        key = (self.scale, dpr)
+        if key in self._published or key in self._publishing:
+            return False
+        self._publishing.add(key)
+        self._publish_queue.append(key)
+        return True
+
+    def take_idle_jobs(self) -> List[Callable[[], object]]:
+        """
+        取出排队发布的 DPR 的发布步骤：每个动作一步（本地解码、缩放并转换为段格式），最后一步写入段。
+        共用缓存的宠物中只有一只取到；缩放比例在中途改变时剩余步骤作废。
+        """
+        jobs = []
+        for scale, dpr in self._publish_queue:
+            if scale != self.scale:
+                self._publishing.discard((scale, dpr))
+                continue
+            staged = {"images": {}, "actions": {}}
+            jobs.extend(
+                (lambda name=name, dpr=dpr, staged=staged, scale=scale:
+                 self._stage_action(scale, dpr, name, staged))
+                for name in self.frames
+            )
+            jobs.append(lambda dpr=dpr, staged=staged, scale=scale: self._publish_staged(scale, dpr, staged))
+        self._publish_queue.clear()
+        return jobs
+
+    def _stage_action(self, scale: float, dpr: float, name: str, staged: dict):
+        """发布的一步：某个动作在该 DPR 下的缩放帧转换为段格式"""
+        if scale != self.scale or name not in self.frames:
+            return
+        images: Dict[int, QImage] = staged["images"]
+        frames = []
+        for pixmap in self._ensure_local(name).scaled_frames(name, dpr):
+            image = images.get(id(pixmap))
+            if image is None:
+                image = images[id(pixmap)] = pixmap.toImage().convertToFormat(FRAME_FORMAT)
+            frames.append(image)
+        staged["actions"][name] = (frames, self.anchors[name])
+
+    def _publish_staged(self, scale: float, dpr: float, staged: dict) -> bool:
+        """发布的最后一步：写入段（缩放比例已改变时放弃）"""
+        key = (scale, dpr)
+        self._publishing.discard(key)
+        if scale != self.scale:
+            return False
+        # 排队后才加入的动作（如别名）补上
+        for name in self.frames:
+            if name not in staged["actions"]:
+                self._stage_action(scale, dpr, name, staged)
+        self._published.add(key)
+        return self.cache.publish(self.scale, dpr, staged["actions"])
@@ -0,0 +1,193 @@
+"""
+自主思考预生成模块
+brain_timer 到期前 lead_seconds，在 LLM 空闲、不会被推迟的情况下用当时的传感器上下文提前生成下一段独白，
+连同上下文指纹一起保存；到期时若指纹仍然一致则立即显示，上下文发生实质变化时丢弃并重新生成。
+预生成的请求就是本轮思考本身，指纹一致时不产生额外请求。
+
+指纹只包含会影响独白内容的粗粒度状态（时间段、锁屏、用户是否离开、CPU 负载档位、低电量、
+活动窗口类别、全屏、宠物的常驻动作），窗口标题、空闲秒数等细节的变化不算实质变化。
+预生成进行中时宠物视为忙碌（_llm_busy），事件触发的思考不会与它并发；
+每轮思考结束后 start_brain 重新 schedule，之前保存的结果随之丢弃，不会留到下一次到期。
+"""
+
+import hashlib
+import time
+from dataclasses import dataclass
+from typing import Optional
+
+from PyQt6.QtCore import QObject, QTimer
+
+from .llm_dispatcher import llm_dispatcher
+from .logger import get_logger
+from .metrics import metrics, CACHE_LOOKUPS
+from .sensors import window_category
+from .tracing import tracer
+
+logger = get_logger(__name__)
+
+DEFAULT_SPECULATION = {
+    "enabled": True,
+    "lead_seconds": 20,       # 到期前多久开始预生成
+    "max_age_seconds": 300,   # 预生成结果的有效期
+}
+
+RESULT_TAGS = "tags"              # [TEXT]/[STATE] 标签格式文本
+RESULT_STRUCTURED = "structured"  # 结构化输出 {"text", "state"}
+
+
+def context_fingerprint(snapshot: dict, action: str, away_seconds: float, heavy_cpu: float) -> str:
+    """影响独白内容的粗粒度上下文的指纹"""
+    battery = snapshot.get('battery') or {}
+    cpu = snapshot.get('cpu_usage', 0.0)
+    material = (
+        snapshot.get('period'),
+        bool(snapshot.get('locked')),
+        snapshot.get('idle_seconds', 0.0) >= away_seconds,
+        0 if cpu < heavy_cpu / 2 else 1 if cpu < heavy_cpu else 2,
+        bool(battery.get('is_low')) and not battery.get('power_plugged'),
+        window_category(snapshot.get('active_window') or {}),
+        bool(snapshot.get('fullscreen')),
+        action,
+    )
+    return hashlib.blake2b(repr(material).encode(), digest_size=8).hexdigest()
+
+
+@dataclass
+class Speculation:
+    """一段预生成的独白"""
+    kind: str
+    payload: object
+    fingerprint: str
+    created: float
+    trace_id: Optional[str] = None
+
+
+class ThoughtSpeculator(QObject):
+    """在 brain_timer 到期前预生成独白（宠物的 start_brain 调用 schedule，_on_brain_tick 调用 deliver）"""
+
+    def __init__(self, pet, settings: dict = None, parent=None):
+        super().__init__(parent)
+        self.pet = pet
+        self.settings = {**DEFAULT_SPECULATION, **(settings or {})}
+        self._lead_timer = QTimer(self)
+        self._lead_timer.setSingleShot(True)
+        self._lead_timer.timeout.connect(self._speculate)
+        self._worker = None               # 进行中的预生成
+        self._worker_fingerprint = None   # 进行中的预生成开始时的指纹（None 表示结果作废）
+        self._result: Optional[Speculation] = None
+        self._deliver_on_finish = False   # 到期时预生成还没完成，完成后再比对指纹
+        self.hits = 0
+        self.misses = 0
+
+    def update_config(self, settings: dict = None):
+        self.settings = {**DEFAULT_SPECULATION, **(settings or {})}
+        if not self.settings["enabled"]:
+            self.cancel()
+
+    def fingerprint(self) -> str:
+        pet = self.pet
+        schedule = pet.brain_scheduler.settings if pet.brain_scheduler is not None else {}
+        snapshot = pet.sensor_hub.snapshot if pet.sensor_hub is not None else {}
+        return context_fingerprint(
+            snapshot, pet.previous_action,
+            schedule.get('away_seconds', 300), schedule.get('heavy_cpu', 85)
+        )
+
+    @property
+    def busy(self) -> bool:
+        """有排队中或进行中的预生成请求"""
+        return self._worker is not None
+
+    # ===== 调度 =====
+
+    def schedule(self, interval_ms: int):
+        """brain_timer 重新计时后调用（上一轮思考已结束）：丢弃旧结果，在到期前 lead_seconds 开始预生成"""
+        self._lead_timer.stop()
+        self._result = None
+        self._worker_fingerprint = None  # 进行中的预生成基于上一轮之前的上下文，完成后丢弃
+        if not self.settings["enabled"]:
+            return
+        lead_ms = int(self.settings["lead_seconds"] * 1000)
+        self._lead_timer.start(max(0, interval_ms - lead_ms))
+
+    def cancel(self):
+        """丢弃预生成的结果与排队中的请求（进行中的请求完成后丢弃）"""
+        self._lead_timer.stop()
+        self._result = None
+        self._deliver_on_finish = False
+        self._worker_fingerprint = None
+        if llm_dispatcher.pending_count(self):
+            self._worker = None  # 还在排队，不会再启动
+        llm_dispatcher.cancel(self)
+
+    def _speculate(self):
+        pet = self.pet
+        # 只在空闲时预生成：宠物有请求在进行、到期时会被推迟或省电暂停时交给到期时的正常流程
+        if pet._llm_busy():
+            return
+        if pet.power_policy is not None and pet.power_policy.suspended:
+            return
+        if pet.brain_scheduler is not None and pet.brain_scheduler.defer_ms():
+            return
+        worker = pet._create_brain_worker(trigger="speculative")
+        if worker is None:
+            return
+        self._worker = worker
+        self._worker_fingerprint = self.fingerprint()
+        worker.response_received.connect(self._on_response)
+        worker.reply_received.connect(self._on_reply)
+        worker.error_occurred.connect(self._on_error)
+        llm_dispatcher.submit(self, worker)
+        logger.debug("开始预生成下一段独白")
+
+    # ===== 结果 =====
+
+    def _on_response(self, response: str):
+        self._finish(RESULT_TAGS, response)
+
+    def _on_reply(self, reply: dict):
+        self._finish(RESULT_STRUCTURED, reply)
+
+    def _on_error(self, error: str):
+        logger.warning("预生成独白失败: %s", error)
+        self._finish(None, None)
+
+    def _finish(self, kind: str, payload):
+        worker, self._worker = self._worker, None
+        fingerprint, self._worker_fingerprint = self._worker_fingerprint, None
+        if kind is not None and fingerprint is not None:
+            self._result = Speculation(kind, payload, fingerprint, time.monotonic(), getattr(worker, 'trace_id', None))
+        if self._deliver_on_finish:
+            # 到期时在等待本次预生成：按现在的上下文重新比对，不一致再正常请求
+            self._deliver_on_finish = False
+            if not self.deliver():
+                self.pet.send_brain_message()
+
+    def deliver(self) -> bool:
+        """brain_timer 到期：指纹一致时显示预生成的结果（或在其完成后显示），返回是否已接管本轮思考"""
+        if not self.settings["enabled"]:
+            return False
+        if self._worker is not None:
+            # 等它完成再比对指纹，期间不另发请求
+            self._deliver_on_finish = True
+            return True
+
+        fingerprint = self.fingerprint()
+        result, self._result = self._result, None
+        if result is None:
+            return False
+        age = time.monotonic() - result.created
+        if result.fingerprint != fingerprint or age > self.settings["max_age_seconds"]:
+            self.misses += 1
+            if metrics.enabled:
+                CACHE_LOOKUPS.inc(cache="speculation", result="miss")
+            logger.info("上下文已变化，丢弃预生成的独白（命中 %d / 丢弃 %d）", self.hits, self.misses)
+            tracer.emit(result.trace_id, "speculation", outcome="miss", age=round(age, 1))
+            return False
+        self.hits += 1
+        if metrics.enabled:
+            CACHE_LOOKUPS.inc(cache="speculation", result="hit")
+        logger.info("使用预生成的独白（命中 %d / 丢弃 %d）", self.hits, self.misses)
+        tracer.emit(result.trace_id, "speculation", outcome="hit", age=round(age, 1))
+        self.pet._apply_speculation(result)
+        return True
@@ -0,0 +1,97 @@
+"""
+启动性能分析模块
+通过 --profile-startup 启用：记录各模块首次导入的耗时（包含/自身），
+以及启动过程中的关键节点（创建应用、构建窗口、首帧、托盘、空闲阶段完成），
+最终输出首帧时间与导入耗时明细。
+"""
+
+import builtins
+import importlib.util
+import sys
+import time
+
+
+class StartupProfiler:
+    """导入耗时与启动节点记录器"""
+
+    def __init__(self):
+        self.t0 = time.perf_counter()
+        self.enabled = False
+        self.marks = []             # [(name, 相对 t0 的毫秒数)]
+        self.imports = {}           # module -> [inclusive_ms, self_ms, depth]
+        self._stack = []            # 正在导入的模块栈：[(name, start, children_ms)]
+        self._original_import = None
+
+    def install(self, t0: float = None):
+        """开始记录导入耗时（需在导入其他模块之前调用）"""
+        if self.enabled:
+            return
+        if t0 is not None:
+            self.t0 = t0
+        self.enabled = True
+        self._original_import = builtins.__import__
+        builtins.__import__ = self._timed_import
+
+    def uninstall(self):
+        if self._original_import is not None:
+            builtins.__import__ = self._original_import
+            self._original_import = None
+
+    def _timed_import(self, name, globals=None, locals=None, fromlist=(), level=0):
+        # 相对导入解析为绝对模块名；只统计首次导入，已加载的模块直接返回
+        module = name
+        if level:
+            try:
+                module = importlib.util.resolve_name('.' * level + name, (globals or {}).get('__package__'))
+            except (ImportError, ValueError):
+                module = None
+        if module is None or module in sys.modules:
+            return self._original_import(name, globals, locals, fromlist, level)
+
+        start = time.perf_counter()
+        self._stack.append([module, start, 0.0])
+        try:
+            return self._original_import(name, globals, locals, fromlist, level)
+        finally:
+            _, _, children = self._stack.pop()
+            inclusive = (time.perf_counter() - start) * 1000
+            if module not in self.imports:
+                self.imports[module] = [inclusive, inclusive - children, len(self._stack)]
+            if self._stack:
+                self._stack[-1][2] += inclusive
+
+    def mark(self, name: str):
+        """记录一个启动节点"""
+        if self.enabled:
+            self.marks.append((name, (time.perf_counter() - self.t0) * 1000))
+
+    def report(self, top: int = 15) -> str:
+        lines = ["===== 启动性能分析 ====="]
+        for name, ms in self.marks:
+            lines.append(f"{name:<20}{ms:>10.1f} ms")
+
+        top_level = sorted(
+            ((n, v) for n, v in self.imports.items() if v[2] == 0),
+            key=lambda item: -item[1][0]
+        )
+        lines.append("\n顶层导入（包含子模块）：")
+        for name, (inclusive, _, _) in top_level[:top]:
+            lines.append(f"  {name:<36}{inclusive:>10.1f} ms")
+
+        heaviest = sorted(self.imports.items(), key=lambda item: -item[1][1])
+        lines.append("\n自身耗时最高的模块：")
+        for name, (_, self_ms, _) in heaviest[:top]:
+            lines.append(f"  {name:<36}{self_ms:>10.1f} ms")
+        return "\n".join(lines)
+
+    def finish(self):
+        """输出报告（写到原始终端，不经过日志重定向）"""
+        if not self.enabled:
+            return
+        self.uninstall()
+        print(self.report(), file=sys.__stdout__, flush=True)
+        self.enabled = False
+
+
+# Global instance for easy access
+startup_profiler = StartupProfiler()
@@ -0,0 +1,178 @@
+"""
+结构化输出模块
+让模型通过 response_format (JSON Schema) 或 set_pet_state 工具调用返回回复与状态，
+替代对 [TEXT]...[/TEXT][STATE]...[/STATE] 标签的正则抓取。
+不支持的供应商会回退到标签解析，探测结果按供应商缓存，每个供应商只探测一次。
+"""
+
+import json
+import re
+from typing import Dict, List, Optional, Tuple
+
+from .logger import get_logger
+
+logger = get_logger(__name__)
+
+# 结构化输出模式
+MODE_OFF = "off"
+MODE_TOOL = "tool"
+MODE_JSON_SCHEMA = "json_schema"
+VALID_MODES = (MODE_OFF, MODE_TOOL, MODE_JSON_SCHEMA)
+
+SET_STATE_TOOL = "set_pet_state"
+
+# 拒绝请求的错误信息中出现这些参数名时，才认为供应商不支持该结构化模式
+_MODE_PARAMS = {
+    MODE_TOOL: ("tools", "tool_choice", "function"),
+    MODE_JSON_SCHEMA: ("response_format", "json_schema"),
+}
+
+_FENCE_RE = re.compile(r"^```[\w-]*\s*(.*?)\s*```$", re.DOTALL)
+
+# 供应商能力缓存：(endpoint, model, mode) -> 是否支持
+_support_cache: Dict[Tuple[str, str, str], bool] = {}
+
+
+def normalize_mode(mode) -> str:
+    """规范化配置中的模式值，未知值视为关闭"""
+    if isinstance(mode, bool):
+        return MODE_TOOL if mode else MODE_OFF
+    mode = str(mode or MODE_OFF).strip().lower()
+    return mode if mode in VALID_MODES else MODE_OFF
+
+
+def provider_key(endpoint: str, model: str, mode: str) -> Tuple[str, str, str]:
+    return (endpoint, model, mode)
+
+
+def is_supported(key: Tuple[str, str, str]) -> Optional[bool]:
+    """返回缓存的探测结果；None 表示尚未探测"""
+    return _support_cache.get(key)
+
+
+def mark_supported(key: Tuple[str, str, str], supported: bool):
+    """记录供应商是否支持该结构化模式"""
+    if _support_cache.get(key) != supported:
+        _support_cache[key] = supported
+        logger.info("结构化输出探测: %s @ %s [%s] -> %s", key[1], key[0], key[2],
+                    "支持" if supported else "不支持，回退标签解析")
+
+
+def rejects_mode(error_body: str, mode: str) -> bool:
+    """400/422 的错误信息是否针对结构化参数（其他原因的错误不能说明供应商不支持）"""
+    body = (error_body or "").lower()
+    return any(name in body for name in _MODE_PARAMS.get(mode, ()))
+
+
+def _reply_schema(states: List[str]) -> dict:
+    return {
+        "type": "object",
+        "properties": {
+            "text": {
+                "type": "string",
+                "description": "对用户说的话，要可爱、调皮、像在撒娇一样，通常在 20 字以内"
+            },
+            "state": {
+                "type": "string",
+                "enum": list(states),
+                "description": "想要切换到的动作状态"
+            }
+        },
+        "required": ["text", "state"],
+        "additionalProperties": False
+    }
+
+
+def build_state_tool(states: List[str]) -> dict:
+    """构建 set_pet_state 工具定义，state 使用可用状态枚举"""
+    return {
+        "type": "function",
+        "function": {
+            "name": SET_STATE_TOOL,
+            "description": "输出最终回复：对用户说的话以及要切换到的动作状态。准备好回复时必须调用此工具。",
+            "parameters": _reply_schema(states)
+        }
+    }
+
+
+def build_response_format(states: List[str]) -> dict:
+    """构建 response_format JSON Schema"""
+    return {
+        "type": "json_schema",
+        "json_schema": {
+            "name": "pet_reply",
+            "strict": True,
+            "schema": _reply_schema(states)
+        }
+    }
+
+
+def format_instructions(mode: str) -> str:
+    """结构化模式下追加到 System Prompt 的格式说明"""
+    if mode == MODE_TOOL:
+        return f"准备好回复时，调用 {SET_STATE_TOOL} 工具，把要说的话填入 text，把动作状态填入 state。"
+    return "你的回复必须是一个 JSON 对象，包含 text（要说的话）和 state（动作状态）两个字段。"
+
+
+def apply_to_payload(payload: dict, mode: str, states: List[str]):
+    """将结构化输出参数加入请求体"""
+    if mode == MODE_TOOL:
+        tools = list(payload.get("tools") or [])
+        tools.append(build_state_tool(states))
+        payload["tools"] = tools
+        payload["tool_choice"] = "auto"
+    elif mode == MODE_JSON_SCHEMA:
+        payload["response_format"] = build_response_format(states)
+
+
+def strip_fences(content: str) -> str:
+    """去掉包裹整段内容的 Markdown 代码块（```json ... ```）"""
+    content = content.strip()
+    match = _FENCE_RE.match(content)
+    return match.group(1) if match else content
+
+
+def _as_reply(data) -> Optional[dict]:
+    if not isinstance(data, dict):
+        return None
+    text = data.get("text")
+    state = data.get("state")
+    if not isinstance(text, str) or not isinstance(state, str):
+        return None
+    return {"text": text.strip(), "state": state.strip()}
+
+
+def find_state_call(message: dict) -> Optional[dict]:
+    """在 tool_calls 中查找 set_pet_state 调用"""
+    for tool_call in message.get("tool_calls") or []:
+        if tool_call.get("function", {}).get("name") == SET_STATE_TOOL:
+            return tool_call
+    return None
+
+
+def parse_message(message: dict, mode: str) -> Optional[dict]:
+    """
+    从助手消息中提取结构化回复。
+    成功返回 {"text": ..., "state": ...}，否则返回 None（由调用方回退到标签解析）。
+    """
+    if mode == MODE_TOOL:
+        tool_call = find_state_call(message)
+        if tool_call is not None:
+            try:
+                return _as_reply(json.loads(tool_call["function"].get("arguments") or "{}"))
+            except (ValueError, TypeError):
+                return None
+        if message.get("tool_calls"):
+            return None
+        # 没有调用工具，回复 JSON 直接写在了内容里
+
+    if mode in (MODE_TOOL, MODE_JSON_SCHEMA):
+        content = strip_fences(message.get("content") or "")
+        if not content.startswith("{"):
+            return None
+        try:
+            return _as_reply(json.loads(content))
+        except ValueError:
+            return None
+
+    return None
@@ -0,0 +1,341 @@
+"""
+工具插件发现模块
+从项目根目录的 tools/ 目录以及 "digital_pet.tools" 入口点发现插件工具：
+通过 AST 读取 @plugin_tool 函数的签名与文档生成工具定义，不导入插件模块；
+实现模块在第一次 call_tool 时才导入。
+发现结果按文件 mtime 缓存在索引文件中，热启动时无需重新解析；
+入口点模块的源文件位置按发行包版本缓存，包未升级时不再定位。
+"""
+
+import ast
+import importlib.machinery
+import importlib.util
+import json
+import os
+import tempfile
+from typing import Callable, Dict, List, Optional
+
+from .logger import get_logger
+
+logger = get_logger(__name__)
+
+ENTRY_POINT_GROUP = "digital_pet.tools"
+INDEX_VERSION = 2
+
+# 注解名 -> JSON Schema 类型，未列出的一律视为 string
+JSON_TYPES = {"int": "integer", "bool": "boolean", "float": "number", "str": "string"}
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def plugin_tool(func: Callable = None, **options):
+    """
+    标记插件工具。可直接使用 @plugin_tool，也可带选项 @plugin_tool(key=value)。
+    选项必须是字面量，发现阶段通过 AST 读取，不会执行插件代码。
+    """
+    def mark(f):
+        f.__plugin_tool__ = options
+        return f
+    if func is not None:
+        return mark(func)
+    return mark
+
+
+def build_tool_definition(name: str, doc: str, params: List[tuple]) -> dict:
+    """生成 OpenAI 格式的工具定义；params 为 [(参数名, JSON 类型, 是否必填)]"""
+    parameters = {
+        "type": "object",
+        "properties": {},
+        "required": []
+    }
+    for param_name, param_type, required in params:
+        parameters["properties"][param_name] = {
+            "type": param_type,
+            "description": f"Parameter {param_name}"
+        }
+        if required:
+            parameters["required"].append(param_name)
+
+    return {
+        "type": "function",
+        "function": {
+            "name": name,
+            "description": doc or "No description provided.",
+            "parameters": parameters
+        }
+    }
+
+
+# ===== AST 解析 =====
+
+def _decorator_options(decorator) -> Optional[dict]:
+    """decorator 是 @plugin_tool / @plugin_tool(...) 时返回其选项，否则返回 None"""
+    target = decorator.func if isinstance(decorator, ast.Call) else decorator
+    name = target.attr if isinstance(target, ast.Attribute) else getattr(target, 'id', None)
+    if name != "plugin_tool":
+        return None
+    options = {}
+    if isinstance(decorator, ast.Call):
+        for keyword in decorator.keywords:
+            try:
+                options[keyword.arg] = ast.literal_eval(keyword.value)
+            except ValueError:
+                logger.warning("插件工具选项 %s 不是字面量，已忽略", keyword.arg)
+    return options
+
+
+def _annotation_type(annotation) -> str:
+    name = getattr(annotation, 'id', None)
+    if isinstance(annotation, ast.Constant) and isinstance(annotation.value, str):
+        name = annotation.value
+    return JSON_TYPES.get(name, "string")
+
+
+def parse_plugin_source(source: str, filename: str = "<plugin>") -> List[dict]:
+    """从源码中提取 @plugin_tool 函数的工具定义，不执行任何插件代码"""
+    tree = ast.parse(source, filename=filename)
+    entries = []
+    for node in tree.body:
+        if not isinstance(node, ast.FunctionDef):
+            continue
+        options = None
+        for decorator in node.decorator_list:
+            options = _decorator_options(decorator)
+            if options is not None:
+                break
+        if options is None:
+            continue
+
+        args = node.args.args
+        first_default = len(args) - len(node.args.defaults)
+        params = [
+            (arg.arg, _annotation_type(arg.annotation), index < first_default)
+            for index, arg in enumerate(args)
+        ]
+        entries.append({
+            "function": node.name,
+            "definition": build_tool_definition(node.name, ast.get_docstring(node), params),
+            "options": options,
+        })
+    return entries
+
+
+# ===== 发现与索引缓存 =====
+
+class PluginIndex:
+    """
+    插件工具索引：{源文件路径: {mtime, size, module, tools}}，按 mtime 与大小判断是否失效；
+    另记录入口点模块的源文件位置：{发行包名: {version, modules: {模块名: 路径}}}，按版本判断是否失效
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.files: Dict[str, dict] = {}
+        self.entry_points: Dict[str, dict] = {}
+        self.dirty = False
+
+    def load(self):
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            if data.get('version') == INDEX_VERSION:
+                self.files = data.get('files', {})
+                self.entry_points = data.get('entry_points', {})
+        except (OSError, ValueError):
+            self.files = {}
+            self.entry_points = {}
+
+    def save(self):
+        """原子写入索引；目录不可写时仅记录日志"""
+        if not self.dirty:
+            return
+        directory = os.path.dirname(os.path.abspath(self.path))
+        try:
+            fd, tmp_path = tempfile.mkstemp(prefix=".tool-index-", suffix=".tmp", dir=directory)
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump({'version': INDEX_VERSION, 'files': self.files, 'entry_points': self.entry_points},
+                          f, ensure_ascii=False)
+            os.replace(tmp_path, self.path)
+            self.dirty = False
+        except OSError as e:
+            logger.warning("写入工具索引失败: %s", e)
+
+    def entries_for(self, path: str, module: str) -> List[dict]:
+        """返回源文件中的工具条目，文件未变化时直接使用缓存"""
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return []
+        cached = self.files.get(path)
+        if cached and cached['mtime'] == stat.st_mtime and cached['size'] == stat.st_size \
+                and cached['module'] == module:
+            return cached['tools']
+
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                tools = parse_plugin_source(f.read(), path)
+        except (OSError, SyntaxError, UnicodeDecodeError) as e:
+            logger.warning("解析插件 %s 失败: %s", path, e)
+            tools = []
+        self.files[path] = {'mtime': stat.st_mtime, 'size': stat.st_size, 'module': module, 'tools': tools}
+        self.dirty = True
+        return tools
+
+    def entry_point_origin(self, dist, module: str) -> Optional[str]:
+        """入口点模块的源文件路径；发行包版本未变时使用缓存"""
+        if dist is None:
+            return _module_origin(None, module)
+        name, version = _dist_name(dist), dist.version
+        cached = self.entry_points.get(name)
+        if cached is None or cached['version'] != version:
+            cached = self.entry_points[name] = {'version': version, 'modules': {}}
+            self.dirty = True
+        origin = cached['modules'].get(module)
+        if origin is None:
+            # 找不到时不缓存，下次启动重新查找
+            origin = _module_origin(dist, module)
+            if origin is not None:
+                cached['modules'][module] = origin
+                self.dirty = True
+        return origin
+
+    def prune(self, seen: set):
+        """移除已删除的源文件"""
+        for path in [p for p in self.files if p not in seen]:
+            del self.files[path]
+            self.dirty = True
+
+    def prune_entry_points(self, dists: set):
+        """移除已卸载的发行包"""
+        for name in [n for n in self.entry_points if n not in dists]:
+            del self.entry_points[name]
+            self.dirty = True
+
+
+def _directory_sources(directory: str) -> List[tuple]:
+    """tools/ 目录下的插件源文件：[(路径, 模块名)]，模块名带前缀以免与其他包冲突"""
+    if not os.path.isdir(directory):
+        return []
+    return [
+        (os.path.join(directory, name), f"pet_tools.{name[:-3]}")
+        for name in sorted(os.listdir(directory))
+        if name.endswith(".py") and not name.startswith("_")
+    ]
+
+
+def _dist_name(dist) -> str:
+    return getattr(dist, 'name', None) or dist.metadata['Name']
+
+
+def _module_origin(dist, module: str) -> Optional[str]:
+    """
+    不导入任何模块（包括父包）定位模块的源文件：优先在发行包的文件清单（RECORD）中查找，
+    找不到时从顶层包的搜索路径逐级查找（find_spec 查找子模块时会导入父包，因此只用于顶层）
+    """
+    parts = module.split(".")
+    if dist is not None:
+        candidates = {"/".join(parts) + ".py", "/".join(parts + ["__init__.py"])}
+        for file in dist.files or []:
+            if file.as_posix() in candidates:
+                return os.path.abspath(str(dist.locate_file(file)))
+    try:
+        spec = importlib.machinery.PathFinder.find_spec(parts[0])
+        for depth in range(1, len(parts)):
+            if spec is None or not spec.submodule_search_locations:
+                return None
+            spec = importlib.machinery.PathFinder.find_spec(
+                ".".join(parts[:depth + 1]), list(spec.submodule_search_locations))
+    except (ImportError, ValueError):
+        return None
+    if spec is not None and spec.origin and spec.origin.endswith(".py"):
+        return spec.origin
+    return None
+
+
+def _entry_point_sources(index: "PluginIndex") -> List[tuple]:
+    """已安装包通过入口点声明的插件模块：[(路径, 模块名)]，只定位源文件，不导入模块及其父包"""
+    try:
+        from importlib.metadata import entry_points
+        try:
+            points = entry_points(group=ENTRY_POINT_GROUP)
+        except TypeError:  # Python < 3.10
+            points = entry_points().get(ENTRY_POINT_GROUP, [])
+    except Exception as e:
+        logger.warning("读取工具入口点失败: %s", e)
+        return []
+
+    sources = []
+    dists = set()
+    for point in points:
+        module = point.value.split(":")[0].strip()
+        dist = getattr(point, 'dist', None)
+        if dist is not None:
+            dists.add(_dist_name(dist))
+        origin = index.entry_point_origin(dist, module)
+        if origin is None:
+            logger.warning("找不到插件模块 %s 的源文件", module)
+            continue
+        sources.append((origin, module))
+    index.prune_entry_points(dists)
+    return sources
+
+
+def load_plugin_function(path: str, module: str, function: str) -> Callable:
+    """导入插件模块并取出工具函数；tools/ 目录中的插件按文件路径导入"""
+    import sys
+    if module in sys.modules:
+        return getattr(sys.modules[module], function)
+    if module.startswith("pet_tools."):
+        spec = importlib.util.spec_from_file_location(module, path)
+        mod = importlib.util.module_from_spec(spec)
+        sys.modules[module] = mod
+        try:
+            spec.loader.exec_module(mod)
+        except Exception:
+            del sys.modules[module]
+            raise
+    else:
+        mod = importlib.import_module(module)
+    logger.info("已加载插件模块 %s", module)
+    return getattr(mod, function)
+
+
+def _make_loader(path: str, module: str, function: str) -> Callable[[], Callable]:
+    """返回延迟导入器：第一次调用时才导入插件模块并取出工具函数"""
+    def load():
+        return load_plugin_function(path, module, function)
+    # 隔离执行时子进程据此定位工具（入口点模块可直接按名称导入）
+    load.target = (module, function, path if module.startswith("pet_tools.") else None)
+    return load
+
+
+def discover_plugins(manager, directories: List[str] = None, index_path: str = None,
+                     entry_points: bool = True) -> int:
+    """发现插件工具并以延迟方式注册到 manager，返回注册的工具数量"""
+    if directories is None:
+        directories = [os.path.join(PROJECT_ROOT, "tools")]
+    index = PluginIndex(index_path or os.path.join(PROJECT_ROOT, ".tool_index.json"))
+    index.load()
+
+    sources = []
+    for directory in directories:
+        sources.extend(_directory_sources(directory))
+    if entry_points:
+        sources.extend(_entry_point_sources(index))
+
+    count = 0
+    seen = set()
+    for path, module in sources:
+        seen.add(path)
+        for entry in index.entries_for(path, module):
+            manager.register_lazy(
+                entry['definition'],
+                _make_loader(path, module, entry['function']),
+                **entry['options']
+            )
+            count += 1
+
+    index.prune(seen)
+    index.save()
+    logger.debug("发现 %d 个插件工具", count)
+    return count
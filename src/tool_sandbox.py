@@ -0,0 +1,244 @@
+"""
+工具沙箱模块
+标记为 isolated 的工具在常驻的子进程池中执行：每次调用有墙钟超时，
+超时即杀掉子进程并补充新进程；子进程通过 RLIMIT_AS 限制内存。
+失败时返回结构化的 JSON 错误，交给模型处理，不会拖住对话线程或与 GUI 争抢 GIL。
+
+子进程以 `python -m src.tool_sandbox` 独立启动，通过 socketpair 上的 multiprocessing Connection 通信，
+不像 multiprocessing 的 spawn 那样重新导入 main.py（以及 PyQt 和整个界面）。
+"""
+
+import json
+import os
+import socket
+import subprocess
+import sys
+import threading
+from multiprocessing.connection import Connection
+from typing import List, Optional, Set, Tuple
+
+from .logger import get_logger
+
+logger = get_logger(__name__)
+
+DEFAULT_SANDBOX = {
+    "enabled": True,
+    "workers": 2,            # 常驻子进程数量
+    "memory_mb": 256,        # 每个子进程在启动基线之上允许的额外地址空间
+    "default_timeout": 10,   # 未指定 timeout 的隔离工具的超时秒数
+}
+
+# 工具定位信息：(模块名, 函数名, 插件源文件路径或 None)
+ToolTarget = Tuple[str, str, Optional[str]]
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+# ===== 子进程 =====
+
+def _address_space_bytes() -> int:
+    """当前进程已占用的虚拟地址空间"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[0]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        return 0
+
+
+def _limit_memory(memory_mb: int):
+    try:
+        import resource
+    except ImportError:
+        return
+    limit = _address_space_bytes() + memory_mb * 1024 * 1024
+    _, hard = resource.getrlimit(resource.RLIMIT_AS)
+    if hard != resource.RLIM_INFINITY:
+        limit = min(limit, hard)
+    resource.setrlimit(resource.RLIMIT_AS, (limit, hard))
+
+
+def _resolve(target: ToolTarget, cache: dict):
+    func = cache.get(target)
+    if func is None:
+        module, function, path = target
+        if path:
+            from .tool_plugins import load_plugin_function
+            func = load_plugin_function(path, module, function)
+        else:
+            import importlib
+            func = getattr(importlib.import_module(module), function)
+        cache[target] = func
+    return func
+
+
+def _worker_main(conn, memory_mb: int):
+    """子进程主循环：接收 (target, args)，返回 (ok, result)"""
+    import signal
+    signal.signal(signal.SIGINT, signal.SIG_IGN)  # Ctrl+C 由主进程处理
+    _limit_memory(memory_mb)
+
+    functions = {}
+    while True:
+        try:
+            message = conn.recv()
+        except (EOFError, OSError):
+            break
+        if message is None:
+            break
+        target, args = message
+        try:
+            conn.send((True, _resolve(target, functions)(**args)))
+        except BaseException as e:
+            conn.send((False, {"error_type": type(e).__name__, "message": str(e)}))
+
+
+# ===== 主进程 =====
+
+class _Worker:
+    def __init__(self, memory_mb: int):
+        parent_sock, child_sock = socket.socketpair()
+        env = dict(os.environ)
+        env["PYTHONPATH"] = os.pathsep.join(filter(None, [PROJECT_ROOT, env.get("PYTHONPATH")]))
+        try:
+            self.process = subprocess.Popen(
+                [sys.executable, "-m", __name__,
+                 str(child_sock.fileno()), str(memory_mb)],
+                pass_fds=(child_sock.fileno(),), stdin=subprocess.DEVNULL, env=env
+            )
+        except BaseException:
+            parent_sock.close()
+            raise
+        finally:
+            child_sock.close()
+        self.conn = Connection(parent_sock.detach())
+
+    def stop(self):
+        """请求子进程退出并回收"""
+        try:
+            self.conn.send(None)
+        except OSError:
+            pass
+        self.kill()
+
+    def kill(self):
+        if self.process.poll() is None:
+            self.process.kill()
+        try:
+            self.process.wait(1)
+        except subprocess.TimeoutExpired:
+            pass
+        self.conn.close()
+
+
+class ToolSandbox:
+    """隔离工具的常驻进程池"""
+
+    def __init__(self):
+        self.settings = dict(DEFAULT_SANDBOX)
+        self._cond = threading.Condition()
+        self._idle: List[_Worker] = []
+        # 当前进程池的全部子进程（空闲 + 执行中）；不在其中的子进程归还时直接终止
+        self._workers: Set[_Worker] = set()
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.settings.get("enabled"))
+
+    def configure(self, settings: dict = None):
+        previous = self.settings
+        self.settings = {**DEFAULT_SANDBOX, **(settings or {})}
+        if not self.enabled:
+            self.shutdown()
+        elif any(previous[key] != self.settings[key] for key in ("workers", "memory_mb")):
+            # 子进程数量或内存限制变化：换一批新进程（执行中的子进程完成后终止）
+            self.shutdown()
+
+    def start(self):
+        """预先启动子进程，首次调用隔离工具时无需等待进程启动"""
+        if not self.enabled:
+            return
+        with self._cond:
+            while len(self._workers) < self.settings["workers"]:
+                worker = self._spawn()
+                self._workers.add(worker)
+                self._idle.append(worker)
+            self._cond.notify_all()
+
+    def _spawn(self) -> _Worker:
+        return _Worker(self.settings["memory_mb"])
+
+    def _acquire(self) -> _Worker:
+        with self._cond:
+            while True:
+                if self._idle:
+                    return self._idle.pop()
+                if len(self._workers) < self.settings["workers"]:
+                    worker = self._spawn()
+                    self._workers.add(worker)
+                    return worker
+                self._cond.wait()
+
+    def _release(self, worker: _Worker):
+        with self._cond:
+            current = worker in self._workers
+            if current:
+                self._idle.append(worker)
+                self._cond.notify()
+        if not current:
+            worker.stop()  # 执行期间进程池已关闭或重建
+
+    def call(self, name: str, target: ToolTarget, args: dict, timeout: float = None) -> str:
+        """在子进程中执行工具，返回工具结果或结构化的 JSON 错误"""
+        timeout = timeout or self.settings["default_timeout"]
+        worker = self._acquire()
+        try:
+            worker.conn.send((target, args))
+            if not worker.conn.poll(timeout):
+                logger.warning("工具 '%s' 执行超过 %s 秒，终止子进程", name, timeout)
+                worker = self._replace(worker)
+                return _error(name, "timeout", f"工具执行超过 {timeout} 秒，已被终止")
+            ok, result = worker.conn.recv()
+        except (EOFError, OSError, BrokenPipeError) as e:
+            exitcode = worker.process.poll()
+            logger.warning("工具 '%s' 的子进程异常退出 (exitcode=%s): %s", name, exitcode, e)
+            worker = self._replace(worker)
+            return _error(name, "crashed", f"子进程异常退出 (exitcode={exitcode})")
+        finally:
+            if worker is not None:
+                self._release(worker)
+
+        if ok:
+            return result
+        return _error(name, result["error_type"], result["message"])
+
+    def _replace(self, worker: _Worker) -> Optional[_Worker]:
+        """终止子进程并补充新进程（进程池已关闭或重建时不补充）"""
+        worker.kill()
+        with self._cond:
+            if worker not in self._workers:
+                return None
+            self._workers.discard(worker)
+            replacement = self._spawn()
+            self._workers.add(replacement)
+            return replacement
+
+    def shutdown(self):
+        """终止空闲的子进程；执行中的子进程在归还时终止"""
+        with self._cond:
+            idle, self._idle = self._idle, []
+            self._workers.clear()
+            self._cond.notify_all()
+        for worker in idle:
+            worker.stop()
+
+
+def _error(name: str, error_type: str, message: str) -> str:
+    return json.dumps({"error": message, "error_type": error_type, "tool": name}, ensure_ascii=False)
+
+
+# Global instance for easy access
+tool_sandbox = ToolSandbox()
+
+
+if __name__ == "__main__":
+    _worker_main(Connection(int(sys.argv[1])), int(sys.argv[2]))
@@ -1,15 +1,37 @@
 
 import inspect
 import json
+import time
 from typing import Callable, Dict, List, Any
 
+from .logger import get_logger
+from .tracing import tracer
+from .metrics import metrics, TOOL_CALL_SECONDS, TOOL_ERRORS
+from .tool_sandbox import tool_sandbox
+from .tool_plugins import JSON_TYPES, build_tool_definition, discover_plugins
+
+logger = get_logger(__name__)
+
 class ToolManager:
     def __init__(self):
         self._tools: Dict[str, Callable] = {}
         self._tool_descriptions: List[dict] = []
+        # 插件工具：名称 -> 延迟导入器，第一次调用时才导入实现模块
+        self._lazy_loaders: Dict[str, Callable[[], Callable]] = {}
+        # 工具的附加选项（isolated、timeout 等，来自 register_tool(...) / @plugin_tool(...)）
+        self._tool_options: Dict[str, dict] = {}
+        # 插件工具在子进程中的定位信息 (模块名, 函数名, 插件路径)
+        self._plugin_targets: Dict[str, tuple] = {}
 
-    def register_tool(self, func: Callable):
-        """Decorator to register a tool."""
+    def register_tool(self, func: Callable = None, **options):
+        """
+        Decorator to register a tool.
+        可带选项使用，例如 @tool_manager.register_tool(isolated=True, timeout=3)：
+        isolated 的工具在沙箱子进程中执行，timeout 为单次调用的超时秒数；
+        prefetch 的工具在自主思考请求前预先执行并内联到提示词（见 context_prefetch）。
+        """
+        if func is None:
+            return lambda f: self.register_tool(f, **options)
         # Get function signature and docstring
         sig = inspect.signature(func)
         doc = inspect.getdoc(func) or "No description provided."
@@ -17,68 +39,100 @@ class ToolManager:
         name = func.__name__
         
         # Simple schema generation
-        parameters = {
-            "type": "object",
-            "properties": {},
-            "required": []
-        }
-        
+        params = []
         for param_name, param in sig.parameters.items():
             param_type = "string" # Default to string for simplicity
-            if param.annotation == int:
-                param_type = "integer"
-            elif param.annotation == bool:
-                param_type = "boolean"
-            elif param.annotation == float:
-                param_type = "number"
-                
-            parameters["properties"][param_name] = {
-                "type": param_type,
-                "description": f"Parameter {param_name}" 
-            }
-            if param.default == inspect.Parameter.empty:
-                parameters["required"].append(param_name)
-
-        tool_def = {
-            "type": "function",
-            "function": {
-                "name": name,
-                "description": doc,
-                "parameters": parameters
-            }
-        }
+            if param.annotation in (int, bool, float):
+                param_type = JSON_TYPES[param.annotation.__name__]
+            params.append((param_name, param_type, param.default == inspect.Parameter.empty))
+
+        tool_def = build_tool_definition(name, doc, params)
         
         self._tools[name] = func
+        self._tool_options[name] = options
         self._tool_descriptions.append(tool_def)
         return func
 
+    def register_lazy(self, tool_def: dict, loader: Callable[[], Callable], **options):
+        """注册插件工具：tool_def 来自清单，loader 在第一次调用时返回实现函数"""
+        name = tool_def["function"]["name"]
+        if name in self._tools or name in self._lazy_loaders:
+            logger.warning("工具 '%s' 已存在，忽略重复的插件定义", name)
+            return
+        self._lazy_loaders[name] = loader
+        self._tool_options[name] = options
+        self._plugin_targets[name] = loader.target
+        self._tool_descriptions.append(tool_def)
+
     def get_tool_definitions(self) -> List[dict]:
         return self._tool_descriptions
 
+    def prefetch_tool_names(self) -> List[str]:
+        """标记了 prefetch 且没有必填参数的工具"""
+        return [
+            tool_def["function"]["name"] for tool_def in self._tool_descriptions
+            if self._tool_options.get(tool_def["function"]["name"], {}).get('prefetch')
+            and not tool_def["function"]["parameters"]["required"]
+        ]
+
+    def _resolve(self, name: str) -> Callable:
+        """取出工具实现，插件工具在此时才导入"""
+        func = self._tools.get(name)
+        if func is None:
+            func = self._lazy_loaders[name]()
+            self._tools[name] = func
+            del self._lazy_loaders[name]
+        return func
+
+    def _target(self, name: str):
+        """子进程定位工具所需的 (模块名, 函数名, 插件路径)"""
+        if name in self._plugin_targets:
+            return self._plugin_targets[name]
+        func = self._tools[name]
+        return (func.__module__, func.__name__, None)
+
     def call_tool(self, name: str, args: dict) -> Any:
-        if name not in self._tools:
+        if name not in self._tools and name not in self._lazy_loaders:
             return f"Error: Tool '{name}' not found."
         
         # 记录工具调用到日志
-        print(f"[TOOL_CALL] 执行工具: {name} | 参数: {args}")
+        logger.info("[TOOL_CALL] 执行工具: %s | 参数: %s", name, args)
         
-        try:
-            return self._tools[name](**args)
-        except Exception as e:
-            return f"Error executing tool '{name}': {str(e)}"
+        if not metrics.enabled:
+            return self._execute(name, args)
+        started = time.monotonic()
+        result = self._execute(name, args)
+        TOOL_CALL_SECONDS.observe(time.monotonic() - started, tool=name)
+        if isinstance(result, str) and result.startswith(("Error", '{"error"')):
+            TOOL_ERRORS.inc(tool=name)
+        return result
+
+    def _execute(self, name: str, args: dict) -> Any:
+        options = self._tool_options.get(name, {})
+        with tracer.span("tool_call", tool=name) as span:
+            if options.get('isolated') and tool_sandbox.enabled:
+                # 隔离执行：超时、崩溃与内存超限都以 JSON 错误返回
+                span['isolated'] = True
+                return tool_sandbox.call(name, self._target(name), args, options.get('timeout'))
+            try:
+                return self._resolve(name)(**args)
+            except Exception as e:
+                span['error'] = type(e).__name__
+                return f"Error executing tool '{name}': {str(e)}"
 
 # Global instance for easy access
 tool_manager = ToolManager()
 
 # --- Example Tools ---
 
-@tool_manager.register_tool
+# 以下感知工具无副作用且很便宜，在自主思考请求前预取
+@tool_manager.register_tool(prefetch=True)
 def get_current_state() -> str:
     """Get the current internal state of the pet (mood, health, etc)."""
     # This acts as a sensor
     return json.dumps({"hunger": 50, "mood": "neutral"})
 
-@tool_manager.register_tool
+@tool_manager.register_tool(prefetch=True)
 def check_environment() -> str:
     """Check the desktop environment (time, etc)."""
     from datetime import datetime
@@ -89,86 +143,149 @@ def check_environment() -> str:
         "period": "morning" if 6 <= now.hour < 12 else "afternoon" if 12 <= now.hour < 18 else "evening"
     }, ensure_ascii=False)
 
-@tool_manager.register_tool
-def get_weather(city: str = "杭州") -> str:
-    """Get the weather for a specific city."""
-    # Mock weather data
-    return json.dumps({
-        "city": city,
-        "weather": "晴朗",
-        "temperature": "15°C",
-        "humidity": "45%"
-    }, ensure_ascii=False)
+# --- Sensors ---
+# 以下 read_* 函数返回原始字典，既供工具封装为 JSON，也供调度器等模块直接读取
+
+def read_system_health() -> dict:
+    """读取 CPU 使用率、温度和内存（需要 psutil）"""
+    import psutil
+    cpu_usage = psutil.cpu_percent()
+    mem_usage = psutil.virtual_memory().percent
+    
+    # 尝试通过 psutil 获取温度
+    temps = {}
+    if hasattr(psutil, "sensors_temperatures"):
+        sensors = psutil.sensors_temperatures()
+        for name, entries in sensors.items():
+            if entries:
+                temps[name] = f"{entries[0].current}°C"
+    
+    return {
+        "cpu_usage": cpu_usage,
+        "memory_usage": mem_usage,
+        "temperatures": temps,
+        "is_heavy_load": cpu_usage > 75
+    }
+
+def read_battery_status() -> dict:
+    """读取电量和充电状态（需要 psutil）"""
+    import psutil
+    battery = psutil.sensors_battery()
+    if battery is None:
+        return {"has_battery": False}
+    return {
+        "has_battery": True,
+        "percent": battery.percent,
+        "power_plugged": battery.power_plugged,
+        "is_low": battery.percent < 20
+    }
+
+def read_active_window() -> dict:
+    """读取当前活动窗口标题（需要 xorg 环境与 xprop），失败时抛出异常"""
+    import subprocess
+    # 获取活动窗口 ID
+    out = subprocess.check_output(["xprop", "-root", "_NET_ACTIVE_WINDOW"], encoding='utf-8', timeout=2)
+    window_id = out.split()[-1]
+    if window_id == '0x0':
+        return {"active_window": "Desktop or None", "is_coding": False, "is_browsing": False, "is_fullscreen": False}
+        
+    # 获取窗口名称与窗口状态（同一次 xprop 调用）
+    out = subprocess.check_output(
+        ["xprop", "-id", window_id, "WM_NAME", "_NET_WM_NAME", "_NET_WM_STATE"], encoding='utf-8', timeout=2
+    )
+    # 简单解析输出
+    import re
+    titles = re.findall(r'=\s*"(.*?)"', out)
+    title = titles[0] if titles else "Unknown"
+    
+    return {
+        "active_window": title,
+        "is_coding": any(app in title.lower() for app in ["vscode", "code", "terminal", "nvim", "pycharm", "cursor"]),
+        "is_browsing": any(app in title.lower() for app in ["chrome", "firefox", "browser", "bilibili"]),
+        "is_fullscreen": "_NET_WM_STATE_FULLSCREEN" in out
+    }
 
-@tool_manager.register_tool
+def read_idle_seconds():
+    """读取用户键鼠空闲秒数（需要 xprintidle），不可用时返回 None"""
+    import subprocess
+    try:
+        out = subprocess.check_output(["xprintidle"], encoding='utf-8', timeout=2)
+        return int(out.strip()) / 1000.0
+    except Exception:
+        return None
+
+def read_session_locked():
+    """读取当前会话是否锁屏（通过 loginctl），不可用时返回 None"""
+    import os
+    import subprocess
+    session_id = os.environ.get("XDG_SESSION_ID")
+    if not session_id:
+        return None
+    try:
+        out = subprocess.check_output(
+            ["loginctl", "show-session", session_id, "-p", "LockedHint", "--value"],
+            encoding='utf-8', timeout=2
+        )
+        return out.strip() == "yes"
+    except Exception:
+        return None
+
+def read_display_off():
+    """读取显示器是否已被 DPMS 关闭（通过 xset），不可用时返回 None"""
+    import subprocess
+    try:
+        out = subprocess.check_output(["xset", "q"], encoding='utf-8', timeout=2)
+    except Exception:
+        return None
+    if "Monitor is" not in out:
+        return None
+    return "Monitor is Off" in out or "Monitor is in Standby" in out or "Monitor is in Suspend" in out
+
+@tool_manager.register_tool(prefetch=True)
 def get_system_health() -> str:
     """获取 Ubuntu 系统的实时资源状态，包括 CPU 使用率、温度和内存。"""
     try:
-        import psutil
-        cpu_usage = psutil.cpu_percent()
-        mem_usage = psutil.virtual_memory().percent
-        
-        # 尝试通过 psutil 获取温度
-        temps = {}
-        if hasattr(psutil, "sensors_temperatures"):
-            sensors = psutil.sensors_temperatures()
-            for name, entries in sensors.items():
-                if entries:
-                    temps[name] = f"{entries[0].current}°C"
-        
+        health = read_system_health()
         return json.dumps({
-            "cpu_usage": f"{cpu_usage}%",
-            "memory_usage": f"{mem_usage}%",
-            "temperatures": temps,
-            "is_heavy_load": cpu_usage > 75
+            "cpu_usage": f"{health['cpu_usage']}%",
+            "memory_usage": f"{health['memory_usage']}%",
+            "temperatures": health['temperatures'],
+            "is_heavy_load": health['is_heavy_load']
         }, ensure_ascii=False)
     except ImportError:
         return json.dumps({"error": "请安装 psutil 库以开启此功能"}, ensure_ascii=False)
     except Exception as e:
         return json.dumps({"error": str(e)}, ensure_ascii=False)
 
-@tool_manager.register_tool
+@tool_manager.register_tool(prefetch=True)
 def get_battery_status() -> str:
     """获取笔记本电量和充电状态。"""
     try:
-        import psutil
-        battery = psutil.sensors_battery()
-        if battery is None:
+        battery = read_battery_status()
+        if not battery["has_battery"]:
             return json.dumps({"has_battery": False}, ensure_ascii=False)
         
         return json.dumps({
             "has_battery": True,
-            "percent": f"{battery.percent}%",
-            "power_plugged": battery.power_plugged,
-            "is_low": battery.percent < 20
+            "percent": f"{battery['percent']}%",
+            "power_plugged": battery['power_plugged'],
+            "is_low": battery['is_low']
         }, ensure_ascii=False)
     except ImportError:
         return json.dumps({"error": "请安装 psutil 库"}, ensure_ascii=False)
 
-@tool_manager.register_tool
+# xprop 在异常的显示环境下可能卡住，放到沙箱子进程中执行
+@tool_manager.register_tool(isolated=True, timeout=3)
 def get_active_window_linux() -> str:
     """获取 Ubuntu 系统当前活动窗口的标题（需要 xorg 环境）。"""
-    import subprocess
     try:
-        # 获取活动窗口 ID
-        out = subprocess.check_output(["xprop", "-root", "_NET_ACTIVE_WINDOW"], encoding='utf-8')
-        window_id = out.split()[-1]
-        if window_id == '0x0':
-            return json.dumps({"window_title": "Desktop or None"}, ensure_ascii=False)
-            
-        # 获取窗口名称
-        out = subprocess.check_output(["xprop", "-id", window_id, "WM_NAME", "_NET_WM_NAME"], encoding='utf-8')
-        # 简单解析输出
-        import re
-        titles = re.findall(r'=\s*"(.*?)"', out)
-        title = titles[0] if titles else "Unknown"
-        
-        return json.dumps({
-            "active_window": title,
-            "is_coding": any(app in title.lower() for app in ["vscode", "code", "terminal", "nvim", "pycharm", "cursor"]),
-            "is_browsing": any(app in title.lower() for app in ["chrome", "firefox", "browser", "bilibili"])
-        }, ensure_ascii=False)
+        return json.dumps(read_active_window(), ensure_ascii=False)
     except Exception as e:
         return json.dumps({"window_title": "无法获取 (可能在 Wayland 下或缺失由 x11-utils 提供的 xprop)"}, ensure_ascii=False)
 
-
+# --- Plugins ---
+# tools/ 目录与 "digital_pet.tools" 入口点中的插件工具（只读取清单，调用时才导入）
+try:
+    discover_plugins(tool_manager)
+except Exception as e:
+    logger.exception("发现插件工具失败: %s", e)
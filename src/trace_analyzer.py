@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""
+追踪日志分析脚本
+读取 trace.jsonl，输出各阶段的延迟分位数、每轮请求的阶段耗时占比，
+以及预取工具被模型再次调用的比例（用于调整预取集合，见 context_prefetch）。
+
+用法：
+    python -m src.trace_analyzer [trace.jsonl ...]
+"""
+
+import json
+import os
+import sys
+from collections import defaultdict
+from typing import Dict, List
+
+
+def percentile(sorted_values: List[float], p: float) -> float:
+    """线性插值分位数，sorted_values 需已排序"""
+    if not sorted_values:
+        return 0.0
+    k = (len(sorted_values) - 1) * p / 100.0
+    f = int(k)
+    c = min(f + 1, len(sorted_values) - 1)
+    return sorted_values[f] + (sorted_values[c] - sorted_values[f]) * (k - f)
+
+
+def load_events(paths: List[str]) -> List[dict]:
+    events = []
+    for path in paths:
+        with open(path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    events.append(json.loads(line))
+                except ValueError:
+                    continue
+    return events
+
+
+def analyze(events: List[dict]) -> dict:
+    """按阶段统计耗时分布，并按 trace 汇总每轮请求的阶段耗时"""
+    by_phase: Dict[str, List[float]] = defaultdict(list)
+    by_trace: Dict[str, Dict[str, float]] = defaultdict(lambda: defaultdict(float))
+    # 工具名 -> [预取次数, 模型再次调用次数]
+    prefetch: Dict[str, List[int]] = defaultdict(lambda: [0, 0])
+    for event in events:
+        if event['phase'] == 'prefetch':
+            for tool in event.get('tools', []):
+                prefetch[tool][0] += 1
+        elif event['phase'] == 'prefetch_redundant':
+            prefetch[event.get('tool')][1] += 1
+        duration = event.get('dur_ms')
+        if duration is None:
+            continue
+        by_phase[event['phase']].append(duration)
+        if event.get('trace'):
+            by_trace[event['trace']][event['phase']] += duration
+
+    phases = {}
+    for phase, values in by_phase.items():
+        values.sort()
+        phases[phase] = {
+            'count': len(values),
+            'p50': percentile(values, 50),
+            'p90': percentile(values, 90),
+            'p99': percentile(values, 99),
+            'max': values[-1],
+        }
+
+    # 每轮请求中各阶段占整轮耗时的平均比例
+    shares: Dict[str, List[float]] = defaultdict(list)
+    for phases_ms in by_trace.values():
+        total = phases_ms.get('turn')
+        if not total:
+            continue
+        for phase, duration in phases_ms.items():
+            if phase != 'turn':
+                shares[phase].append(duration / total)
+    breakdown = {phase: sum(v) / len(v) for phase, v in shares.items()}
+
+    return {'phases': phases, 'breakdown': breakdown, 'turns': len(by_phase.get('turn', [])),
+            'prefetch': dict(prefetch)}
+
+
+def print_report(report: dict):
+    print(f"共 {report['turns']} 轮请求\n")
+    print(f"{'phase':<16}{'count':>8}{'p50':>10}{'p90':>10}{'p99':>10}{'max':>10}  (ms)")
+    for phase, stats in sorted(report['phases'].items(), key=lambda item: -item[1]['p50']):
+        print(f"{phase:<16}{stats['count']:>8}{stats['p50']:>10.1f}{stats['p90']:>10.1f}"
+              f"{stats['p99']:>10.1f}{stats['max']:>10.1f}")
+    if report['breakdown']:
+        print("\n每轮耗时占比（turn 内平均）：")
+        for phase, share in sorted(report['breakdown'].items(), key=lambda item: -item[1]):
+            print(f"  {phase:<16}{share * 100:>6.1f}%")
+    if report.get('prefetch'):
+        print("\n预取工具被模型再次调用的比例（比例高说明预取没有省下往返）：")
+        for tool, (prefetched, redundant) in sorted(report['prefetch'].items()):
+            ratio = redundant / prefetched if prefetched else 0.0
+            print(f"  {tool:<28}{redundant:>6} / {prefetched:<6}{ratio * 100:>6.1f}%")
+
+
+def main():
+    paths = sys.argv[1:]
+    if not paths:
+        project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        paths = [os.path.join(project_root, "trace.jsonl")]
+    print_report(analyze(load_events(paths)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,148 @@
+"""
+结构化追踪模块
+以 JSONL 记录每轮 LLM 请求的追踪事件（构建请求、每次 HTTP 尝试、每次工具调用、解析、UI 应用），
+同一轮的事件共享 trace_id，时间戳与耗时均基于单调时钟。
+写入在后台线程完成，关闭时 span 只是一个空操作。
+trace.jsonl 与 pet.log 一样按大小或时间轮转，旧文件压缩为 .gz，磁盘占用有上限。
+"""
+
+import json
+import logging
+import os
+import queue
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+from .logger import get_logger, CompressingRotatingFileHandler
+
+logger = get_logger(__name__)
+
+DEFAULT_TRACING = {
+    "enabled": False,
+    "max_bytes": 10 * 1024 * 1024,  # 单个追踪文件上限
+    "backup_count": 3,              # 保留的压缩归档数量
+    "max_age_hours": 24,            # 追踪文件最长使用时间，超过后轮转（0 表示只按大小轮转）
+}
+
+
+def _trace_line_time(line: str):
+    """追踪事件的 wall 时间戳，无法解析时返回 None"""
+    try:
+        return float(json.loads(line)['wall'])
+    except (ValueError, KeyError, TypeError):
+        return None
+
+
+class Tracer:
+    """低开销的 JSONL 追踪事件写入器"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.enabled = False
+        self.settings = dict(DEFAULT_TRACING)
+        self._queue = queue.SimpleQueue()
+        self._thread = None
+        self._local = threading.local()
+        self._handler = None   # 写线程使用的轮转文件处理器（路径或轮转参数变化时重建）
+        self._handler_lock = threading.Lock()
+
+    def configure(self, enabled: bool, path: str = None, settings: dict = None):
+        """启用或关闭追踪；启用时启动后台写线程。settings 为轮转参数（未填写的项使用 DEFAULT_TRACING）"""
+        options = {**DEFAULT_TRACING, **(settings or {})}
+        with self._handler_lock:
+            if (path and path != self.path) or options != self.settings:
+                if self._handler is not None:
+                    self._handler.close()
+                    self._handler = None
+            if path:
+                self.path = path
+            self.settings = options
+        self.enabled = bool(enabled)
+        if self.enabled and self._thread is None:
+            self._thread = threading.Thread(target=self._writer, name="TraceWriter", daemon=True)
+            self._thread.start()
+
+    @staticmethod
+    def new_trace_id() -> str:
+        return uuid.uuid4().hex[:16]
+
+    @property
+    def current_trace(self):
+        """当前线程正在处理的 trace_id"""
+        return getattr(self._local, 'trace_id', None)
+
+    @current_trace.setter
+    def current_trace(self, trace_id):
+        self._local.trace_id = trace_id
+
+    def emit(self, trace_id: str, phase: str, start: float = None, duration: float = None, **fields):
+        """记录一条事件；start 与 duration 单位为秒（单调时钟）"""
+        if not self.enabled:
+            return
+        event = {
+            'trace': trace_id or self.current_trace,
+            'phase': phase,
+            'ts': round(start if start is not None else time.monotonic(), 6),
+            'wall': round(time.time(), 3),
+        }
+        if duration is not None:
+            event['dur_ms'] = round(duration * 1000, 3)
+        if fields:
+            event.update(fields)
+        self._queue.put(event)
+
+    @contextmanager
+    def span(self, phase: str, trace_id: str = None, **fields):
+        """记录一段操作的耗时；异常会被记录后继续抛出"""
+        if not self.enabled:
+            yield fields
+            return
+        start = time.monotonic()
+        try:
+            yield fields
+        except Exception as e:
+            fields['error'] = type(e).__name__
+            raise
+        finally:
+            self.emit(trace_id, phase, start, time.monotonic() - start, **fields)
+
+    def queue_depth(self) -> int:
+        return self._queue.qsize()
+
+    def _file_handler(self) -> CompressingRotatingFileHandler:
+        """当前路径与轮转参数对应的文件处理器（调用方持有 _handler_lock）"""
+        if self._handler is None:
+            options = self.settings
+            self._handler = CompressingRotatingFileHandler(
+                self.path,
+                max_bytes=options["max_bytes"],
+                backup_count=options["backup_count"],
+                max_age_seconds=options["max_age_hours"] * 3600,
+                line_time=_trace_line_time,
+            )
+        return self._handler
+
+    def _writer(self):
+        """后台线程：批量取出事件，作为一条记录交给轮转处理器追加写入（轮转只发生在批次之间）"""
+        while True:
+            batch = [self._queue.get()]
+            while True:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            text = '\n'.join(json.dumps(event, ensure_ascii=False, separators=(',', ':')) for event in batch)
+            with self._handler_lock:
+                # 写入失败由处理器的 handleError 报告（与 pet.log 相同）
+                self._file_handler().emit(logging.makeLogRecord({'msg': text}))
+
+
+def _default_trace_path() -> str:
+    project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    return os.path.join(project_root, "trace.jsonl")
+
+
+# Global instance for easy access
+tracer = Tracer(_default_trace_path())
@@ -0,0 +1,108 @@
+"""
+触发规则模块
+订阅事件总线，对事件进行过滤、去抖、限流和优先级排序，
+决定是否立即开始一轮自主思考，并把触发事件交给本轮请求作为上下文。
+"""
+
+import time
+from dataclasses import dataclass
+from typing import Callable, Dict, Optional
+
+from PyQt6.QtCore import QObject, QTimer, pyqtSignal
+
+from .event_bus import (
+    event_bus, PetEvent, BATTERY_LOW, WINDOW_FOCUS, TIME_PERIOD,
+    CPU_SPIKE, USER_RETURNED
+)
+
+
+@dataclass
+class TriggerRule:
+    """单条触发规则"""
+    priority: int                   # 同一去抖窗口内优先级高者胜出
+    cooldown: float                 # 同类事件两次触发的最短间隔（秒）
+    accept: Optional[Callable[[PetEvent], bool]] = None  # 额外过滤条件
+
+
+def _focus_category_changed(event: PetEvent) -> bool:
+    """只有切换到 IDE 或浏览器（且类别发生变化）时才值得说话"""
+    category = event.payload.get('category')
+    return category in ("coding", "browsing") and category != event.payload.get('previous_category')
+
+
+DEFAULT_RULES: Dict[str, TriggerRule] = {
+    BATTERY_LOW: TriggerRule(priority=3, cooldown=1800),
+    USER_RETURNED: TriggerRule(priority=2, cooldown=600),
+    WINDOW_FOCUS: TriggerRule(priority=1, cooldown=600, accept=_focus_category_changed),
+    TIME_PERIOD: TriggerRule(priority=1, cooldown=3600),
+    CPU_SPIKE: TriggerRule(priority=1, cooldown=1800),
+}
+
+
+class TriggerRules(QObject):
+    """事件 -> 思考触发的规则层"""
+
+    # 决定触发思考时发出，参数为胜出的事件
+    brain_trigger = pyqtSignal(object)
+
+    def __init__(self, bus=None, debounce_ms: int = 5000, min_gap: float = 90,
+                 gate: Callable[[PetEvent], bool] = None, parent=None):
+        super().__init__(parent)
+        self.bus = bus or event_bus
+        self.rules = dict(DEFAULT_RULES)
+        self.min_gap = min_gap
+        # gate 返回 False 时丢弃事件（例如用户不在或系统高负载）
+        self.gate = gate
+
+        self._pending: Dict[str, PetEvent] = {}
+        self._last_fired: Dict[str, float] = {}
+        self._last_turn = 0.0
+
+        # 去抖：窗口内的同类事件只保留最新一条，窗口结束后统一评估
+        self._debounce_timer = QTimer(self)
+        self._debounce_timer.setSingleShot(True)
+        self._debounce_timer.setInterval(debounce_ms)
+        self._debounce_timer.timeout.connect(self._flush)
+
+        self.bus.subscribe("*", self._on_event)
+
+    def stop(self):
+        """取消订阅（宠物关闭时调用），丢弃去抖中的事件"""
+        self.bus.unsubscribe("*", self._on_event)
+        self._debounce_timer.stop()
+        self._pending.clear()
+
+    def _on_event(self, event: PetEvent):
+        rule = self.rules.get(event.kind)
+        if rule is None:
+            return
+        if rule.accept and not rule.accept(event):
+            return
+        event.priority = rule.priority
+        self._pending[event.kind] = event
+        if not self._debounce_timer.isActive():
+            self._debounce_timer.start()
+
+    def _flush(self):
+        """在去抖窗口结束时选出优先级最高且未处于冷却期的事件"""
+        now = time.monotonic()
+        pending, self._pending = self._pending, {}
+        if now - self._last_turn < self.min_gap:
+            return
+
+        candidates = [
+            e for e in pending.values()
+            if now - self._last_fired.get(e.kind, -1e9) >= self.rules[e.kind].cooldown
+            and (self.gate is None or self.gate(e))
+        ]
+        if not candidates:
+            return
+
+        winner = max(candidates, key=lambda e: (e.priority, e.timestamp))
+        self._last_fired[winner.kind] = now
+        self._last_turn = now
+        self.brain_trigger.emit(winner)
+
+    def note_turn_started(self):
+        """记录一次思考的开始（包括定时和手动），用于全局限流"""
+        self._last_turn = time.monotonic()
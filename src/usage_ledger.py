@@ -0,0 +1,173 @@
+"""
+Token 用量账本模块
+记录每轮 LLM 请求的 token 用量、耗时、迭代次数与工具调用次数，
+以紧凑的 JSONL 追加写入本地文件，并维护最近 24 小时的滚动聚合，
+用于执行每小时/每天的 token 预算。
+"""
+
+import json
+import os
+import threading
+import time
+from collections import deque
+from typing import Dict, Tuple
+
+from .logger import get_logger
+
+logger = get_logger(__name__)
+
+HOUR = 3600
+DAY = 86400
+
+# 启动时只回读文件末尾这么多字节来恢复滚动窗口
+_TAIL_BYTES = 256 * 1024
+# 超过该大小时轮转为 .1 文件，避免账本无限增长
+_MAX_BYTES = 5 * 1024 * 1024
+
+
+def extract_usage(result: dict) -> Tuple[int, int, int]:
+    """从响应的 usage 字段中提取 (prompt, completion, cached) token 数"""
+    usage = result.get('usage') or {}
+    prompt_tokens = int(usage.get('prompt_tokens') or 0)
+    completion_tokens = int(usage.get('completion_tokens') or 0)
+    # OpenAI 兼容格式放在 prompt_tokens_details，DeepSeek 使用 prompt_cache_hit_tokens
+    details = usage.get('prompt_tokens_details') or {}
+    cached_tokens = int(details.get('cached_tokens') or usage.get('prompt_cache_hit_tokens') or 0)
+    return prompt_tokens, completion_tokens, cached_tokens
+
+
+class UsageLedger:
+    """追加写入的用量账本，附带最近 24 小时的内存滚动窗口"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._recent = deque()  # 最近 24 小时的记录（按时间升序）
+        self._loaded = False
+
+    def _load(self):
+        """从账本末尾恢复最近 24 小时的记录"""
+        self._loaded = True
+        if not os.path.exists(self.path):
+            return
+        cutoff = time.time() - DAY
+        try:
+            with open(self.path, 'rb') as f:
+                f.seek(0, os.SEEK_END)
+                size = f.tell()
+                f.seek(max(0, size - _TAIL_BYTES))
+                lines = f.read().splitlines()
+            if size > _TAIL_BYTES:
+                lines = lines[1:]  # 第一行可能被截断
+            for line in lines:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue
+                if entry.get('t', 0) >= cutoff:
+                    self._recent.append(entry)
+        except OSError as e:
+            logger.warning("读取用量账本失败: %s", e)
+
+    def _prune(self, now: float):
+        while self._recent and self._recent[0]['t'] < now - DAY:
+            self._recent.popleft()
+
+    def record(self, provider: str, trigger: str, prompt_tokens: int, completion_tokens: int,
+               cached_tokens: int, latency_ms: int, iterations: int, tool_calls: int, ok: bool):
+        """记录一轮请求的用量（可在工作线程中调用）"""
+        entry = {
+            't': round(time.time(), 1),
+            'p': provider,
+            'g': trigger,
+            'pt': prompt_tokens,
+            'ct': completion_tokens,
+            'ca': cached_tokens,
+            'ms': latency_ms,
+            'it': iterations,
+            'tc': tool_calls,
+            'ok': 1 if ok else 0
+        }
+        line = json.dumps(entry, separators=(',', ':'), ensure_ascii=False) + '\n'
+        with self._lock:
+            if not self._loaded:
+                self._load()
+            self._recent.append(entry)
+            self._prune(entry['t'])
+            try:
+                if os.path.exists(self.path) and os.path.getsize(self.path) > _MAX_BYTES:
+                    os.replace(self.path, self.path + '.1')
+                with open(self.path, 'a', encoding='utf-8') as f:
+                    f.write(line)
+            except OSError as e:
+                logger.warning("写入用量账本失败: %s", e)
+
+    def tokens_since(self, seconds: float) -> int:
+        """统计最近 seconds 秒内消耗的 token 总数"""
+        now = time.time()
+        with self._lock:
+            if not self._loaded:
+                self._load()
+            self._prune(now)
+            return sum(e['pt'] + e['ct'] for e in self._recent if e['t'] >= now - seconds)
+
+    def aggregates(self, seconds: float = HOUR) -> Dict[Tuple[str, str], dict]:
+        """按 (provider, trigger) 分组的滚动聚合"""
+        now = time.time()
+        groups: Dict[Tuple[str, str], dict] = {}
+        with self._lock:
+            if not self._loaded:
+                self._load()
+            self._prune(now)
+            for e in self._recent:
+                if e['t'] < now - seconds:
+                    continue
+                g = groups.setdefault((e['p'], e['g']), {
+                    'turns': 0, 'prompt_tokens': 0, 'completion_tokens': 0,
+                    'cached_tokens': 0, 'tool_calls': 0, 'iterations': 0,
+                    'errors': 0, 'latency_ms': 0
+                })
+                g['turns'] += 1
+                g['prompt_tokens'] += e['pt']
+                g['completion_tokens'] += e['ct']
+                g['cached_tokens'] += e['ca']
+                g['tool_calls'] += e['tc']
+                g['iterations'] += e['it']
+                g['errors'] += 0 if e['ok'] else 1
+                g['latency_ms'] += e['ms']
+        for g in groups.values():
+            g['avg_latency_ms'] = g['latency_ms'] // g['turns']
+        return groups
+
+    def budget_delay(self, hourly: int = 0, daily: int = 0) -> float:
+        """
+        超出预算时，返回需要等待多少秒才能回到预算以内；未超出返回 0。
+        预算为 0 表示不限制。
+        """
+        now = time.time()
+        delay = 0.0
+        with self._lock:
+            if not self._loaded:
+                self._load()
+            self._prune(now)
+            for window, budget in ((HOUR, hourly), (DAY, daily)):
+                if not budget or budget <= 0:
+                    continue
+                entries = [e for e in self._recent if e['t'] >= now - window]
+                used = sum(e['pt'] + e['ct'] for e in entries)
+                # 从最早的记录开始滑出窗口，直到用量回到预算以内
+                for e in entries:
+                    if used < budget:
+                        break
+                    used -= e['pt'] + e['ct']
+                    delay = max(delay, e['t'] + window - now)
+        return delay
+
+
+def _default_ledger_path() -> str:
+    project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    return os.path.join(project_root, "usage.jsonl")
+
+
+# Global instance for easy access
+usage_ledger = UsageLedger(_default_ledger_path())
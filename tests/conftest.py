@@ -0,0 +1,7 @@
+import os
+import sys
+
+# 与 src/main.py 一样把项目根目录加入导入路径，测试中使用 `from src.xxx import ...`
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
@@ -0,0 +1,117 @@
+"""animation_fsm 的转移测试（不依赖 PyQt）"""
+
+from src.animation_fsm import (
+    AnimationStateMachine, ActionSpec, DEFAULT_SPECS, IGNORE, QUEUE, SWITCH, LOOP_ONCE
+)
+
+FRAMES = 3
+
+
+def make_fsm(extra=None):
+    """内置动作 + 额外动作，每个动作 FRAMES 帧；返回状态机与进入动作的记录"""
+    entered = []
+    fsm = AnimationStateMachine(entered=entered.append)
+    specs = {name: ActionSpec(**options) for name, options in DEFAULT_SPECS.items()}
+    specs.update(extra or {})
+    for name, spec in specs.items():
+        fsm.add_action(name, spec, FRAMES)
+    return fsm, entered
+
+
+def play_loop(fsm):
+    """播放完当前动作的一轮"""
+    for _ in range(FRAMES):
+        fsm.advance()
+
+
+def test_once_action_returns_to_resting():
+    fsm, entered = make_fsm()
+    assert fsm.request("sleep")
+    assert fsm.request("eat")
+    assert fsm.resting == "sleep"
+
+    play_loop(fsm)
+    assert fsm.current == "eat"  # 默认播放 2 次
+    play_loop(fsm)
+    assert fsm.current == "sleep"
+    assert entered == ["sleep", "eat", "sleep"]
+
+
+def test_once_action_goes_to_next():
+    fsm, _ = make_fsm({"wave": ActionSpec(loop=LOOP_ONCE, loops=1, next="love")})
+    fsm.request("wave")
+    play_loop(fsm)
+    assert fsm.current == "love"
+
+
+def test_non_interruptible_action_queues_requests():
+    fsm, entered = make_fsm({
+        "yawn": ActionSpec(loop=LOOP_ONCE, loops=1, interruptible=False, priority=1),
+        "alarm": ActionSpec(loop=LOOP_ONCE, loops=1, priority=2),
+    })
+    fsm.request("yawn")
+    assert not fsm.request("left")
+    assert not fsm.request("left")  # 与队尾相同的请求不重复排队
+    assert fsm.current == "yawn"
+
+    play_loop(fsm)
+    assert fsm.current == "left"
+    assert entered == ["yawn", "left"]
+
+    # 优先级更高的请求直接打断
+    fsm.request("yawn")
+    assert fsm.request("alarm")
+    assert fsm.current == "alarm"
+
+
+def test_queued_request_plays_transition_first():
+    fsm, _ = make_fsm({
+        "sleep": ActionSpec(loop="repeat", interruptible=False, priority=1, transitions={"standby": "wake"}),
+        "wake": ActionSpec(loop=LOOP_ONCE, loops=1),
+    })
+    fsm.request("sleep")
+    assert not fsm.request("standby")
+    play_loop(fsm)
+    assert fsm.current == "wake"
+    play_loop(fsm)
+    assert fsm.current == "standby"
+
+
+def test_mention_does_not_restart():
+    fsm, entered = make_fsm()
+    assert fsm.request("mention")
+    fsm.advance()
+    assert not fsm.request("mention")
+    assert fsm.frame == 1
+    assert entered == ["mention"]
+    # mention 不是常驻动作
+    assert fsm.resting == "standby"
+
+
+def test_repeat_action_restarts_by_default():
+    fsm, entered = make_fsm()
+    fsm.request("left")
+    fsm.advance()
+    assert fsm.request("left")
+    assert fsm.frame == 0
+    assert entered == ["left", "left"]
+
+
+def test_incremental_table_matches_full_compile():
+    # 过渡动作与 next 目标晚于引用它们的动作注册
+    fsm, _ = make_fsm({
+        "sleep": ActionSpec(loop="repeat", interruptible=False, transitions={"standby": "wake"}),
+        "wave": ActionSpec(loop=LOOP_ONCE, next="hop"),
+    })
+    fsm.add_action("wake", ActionSpec(loop=LOOP_ONCE, loops=1), FRAMES)
+    fsm.add_action("hop", ActionSpec(loop=LOOP_ONCE), FRAMES)
+    fsm.add_action("eat", ActionSpec(loop=LOOP_ONCE, interruptible=False, priority=3), FRAMES)
+    table, finish = dict(fsm._table), dict(fsm._finish)
+
+    fsm.compile()
+    assert table == fsm._table
+    assert finish == fsm._finish
+    assert fsm._table[("sleep", "standby")] == (QUEUE, ("wake", "standby"))
+    assert fsm._table[("mention", "mention")] == (IGNORE, ())
+    assert fsm._table[("standby", "eat")] == (SWITCH, ("eat",))
+    assert fsm._finish["wave"] == "hop"
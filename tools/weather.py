@@ -0,0 +1,20 @@
+"""
+天气插件示例
+插件工具使用 @plugin_tool 标记，启动时只读取函数签名与文档，第一次调用时才导入本模块。
+"""
+
+import json
+
+from src.tool_plugins import plugin_tool
+
+
+@plugin_tool
+def get_weather(city: str = "杭州") -> str:
+    """Get the weather for a specific city."""
+    # Mock weather data
+    return json.dumps({
+        "city": city,
+        "weather": "晴朗",
+        "temperature": "15°C",
+        "humidity": "45%"
+    }, ensure_ascii=False)